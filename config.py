@@ -119,9 +119,20 @@ HOMEWORK_STATIC_DIR = os.path.join(RAILGUN_ROOT, 'hw/.static')
 STORE_UPLOAD = True
 
 # If STORE_HOMEWORK is True, then UPLOAD_STORE_DIR determines the directory
-# to store student uploaded files
+# to store student uploaded files.  The files are stored in BLOB_STORE_DIR,
+# and indexed by the submission records in database
 UPLOAD_STORE_DIR = os.path.join(RAILGUN_ROOT, 'upload')
 
+# BLOB_STORE_DIR stores the uploaded archive files named by their content
+# digests, which are read by the runner instead of passing the contents
+# through the run queue
+BLOB_STORE_DIR = os.path.join(UPLOAD_STORE_DIR, 'blobs')
+
+# UPLOAD_COMPRESSION determines how the new files in BLOB_STORE_DIR are
+# compressed: None, 'zlib' or 'zstd' (requires the zstandard package, or
+# falls back to 'zlib').  The files are not compressed by default
+UPLOAD_COMPRESSION = None
+
 # LOCKED_HOMEWORKS define the list of homeworks that cannot be submitted
 # NOTE: if '*' is in LOCKED_HOMEWORKDS, then all the homeworks will be locked
 LOCKED_HOMEWORKS = ()
@@ -137,6 +148,11 @@ IGNORE_HANDINS_OF_REMOVED_HW = True
 # in the score sheet.
 ADMIN_SCORE_IN_REPORT = False
 
+# REGRADE_CHUNK_SIZE controls how many submissions of a bulk regrade job
+# will be put into the runner queue at one time, so that the regrade will
+# not swamp the runner queue
+REGRADE_CHUNK_SIZE = 50
+
 # TEMPORARY_DIR stores the temporary directory for runner
 TEMPORARY_DIR = os.path.join(RAILGUN_ROOT, 'tmp')
 
@@ -177,6 +193,112 @@ RUNNER_DEFAULT_TIMEOUT = 3
 # same time
 RUNNER_CONCURRENTY = 1
 
+# RUNNER_QUEUES lists the run queues served by `python runner.py supervise`,
+# each by a separate worker
+RUNNER_QUEUES = ('default', 'online')
+
+# RUNNER_MIN_CONCURRENCY and RUNNER_MAX_CONCURRENCY control the range of
+# runner processes of each worker started by `python runner.py supervise`.
+# If RUNNER_MAX_CONCURRENCY is None, the number of CPUs is used.  Both are
+# further limited by the system accounts in the credential server
+RUNNER_MIN_CONCURRENCY = 1
+RUNNER_MAX_CONCURRENCY = None
+
+# RUNNER_AUTOSCALE_MAX_LOAD stops the supervised workers from growing while
+# the 1-minute load average per CPU is above this value
+RUNNER_AUTOSCALE_MAX_LOAD = 1.5
+
+# RUNNER_RESTART_MAX_BACKOFF controls the maximum seconds to wait before
+# restarting a crashed worker started by `python runner.py supervise`
+RUNNER_RESTART_MAX_BACKOFF = 60
+
+# RUNNER_METRICS_PORT is the port of the /metrics endpoint served by
+# `python runner.py supervise`, which exports the runner metrics in the
+# Prometheus text format, or None to disable the endpoint
+RUNNER_METRICS_PORT = 9540
+
+# RUNNER_METRICS_FLUSH_INTERVAL is the seconds between two flushes of the
+# metrics of each runner process into the database shared by all the
+# runner processes on this machine
+RUNNER_METRICS_FLUSH_INTERVAL = 10
+
+# RUNNER_WARM_POOL determines whether Python submissions are forked from
+# a warm zygote process of the homework, instead of starting a new
+# SafeRunner for each submission
+RUNNER_WARM_POOL = False
+
+# RUNNER_WARM_POOL_STARTUP controls how long (in seconds) to wait for a
+# zygote process to start, before falling back to the cold SafeRunner
+RUNNER_WARM_POOL_STARTUP = 10
+
+# RUNNER_WALL_CPU_RATIO controls the wall-clock timeout of a submission,
+# as a multiple of its CPU time limit, if the homework only declares the
+# "cputime" limit but not the "timeout"
+RUNNER_WALL_CPU_RATIO = 3
+
+# RUNNER_CODE_TEMPLATE determines whether the homework code files are
+# linked from a shared read-only template, instead of being copied for
+# each submission (disabled by default)
+RUNNER_CODE_TEMPLATE = False
+
+# RUNNER_DEFERRED_CLEANUP determines whether the working directories of
+# submissions are moved into a trash, and removed by a background thread
+# at low I/O priority, so that the runner need not wait for the removal
+# (disabled by default)
+RUNNER_DEFERRED_CLEANUP = False
+
+# RUNNER_OUTPUT_HEAD and RUNNER_OUTPUT_TAIL control how many bytes at the
+# beginning and at the end of stdout and stderr will be kept for each
+# submission.  The output between them will be truncated.
+RUNNER_OUTPUT_HEAD = 32 * 1024
+RUNNER_OUTPUT_TAIL = 16 * 1024
+
+# RUNNER_API_CONNECT_TIMEOUT and RUNNER_API_READ_TIMEOUT control the
+# timeouts (in seconds) of the requests from runner to website api
+RUNNER_API_CONNECT_TIMEOUT = 5
+RUNNER_API_READ_TIMEOUT = 30
+
+# RUNNER_API_RETRIES controls how many times a failed request to website
+# api will be retried, waiting RUNNER_API_BACKOFF * (2 ** n) seconds
+# before the n-th retry
+RUNNER_API_RETRIES = 3
+RUNNER_API_BACKOFF = 0.5
+
+# RUNNER_API_OUTBOX determines whether the runner stores the messages to
+# website api in a durable local outbox and sends them in background,
+# so that a slow website will not block the runner.  The outbox is a
+# SQLite database under TEMPORARY_DIR, which is disabled by default
+RUNNER_API_OUTBOX = False
+
+# RUNNER_OUTBOX_BATCH controls how many messages in the outbox will be
+# sent in one request, and RUNNER_OUTBOX_MAX_BACKOFF controls the maximum
+# seconds to wait before resending the failed messages
+RUNNER_OUTBOX_BATCH = 50
+RUNNER_OUTBOX_MAX_BACKOFF = 60
+
+# RUNNER_BLOB_STORE determines how the runner reads the uploaded archive
+# files: 'file' to read from BLOB_STORE_DIR shared with the website, or
+# 'http' to fetch them via website api
+RUNNER_BLOB_STORE = 'file'
+
+# RUNNER_RESULT_CACHE_SIZE controls how many grading results of the
+# homeworks marked as deterministic in code.xml will be memoized by the
+# runner (the least recently used ones are evicted), 0 to disable.  The
+# cache is a SQLite database under TEMPORARY_DIR, which is disabled by
+# default
+RUNNER_RESULT_CACHE_SIZE = 0
+
+# RUNNER_SCHEDULER determines whether the submissions are queued in the
+# fair scheduler, so that the reruns and the regrades will not starve the
+# fresh submissions, and the users are served in round-robin order.  It
+# requires Redis as the Celery broker, so it is disabled by default
+RUNNER_SCHEDULER = False
+
+# RUNNER_SCHEDULER_DEADLINE_BOOST controls the maximum head start (in
+# seconds) of a submission in the fair scheduler, which is given to the
+# submissions within such seconds before the next deadline of homework
+RUNNER_SCHEDULER_DEADLINE_BOOST = 3600
+
 # MAX_SUBMISSION_SIZE controls the maximum data size allowed for a student
 # to submit (in bytes)
 MAX_SUBMISSION_SIZE = 256 * 1024
@@ -185,6 +307,17 @@ MAX_SUBMISSION_SIZE = 256 * 1024
 # a student to submit
 MAX_SUBMISSION_FILE_COUNT = 100
 
+# MAX_SUBMISSION_FILE_SIZE and MAX_SUBMISSION_TOTAL_SIZE control the maximum
+# uncompressed size (in bytes) of a single file and of all the files in a
+# submitted archive
+MAX_SUBMISSION_FILE_SIZE = 4 * 1024 * 1024
+MAX_SUBMISSION_TOTAL_SIZE = 16 * 1024 * 1024
+
+# MAX_SUBMISSION_COMPRESS_RATIO controls the maximum ratio of uncompressed
+# size to compressed size of a submitted archive (checked for the files of
+# at least 1M bytes), so that an archive bomb will be rejected
+MAX_SUBMISSION_COMPRESS_RATIO = 100
+
 # MAX_USER_PENDING controls the maximum submissions of a single user that
 # is running or pending for a single homework.
 MAX_USER_PENDING_PER_HW = 1
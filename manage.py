@@ -62,6 +62,28 @@ class App(object):
         task.logflush()
         sys.stdout.write(io.getvalue())
 
+    def migrate_uploads(self, argv):
+        """Move legacy uploaded files into the upload store."""
+        from railgun.website.codelang import languages
+        from railgun.website.models import Handin
+
+        count = 0
+        handins = Handin.query.filter(Handin.upload_digest.is_(None)).all()
+        for handin in handins:
+            if languages[handin.lang].migrate_legacy(handin):
+                count += 1
+        print('%d submission(s) migrated.' % count)
+
+    def upgrade_db(self, argv):
+        """Print (or --apply) SQL to add the new columns to database."""
+        from railgun.maintain.dbschema import DbUpgradeTask
+
+        io = StringIO()
+        task = DbUpgradeTask(logstream=io)
+        task.execute(apply='--apply' in argv)
+        task.logflush()
+        sys.stdout.write(io.getvalue())
+
     def runner_perm(self, argv):
         """Check the permissions of runner host."""
         from railgun.maintain.permissions import RunnerPermissionCheckTask
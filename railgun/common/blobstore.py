@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/common/blobstore.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module provides the content-addressed stores of uploaded files.
+
+The website writes each uploaded file into a :class:`FileBlobStore` once,
+and only passes the SHA-256 digest of the content to the runner queue.
+The runner then reads the file from the same directory if it shares the
+file system with the website, or fetches the file via website api through
+a :class:`HttpBlobStore`.
+
+Since the students often submit the same archive again and again, the same
+content is stored only once.  The blobs may also be compressed by `zlib`, or
+by `zstd` if the :mod:`zstandard` package is installed.
+"""
+
+import os
+import re
+import zlib
+import uuid
+import errno
+import hashlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#: Read and write blobs in chunks of such bytes.
+CHUNK_SIZE = 65536
+
+#: The file name suffixes of the blobs in each compression format.
+COMPRESSION_SUFFIX = {None: '', 'zlib': '.z', 'zstd': '.zst'}
+
+#: Keep the compressed blob only if it saves at least such ratio of space,
+#: so that the already compressed archives are stored as-is.
+MIN_COMPRESSION_SAVING = 0.1
+
+_DIGEST_PATTERN = re.compile('^[0-9a-f]{64}$')
+
+
+class BlobNotFound(KeyError):
+    """Indicate that the requested blob does not exist in the store."""
+    pass
+
+
+def _make_compressor(compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compressobj()
+    return zlib.compressobj()
+
+
+def _make_decompressor(compression):
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj()
+
+
+def _write_private(cache_dir, digest, fobj):
+    # Write the content of `fobj` into a new file in `cache_dir`, which is
+    # private to the caller, and return its path and SHA-256 hex digest.
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir, 0700)
+        except OSError, ex:
+            if ex.errno != errno.EEXIST:
+                raise
+    fpath = os.path.join(cache_dir,
+                         '%s.%s' % (digest, uuid.uuid4().get_hex()))
+    h = hashlib.sha256()
+    try:
+        with open(fpath, 'wb') as f:
+            while True:
+                buf = fobj.read(CHUNK_SIZE)
+                if not buf:
+                    break
+                h.update(buf)
+                f.write(buf)
+    except Exception:
+        if os.path.isfile(fpath):
+            os.remove(fpath)
+        raise
+    return fpath, h.hexdigest()
+
+
+def _remove_private(cache_dir, fpath):
+    # Remove the file written by `_write_private`, but never the others.
+    if os.path.dirname(fpath) != cache_dir:
+        return
+    try:
+        os.remove(fpath)
+    except OSError, ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+class DecompressFile(object):
+    """File-like object to read the decompressed content of a file.
+
+    :param fobj: The compressed file object.
+    :param compression: The compression format, "zlib" or "zstd".
+    :type compression: :class:`str`
+    """
+
+    def __init__(self, fobj, compression):
+        self.fobj = fobj
+        self._decompressor = _make_decompressor(compression)
+        self._buf = ''
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buf) < size):
+            chunk = self.fobj.read(CHUNK_SIZE)
+            if chunk:
+                self._buf += self._decompressor.decompress(chunk)
+            else:
+                self._eof = True
+                if hasattr(self._decompressor, 'flush'):
+                    self._buf += self._decompressor.flush()
+        if size < 0:
+            ret, self._buf = self._buf, ''
+        else:
+            ret, self._buf = self._buf[:size], self._buf[size:]
+        return ret
+
+    def close(self):
+        self.fobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+
+class BlobStore(object):
+    """The basic interface of blob stores."""
+
+    def put(self, fobj):
+        """Store the content of a file object.
+
+        :param fobj: The file object to be read until EOF.
+        :return: A :class:`tuple` of (digest, size).
+        """
+        raise NotImplementedError()
+
+    def fetch(self, digest):
+        """Get the local file path of a blob.
+
+        The file may be a copy private to the caller, since the runner
+        processes on the same machine may fetch and release the same blob
+        at the same time.  It must be freed by :meth:`release`.
+
+        :param digest: The SHA-256 hex digest of the blob.
+        :type digest: :class:`str`
+        :return: The file path, which should not be modified.
+        :raises: :class:`BlobNotFound` if the blob does not exist.
+        """
+        raise NotImplementedError()
+
+    def release(self, fpath):
+        """Notify the store that the local file returned by :meth:`fetch`
+        will no longer be used, so that the private copy can be freed.
+
+        :param fpath: The file path returned by :meth:`fetch`.
+        :type fpath: :class:`str`
+        """
+        pass
+
+    def open(self, digest):
+        """Open a blob for reading.
+
+        :param digest: The SHA-256 hex digest of the blob.
+        :type digest: :class:`str`
+        :return: A file object.
+        :raises: :class:`BlobNotFound` if the blob does not exist.
+        """
+        raise NotImplementedError()
+
+
+class FileBlobStore(BlobStore):
+    """Store the blobs in a local directory.
+
+    The blob with digest ``abcdef...`` will be stored at
+    ``root/ab/cd/abcdef...`` (with the suffix of compression format), so
+    that none of the directories would hold too many files.  The same
+    content is stored only once.
+
+    The blobs in any compression format can be read, no matter what
+    `compression` is chosen for the new blobs.
+
+    :param root: The root directory of this store.
+    :type root: :class:`str`
+    :param compression: The compression format of new blobs, one of
+        :data:`None`, "zlib" and "zstd".  "zstd" will be replaced by
+        "zlib" if :mod:`zstandard` is not installed.
+    :type compression: :class:`str`
+    :param cache_dir: The directory to hold the private decompressed
+        copies of blobs for :meth:`fetch`.  Default is ``root/.cache``.
+    :type cache_dir: :class:`str`
+    """
+
+    def __init__(self, root, compression=None, cache_dir=None):
+        if compression not in COMPRESSION_SUFFIX:
+            raise ValueError('Unknown compression %r.' % compression)
+        if compression == 'zstd' and zstandard is None:
+            compression = 'zlib'
+
+        #: The root directory of this store.
+        self.root = root
+
+        #: The compression format of new blobs.
+        self.compression = compression
+
+        #: The directory of private decompressed copies.
+        self.cache_dir = cache_dir or os.path.join(root, '.cache')
+
+    def path(self, digest, compression=None):
+        """Get the file path of a blob, no matter whether it exists.
+
+        :param digest: The SHA-256 hex digest of the blob.
+        :type digest: :class:`str`
+        :param compression: The compression format of the blob.
+        :type compression: :class:`str`
+        :raises: :class:`ValueError` if `digest` is malformed.
+        """
+        if not _DIGEST_PATTERN.match(digest):
+            raise ValueError('Malformed digest %r.' % digest)
+        return os.path.join(self.root, digest[:2], digest[2:4],
+                            digest + COMPRESSION_SUFFIX[compression])
+
+    def locate(self, digest):
+        """Find the stored file of a blob.
+
+        :param digest: The SHA-256 hex digest of the blob.
+        :type digest: :class:`str`
+        :return: A :class:`tuple` of (path, compression).
+        :raises: :class:`BlobNotFound` if the blob does not exist.
+        """
+        for compression in (None, 'zlib', 'zstd'):
+            fpath = self.path(digest, compression)
+            if os.path.isfile(fpath):
+                return fpath, compression
+        raise BlobNotFound(digest)
+
+    def exists(self, digest):
+        """Whether the blob exists in this store?"""
+        try:
+            self.locate(digest)
+            return True
+        except BlobNotFound:
+            return False
+
+    def _makedirs(self, path):
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path, 0700)
+            except OSError, ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+
+    def put(self, fobj):
+        incoming = os.path.join(self.root, '.incoming')
+        self._makedirs(incoming)
+
+        # Write the content (and the compressed content) into temporary
+        # files while computing the digest, then move it to the final place.
+        tmppath = os.path.join(incoming, uuid.uuid4().get_hex())
+        ztmppath = tmppath + '.z'
+        compressor = None
+        if self.compression:
+            compressor = _make_compressor(self.compression)
+        h = hashlib.sha256()
+        size = zsize = 0
+        try:
+            with open(tmppath, 'wb') as f:
+                zf = open(ztmppath, 'wb') if compressor else None
+                try:
+                    while True:
+                        buf = fobj.read(CHUNK_SIZE)
+                        if not buf:
+                            break
+                        h.update(buf)
+                        f.write(buf)
+                        size += len(buf)
+                        if zf:
+                            zbuf = compressor.compress(buf)
+                            zf.write(zbuf)
+                            zsize += len(zbuf)
+                    if zf:
+                        zbuf = compressor.flush()
+                        zf.write(zbuf)
+                        zsize += len(zbuf)
+                finally:
+                    if zf:
+                        zf.close()
+            digest = h.hexdigest()
+            if not self.exists(digest):
+                if compressor and zsize <= size * (1 - MIN_COMPRESSION_SAVING):
+                    fpath = self.path(digest, self.compression)
+                    srcpath = ztmppath
+                else:
+                    fpath = self.path(digest)
+                    srcpath = tmppath
+                self._makedirs(os.path.dirname(fpath))
+                os.rename(srcpath, fpath)
+        finally:
+            for p in (tmppath, ztmppath):
+                if os.path.isfile(p):
+                    os.remove(p)
+        return digest, size
+
+    def open(self, digest):
+        fpath, compression = self.locate(digest)
+        if compression:
+            return DecompressFile(open(fpath, 'rb'), compression)
+        return open(fpath, 'rb')
+
+    def fetch(self, digest):
+        fpath, compression = self.locate(digest)
+        if not compression:
+            return fpath
+
+        # Decompress the blob into a private copy.
+        with DecompressFile(open(fpath, 'rb'), compression) as src:
+            return _write_private(self.cache_dir, digest, src)[0]
+
+    def release(self, fpath):
+        # The uncompressed blobs are not copied, thus never removed.
+        _remove_private(self.cache_dir, fpath)
+
+    def remove(self, digest):
+        """Remove a blob if it exists.
+
+        :param digest: The SHA-256 hex digest of the blob.
+        :type digest: :class:`str`
+        """
+        for compression in COMPRESSION_SUFFIX:
+            try:
+                os.remove(self.path(digest, compression))
+            except OSError, ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+
+
+class HttpBlobStore(BlobStore):
+    """Fetch the blobs from a remote server into private local copies,
+    which are removed when released.
+
+    This store is read-only.
+
+    :param download: Method to open the remote blob as a file object,
+        which should raise :class:`BlobNotFound` if it does not exist.
+    :type download: method(digest) -> file object
+    :param cache_dir: The directory of the downloaded copies.
+    :type cache_dir: :class:`str`
+    """
+
+    def __init__(self, download, cache_dir):
+        self.download = download
+
+        #: The directory of the downloaded copies.
+        self.cache_dir = cache_dir
+
+    def put(self, fobj):
+        raise NotImplementedError('HttpBlobStore is read-only.')
+
+    def open(self, digest):
+        return self.download(digest)
+
+    def fetch(self, digest):
+        fobj = self.download(digest)
+        try:
+            fpath, got = _write_private(self.cache_dir, digest, fobj)
+        finally:
+            fobj.close()
+        if got != digest:
+            _remove_private(self.cache_dir, fpath)
+            raise IOError('Digest mismatch for blob %s.' % digest)
+        return fpath
+
+    def release(self, fpath):
+        _remove_private(self.cache_dir, fpath)
@@ -6,6 +6,13 @@
 # This file is released under BSD 2-clause license.
 
 import os
+import stat
+import time
+import errno
+import fcntl
+import shutil
+import hashlib
+import tempfile
 import zipfile
 import rarfile
 import tarfile
@@ -13,6 +20,10 @@ import tarfile
 # set the global parameters of external modules
 rarfile.PATH_SEP = '/'
 
+#: The ``FICLONE`` ioctl request number on Linux, which makes a copy-on-write
+#: clone of a whole file on file systems like btrfs and xfs.
+FICLONE = 0x40049409
+
 
 def file_get_contents(path):
     """Read the file contents of `path`.
@@ -71,6 +82,286 @@ def dirtree(parent):
     return F(os.path.realpath(parent), '')
 
 
+class ManifestEntry(object):
+    """A file or a directory in :class:`FileManifest`.
+
+    :param path: The relative path of the entity.
+    :type path: :class:`str`
+    :param fullpath: The full path of the entity.
+    :type fullpath: :class:`str`
+    :param st: The status of the entity, from :func:`os.stat`.
+    :param action: The action of the entity given by the file rules.
+    """
+
+    #: Read the files by such bytes when computing the digests.
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path, fullpath, st, action=None):
+        #: The relative path of the entity.
+        self.path = path
+
+        #: The full path of the entity.
+        self.fullpath = fullpath
+
+        #: Whether the entity is a directory?
+        self.isdir = stat.S_ISDIR(st.st_mode)
+
+        #: The size of the file.
+        self.size = st.st_size
+
+        #: The permission bits of the file.
+        self.mode = stat.S_IMODE(st.st_mode)
+
+        #: The last modification time of the file.
+        self.mtime = st.st_mtime
+
+        #: The action given by the file rules, or :data:`None` if the
+        #: manifest has no rules.
+        self.action = action
+
+        # the content digest, computed on first access
+        self._digest = None
+
+    def __repr__(self):
+        return '<ManifestEntry(%s)>' % self.path
+
+    @property
+    def digest(self):
+        """The SHA-256 hex digest of the file content, or :data:`None` if
+        the entity is a directory.  The digest is computed on first access,
+        so that loading a homework with large datasets is still cheap.
+        """
+        if self._digest is None and not self.isdir:
+            h = hashlib.sha256()
+            with open(self.fullpath, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.CHUNK_SIZE), ''):
+                    h.update(chunk)
+            self._digest = h.hexdigest()
+        return self._digest
+
+
+class FileManifest(object):
+    """The precomputed list of all entities under a directory, in the same
+    order as :func:`dirtree` (the children of a directory come before the
+    directory itself), except that the children are sorted by names.
+
+    Scanning the tree again is only necessary if any directory has been
+    modified, since adding, removing or renaming an entity changes the
+    mtime of its parent directory.  So :meth:`validate` only checks the
+    directories by default, and the files modified in place are not
+    detected.  If `check_files` is :data:`True`, the size, mtime and mode
+    of every file are checked as well, which should be used for the small
+    trees whose contents matter (e.g., the code packages).
+
+    :param path: The root directory.
+    :type path: :class:`str`
+    :param rules: The file rules to precompute the action of each entity.
+    :type rules: :class:`~railgun.common.hw.FileRules`
+    :param default_action: The action of the entities matching no rule.
+    :param prune: The relative paths of directories not to be scanned,
+        which are excluded from the manifest as well.
+    :type prune: :class:`tuple` of :class:`str`
+    :param check_files: Whether or not to check the status of every file
+        in :meth:`validate`?
+    :type check_files: :class:`bool`
+    """
+
+    #: The directories (and files) modified within such seconds before a
+    #: scan are checked again by the next :meth:`validate`, since they may
+    #: be modified again without changing the mtime.
+    RACY_SECONDS = 2
+
+    def __init__(self, path, rules=None, default_action=None, prune=(),
+                 check_files=False):
+        #: The root directory.
+        self.path = path
+
+        #: The file rules to precompute the action of each entity.
+        self.rules = rules
+
+        #: The action of the entities matching no rule.
+        self.default_action = default_action
+
+        #: The relative paths of directories not to be scanned.
+        self.prune = prune
+
+        #: Whether or not to check the status of every file?
+        self.check_files = check_files
+
+        #: The :class:`ManifestEntry` objects.
+        self.entries = []
+
+        # mapping from full paths of directories to their mtimes
+        self._dir_mtimes = {}
+        # whether any directory may have been modified within the scan
+        self._racy = False
+        # the digest of all files, computed on first access after rebuild
+        self._digest = None
+
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def rebuild(self):
+        """Scan the directory tree and rebuild the manifest.
+
+        :raises: :class:`Exception` from the system libraries.
+        """
+        entries = []
+        dir_mtimes = {}
+        scan_time = time.time()
+
+        def F(pa, p):
+            # the mtime must be taken before the directory is listed
+            dir_mtimes[pa] = os.stat(pa).st_mtime
+            for f in sorted(os.listdir(pa)):
+                fpath = os.path.join(pa, f)
+                p2 = p + f
+                if p2 in self.prune:
+                    continue
+                st = os.stat(fpath)
+                # if directory, scan recursively
+                if stat.S_ISDIR(st.st_mode):
+                    F(fpath, p2 + '/')
+                action = None
+                if self.rules is not None:
+                    action = self.rules.get_action(p2, self.default_action)
+                entries.append(ManifestEntry(p2, fpath, st, action))
+
+        F(os.path.realpath(self.path), '')
+        self.entries = entries
+        self._dir_mtimes = dir_mtimes
+        self._digest = None
+        mtimes = dir_mtimes.values()
+        if self.check_files:
+            mtimes.extend(e.mtime for e in entries if not e.isdir)
+        self._racy = any(m >= scan_time - self.RACY_SECONDS for m in mtimes)
+
+    def _unchanged(self):
+        # whether the directories (and files) have not been modified
+        if not all(os.stat(d).st_mtime == m
+                   for d, m in self._dir_mtimes.iteritems()):
+            return False
+        if self.check_files:
+            for e in self.entries:
+                if e.isdir:
+                    continue
+                st = os.stat(e.fullpath)
+                if (st.st_size, st.st_mtime, stat.S_IMODE(st.st_mode)) != \
+                        (e.size, e.mtime, e.mode):
+                    return False
+        return True
+
+    def validate(self):
+        """Rebuild the manifest if any directory (or any file, if
+        :attr:`check_files` is :data:`True`) has been modified.
+
+        :return: :data:`True` if the manifest has been rebuilt.
+        """
+        if not self._racy:
+            try:
+                if self._unchanged():
+                    return False
+            except OSError:
+                pass
+        self.rebuild()
+        return True
+
+    @property
+    def digest(self):
+        """The SHA-256 hex digest of the relative paths, the permission bits
+        and the contents of all files.  It is computed only once after each
+        rebuild, so it can be used as the version of the tree.
+        """
+        if self._digest is None:
+            h = hashlib.sha256()
+            for e in sorted(self.files(), key=lambda e: e.path):
+                h.update('%s\0%o\0' % (e.path, e.mode & 0777))
+                h.update(e.digest.decode('hex'))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def files(self):
+        """Get the entries which are not directories.
+
+        :return: :class:`list` of :class:`ManifestEntry` objects.
+        """
+        return [e for e in self.entries if not e.isdir]
+
+    def filter(self, allow_actions):
+        """Get the relative paths of entities taking operations from
+        `allow_actions`.
+
+        :param allow_actions: Set of file rules ``(ACCEPT, LOCK, HIDE, DENY)``.
+        :type allow_actions: :class:`set` or :class:`tuple`
+
+        :return: :class:`list` of relative paths.
+        """
+        return [e.path for e in self.entries if e.action in allow_actions]
+
+
+def reflink(src, dst):
+    """Make `dst` a copy-on-write clone of `src`.
+
+    The data blocks of `src` are shared with `dst` until either of them is
+    modified, so cloning a file costs nearly nothing.  However, this is only
+    supported on some file systems (e.g., btrfs and xfs).
+
+    :param src: The path of source file.
+    :type src: :class:`str`
+    :param dst: The path of target file, which should not exist.
+    :type dst: :class:`str`
+
+    :raises: :class:`IOError` if the file system does not support cloning.
+    """
+    with open(src, 'rb') as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except Exception:
+            os.close(fd)
+            os.remove(dst)
+            raise
+        os.close(fd)
+
+
+def clonefile(src, dst, hardlink=False):
+    """Make `dst` have the same content as `src` in the cheapest way.
+
+    If `hardlink` is :data:`True`, `dst` will be a hard link to `src`.
+    Otherwise try to make a copy-on-write clone, and fall back to copying
+    the content if the file system does not support it.
+
+    :param src: The path of source file.
+    :type src: :class:`str`
+    :param dst: The path of target file, which should not exist.
+    :type dst: :class:`str`
+    :param hardlink: Whether or not to make a hard link?
+    :type hardlink: :class:`bool`
+
+    :return: :data:`True` if `dst` is a hard link to `src`, :data:`False`
+        if it is a new file.
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return True
+        except OSError, ex:
+            # Maybe they are on different devices, or the source file
+            # has reached the link count limit.
+            if ex.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                raise
+    try:
+        reflink(src, dst)
+    except (IOError, OSError):
+        shutil.copyfile(src, dst)
+    return False
+
+
 def packzip(base_path, files, target, path_prefix=''):
     """Pack all entities in `files` under `base_path` into `target` zipfile.
 
@@ -103,17 +394,170 @@ def makezip(filename):
     return zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
 
 
+#: The magic bytes at the beginning of supported archive formats.
+ARCHIVE_MAGICS = (
+    ('PK\x03\x04', 'zip'),
+    ('PK\x05\x06', 'zip'),
+    ('Rar!\x1a\x07', 'rar'),
+    ('\x1f\x8b', 'tar'),
+    ('BZh', 'tar'),
+)
+
+#: The archive formats of supported file extensions.
+ARCHIVE_EXTENSIONS = {
+    '.zip': 'zip',
+    '.rar': 'rar',
+    '.tar': 'tar',
+    '.tgz': 'tar',
+    '.gz': 'tar',
+    '.bz2': 'tar',
+    '.tbz': 'tar',
+}
+
+
+def sniff_archive(header):
+    """Detect the archive format from the beginning bytes of a file.
+
+    :param header: At least 512 bytes at the beginning of the file (or the
+        whole file if it is shorter).
+    :type header: :class:`str`
+    :return: One of ``zip``, ``rar`` and ``tar``, or :data:`None` if the
+        format is not recognized.
+    """
+    for magic, fmt in ARCHIVE_MAGICS:
+        if header.startswith(magic):
+            return fmt
+    # Uncompressed POSIX tar archives have the magic in the first header.
+    if header[257:262] == 'ustar':
+        return 'tar'
+    return None
+
+
+class ArchiveLimitExceeded(ValueError):
+    """The archive file exceeds one of the limits checked by
+    :meth:`ArchiveIndex.check`.
+
+    :param limit: The name of exceeded limit, one of ``count``,
+        ``file_size``, ``total_size`` and ``ratio``.
+    :type limit: :class:`str`
+    """
+
+    def __init__(self, limit):
+        super(ArchiveLimitExceeded, self).__init__(
+            'Archive exceeds the limit of %s.' % limit)
+        self.limit = limit
+
+
+class ArchiveIndex(object):
+    """The index of files in an archive, which is built by reading the
+    member list of the archive only once, and shared by all the methods of
+    :class:`Extractor`.
+
+    The sizes are declared by the archive headers, so they are only used to
+    reject the archives early.  The extracted bytes should be counted as
+    well.
+
+    :param entries: The (fname, size, compressed_size, info) of each file,
+        where `compressed_size` is :data:`None` if not known (e.g., the
+        files in a compressed tar), and `info` is the member object of the
+        archive library.
+    :type entries: :class:`list` of :class:`tuple`
+    :param archive_size: The size of the archive file.
+    :type archive_size: :class:`int`
+    """
+
+    #: The compression ratio of files smaller than such bytes is not checked,
+    #: since small text files may be compressed very well.
+    RATIO_MIN_SIZE = 1 << 20
+
+    def __init__(self, entries, archive_size=None):
+        #: The (fname, size, compressed_size, info) of each file.
+        self.entries = entries
+
+        #: The size of the archive file.
+        self.archive_size = archive_size
+
+        #: The total uncompressed size of all the files.
+        self.total_size = sum(e[1] for e in entries)
+
+        #: Whether the archive contains only one top-level directory?
+        #: See :meth:`Extractor.onedir`.
+        self.onedir = self._detect_onedir()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _detect_onedir(self):
+        last_dname = None
+        for fname, _, _, _ in self.entries:
+            # get the first directory name
+            dname = fname.split('/', 1)[0]
+            # OS X will add a hidden directory named "__MACOSX" to archive
+            # even the user just wants to compress a single directory.
+            # So ignore this directory.
+            if dname == '__MACOSX':
+                continue
+            # check whether one dir.
+            if last_dname is None:
+                last_dname = dname
+            if last_dname != dname:
+                return False
+        return True
+
+    def check(self, max_count=None, max_file_size=None, max_total_size=None,
+              max_ratio=None):
+        """Check the declared sizes of the archive against the limits.
+        The limits of :data:`None` are not checked.
+
+        :param max_count: The maximum number of files.
+        :param max_file_size: The maximum uncompressed size of a file.
+        :param max_total_size: The maximum uncompressed size of all files.
+        :param max_ratio: The maximum ratio of uncompressed size to
+            compressed size, of each file and of the whole archive.
+
+        :raises: :class:`ArchiveLimitExceeded` if any limit is exceeded.
+        """
+        if max_count is not None and len(self.entries) > max_count:
+            raise ArchiveLimitExceeded('count')
+        if max_total_size is not None and self.total_size > max_total_size:
+            raise ArchiveLimitExceeded('total_size')
+        for fname, size, csize, _ in self.entries:
+            if max_file_size is not None and size > max_file_size:
+                raise ArchiveLimitExceeded('file_size')
+            if max_ratio and csize is not None and \
+                    size >= self.RATIO_MIN_SIZE and \
+                    size > max_ratio * max(csize, 1):
+                raise ArchiveLimitExceeded('ratio')
+        if max_ratio and self.archive_size is not None and \
+                self.total_size >= self.RATIO_MIN_SIZE and \
+                self.total_size > max_ratio * max(self.archive_size, 1):
+            raise ArchiveLimitExceeded('ratio')
+
+
+def _source_size(source):
+    # Get the size of an archive file given by path or file-like object.
+    if hasattr(source, 'read'):
+        pos = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(pos)
+        return size
+    return os.path.getsize(source)
+
+
 class Extractor(object):
     """The unique interface for archive file extractors.
 
     `Railgun` system can extract various types of archive files.  This class
-    provides a unique interface to create an extractor on given archive file.
-    The format of archive will be recognized according to file extension,
-    For examples::
+    provides a unique interface to create an extractor on given archive file,
+    or on a file-like object (e.g., a :class:`~StringIO.StringIO` holding
+    the uploaded content), so that it need not be written to disk.  The
+    format of archive will be recognized according to the magic bytes, or
+    the file extension if the magic bytes are not known.  For examples::
 
         >>> Extractor.open('a.zip')
         <ZipExtractor instance>
-        >>> Extractor.open('a.rar')
+        >>> Extractor.open(StringIO(data), 'a.rar')
         <RarExtractor instance>
 
     Also, the :class:`Extractor` objects implements context manager, for
@@ -125,10 +569,21 @@ class Extractor(object):
             for fname, fobj in f:
                 print 'the content of %s is:' % fname
                 print fobj.read()
+
+    The member list of the archive is read only once into an
+    :class:`ArchiveIndex` (see :meth:`index`), which is shared by all the
+    methods.  Derived classes should implement :meth:`_read_index` and
+    :meth:`_open_member`.
+
+    :param fobj: The object of the archive library.
+    :param size: The size of the archive file.
+    :type size: :class:`int`
     """
 
-    def __init__(self, fobj):
+    def __init__(self, fobj, size=None):
         self.fobj = fobj
+        self.size = size
+        self._index = None
 
     # support with statement
     def __enter__(self):
@@ -147,7 +602,26 @@ class Extractor(object):
     def _canonical_path(self, p):
         return p.replace('\\', '/')
 
-    # basic method to get next file from archive
+    def _read_index(self):
+        """Derived classes should implement this to get the list of
+        (fname, size, compressed_size, info) of the files in the archive.
+        """
+        raise NotImplementedError()
+
+    def _open_member(self, info):
+        """Derived classes should implement this to open the file-like
+        object of the member `info`.
+        """
+        raise NotImplementedError()
+
+    def index(self):
+        """Get the :class:`ArchiveIndex` of this archive, which is built on
+        the first call.
+        """
+        if self._index is None:
+            self._index = ArchiveIndex(self._read_index(), self.size)
+        return self._index
+
     def extract(self):
         """Get iterable (fname, fobj) from the archive.
 
@@ -157,30 +631,23 @@ class Extractor(object):
         :return: list of tuple (fname, fobj), where `fname` is a :class:`str`,
             and `fobj` is a file-like object.
         """
-        raise NotImplementedError()
+        for fname, _, _, info in self.index().entries:
+            yield fname, self._open_member(info)
 
-    # basic method to get names of all files
     def filelist(self):
         """Get iterable name lists in this archive file."""
-        raise NotImplementedError()
+        return [e[0] for e in self.index().entries]
 
     def countfiles(self, maxcount=1048576):
         """Count all files in the archive.
 
         :param maxcount: maximum files to count.  If exceeds this limit,
-            the method will be interrupted, and ``maxcount + 1`` will be
-            returned.
+            ``maxcount + 1`` will be returned.
         :type maxcount: :class:`int`
 
         :return: the number of files in this archive.
         """
-
-        counter = 0
-        for fname in self.filelist():
-            counter += 1
-            if counter > maxcount:
-                break
-        return counter
+        return min(len(self.index()), maxcount + 1)
 
     def onedir(self):
         """Check whether this archive contains only one top-level directory?
@@ -195,99 +662,111 @@ class Extractor(object):
         :return: True if the archive file indeed contains only one top-level
             directory, while False otherwise.
         """
-        last_dname = None
-        for fname in self.filelist():
-            # get the first directory name
-            slash_pos = fname.find('/')
-            if slash_pos >= 0:
-                dname = fname[: slash_pos]
-            else:
-                dname = fname
-            # ignore some meta data directories
-            if dname == '__MACOSX':
-                # OS X will add a hidden directory named "__MACOSX" to archive
-                # even the user just wants to compress a single directory.
-                # So ignore this directory.
-                continue
-            # check whether one dir.
-            if last_dname is None:
-                last_dname = dname
-            if last_dname != dname:
-                return False
-        return True
+        return self.index().onedir
 
     @staticmethod
-    def open(fpath):
+    def open(source, filename=None):
         """Open an extractor for given archive file.
 
-        :param fpath: the path of archive file.
-        :type fpath: :class:`str`
+        :param source: the path of archive file, or a seekable file-like
+            object holding the archive content.
+        :type source: :class:`str` or :class:`file`
+        :param filename: the original name of archive file, whose extension
+            determines the archive format if the magic bytes are not known.
+            If not given, the extension of `source` will be used.
+        :type filename: :class:`str`
 
         :return: instance derived from :class:`Extractor`.
-        :raises: :class:`ValueError` if the extension of given file is not
+        :raises: :class:`ValueError` if the format of given file is not
             supported.
         """
 
-        fext = os.path.splitext(fpath)[1].lower()
-        if fext in ('.rar'):
-            return RarExtractor(fpath)
-        if fext in ('.zip'):
-            return ZipExtractor(fpath)
-        if fext in ('.tar', '.tgz', '.gz', '.bz2', '.tbz'):
-            return TarExtractor(fpath)
-        raise ValueError('Archive file "%s" not recognized.')
+        if hasattr(source, 'read'):
+            pos = source.tell()
+            header = source.read(512)
+            source.seek(pos)
+        else:
+            with open(source, 'rb') as f:
+                header = f.read(512)
+            filename = filename or source
+
+        fmt = sniff_archive(header) or ARCHIVE_EXTENSIONS.get(
+            os.path.splitext(filename or '')[1].lower())
+        if fmt == 'rar':
+            return RarExtractor(source)
+        if fmt == 'zip':
+            return ZipExtractor(source)
+        if fmt == 'tar':
+            return TarExtractor(source)
+        raise ValueError('Archive file "%s" not recognized.' % filename)
 
 
 class ZipExtractor(Extractor):
 
-    def __init__(self, fpath):
-        super(ZipExtractor, self).__init__(zipfile.ZipFile(fpath, 'r'))
+    def __init__(self, source):
+        super(ZipExtractor, self).__init__(
+            zipfile.ZipFile(source, 'r'), _source_size(source))
 
-    def extract(self):
-        for mi in self.fobj.infolist():
-            # ignore directory entries
-            if mi.filename[-1] == '/':
-                continue
-            f = self.fobj.open(mi)
-            yield self._canonical_path(mi.filename), f
+    def _read_index(self):
+        # ignore directory entries
+        return [
+            (self._canonical_path(mi.filename), mi.file_size,
+             mi.compress_size, mi)
+            for mi in self.fobj.infolist() if mi.filename[-1] != '/'
+        ]
 
-    def filelist(self):
-        for mi in self.fobj.infolist():
-            if mi.filename[-1] == '/':
-                continue
-            yield self._canonical_path(mi.filename)
+    def _open_member(self, info):
+        return self.fobj.open(info)
 
 
 class RarExtractor(Extractor):
 
-    def __init__(self, fpath):
-        super(RarExtractor, self).__init__(rarfile.RarFile(fpath, 'r'))
-
-    def extract(self):
-        for mi in self.fobj.infolist():
-            if mi.isdir():
-                continue
-            f = self.fobj.open(mi)
-            yield self._canonical_path(mi.filename), f
+    def __init__(self, source):
+        # The rar archives are read by external tools, so file-like objects
+        # should be written to disk first.
+        self.spill = None
+        size = _source_size(source)
+        if hasattr(source, 'read'):
+            self.spill = tempfile.NamedTemporaryFile(suffix='.rar')
+            shutil.copyfileobj(source, self.spill)
+            self.spill.flush()
+            source = self.spill.name
+        super(RarExtractor, self).__init__(rarfile.RarFile(source, 'r'), size)
 
-    def filelist(self):
-        for mi in self.fobj.infolist():
-            if mi.isdir():
-                continue
-            yield self._canonical_path(mi.filename)
+    def __exit__(self, type, value, tb):
+        super(RarExtractor, self).__exit__(type, value, tb)
+        if self.spill:
+            self.spill.close()
+            self.spill = None
 
+    def _read_index(self):
+        return [
+            (self._canonical_path(mi.filename), mi.file_size,
+             mi.compress_size, mi)
+            for mi in self.fobj.infolist() if not mi.isdir()
+        ]
 
-class TarExtractor(Extractor):
+    def _open_member(self, info):
+        return self.fobj.open(info)
 
-    def __init__(self, fpath):
-        super(TarExtractor, self).__init__(tarfile.open(fpath, 'r'))
 
-    def extract(self):
-        for mi in self.fobj:
-            if not mi.isdir():
-                yield self._canonical_path(mi.name), self.fobj.extractfile(mi)
+class TarExtractor(Extractor):
 
-    def filelist(self):
-        for mi in self.fobj:
-            if not mi.isdir():
-                yield self._canonical_path(mi.name)
+    def __init__(self, source):
+        size = _source_size(source)
+        if hasattr(source, 'read'):
+            fobj = tarfile.open(fileobj=source, mode='r')
+        else:
+            fobj = tarfile.open(source, 'r')
+        super(TarExtractor, self).__init__(fobj, size)
+
+    def _read_index(self):
+        # The members of a compressed tar are not compressed one by one, so
+        # only the ratio of the whole archive can be checked.
+        return [
+            (self._canonical_path(mi.name), mi.size, None, mi)
+            for mi in self.fobj.getmembers() if not mi.isdir()
+        ]
+
+    def _open_member(self, info):
+        return self.fobj.extractfile(info)
@@ -41,6 +41,8 @@ You may head over to read more about these classes.
 
 import re
 import os
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
 from xml.etree import ElementTree
 from itertools import ifilter, chain
@@ -88,6 +90,10 @@ class FileRules(object):
     students can be received.
 
     You may refer to :ref:`hwpack` for more details about these four actions.
+
+    The rules are compiled into one regular expression on the first lookup,
+    and the recent decisions are memoized, since the same rules are checked
+    against every file in the homework directories and the submissions.
     """
 
     #: Indicate that the matching files are revealed to students in the
@@ -108,13 +114,58 @@ class FileRules(object):
     #: containing these files will be `REJECTED` immediately.
     DENY = 3
 
+    #: The maximum number of memoized decisions of each rule set.
+    CACHE_SIZE = 4096
+
+    # The patterns which could not be put into one regular expression:
+    # the back references, the named groups and the inline flags.
+    _UNSAFE_PATTERN = re.compile(r'\\[1-9]|\(\?P|\(\?[iLmsux]')
+
     def __init__(self):
         # list of (action, pattern)
         self.data = []
+        self._reset()
 
     def __repr__(self):
         return repr(self.data)
 
+    def _reset(self):
+        # the combined pattern, or False if the rules cannot be combined
+        self._matcher = None
+        # memoized decisions, from file names to actions (None if no rule
+        # is matched), in least recently used order
+        self._cache = OrderedDict()
+
+    def _compile(self):
+        """Compile all the rules into one regular expression, where the
+        pattern of the `i`-th rule is named as group ``_ri``.  The first
+        matching alternative is chosen, which keeps the rule order.
+        """
+        if any(self._UNSAFE_PATTERN.search(p.pattern) for _, p in self.data):
+            return False
+        try:
+            return re.compile('|'.join(
+                '(?P<_r%d>%s)' % (i, p.pattern)
+                for i, (_, p) in enumerate(self.data)
+            ))
+        except Exception:
+            # Python 2 only supports 100 named groups in a pattern.
+            return False
+
+    def _match(self, filename):
+        """Get the action of the first rule matching `filename`, or
+        :data:`None` if no rule matches.
+        """
+        if self._matcher is None:
+            self._matcher = self._compile()
+        if self._matcher:
+            m = self._matcher.match(filename)
+            return self.data[int(m.lastgroup[2:])][0] if m else None
+        for a, p in self.data:
+            if p.match(filename):
+                return a
+        return None
+
     def get_action(self, filename, default_action=LOCK):
         """Get the action to take on given file.
 
@@ -125,13 +176,20 @@ class FileRules(object):
 
         :return: One action out of ``(ACCEPT, LOCK, HIDE, DENY)``.
         """
-
-        for a, p in self.data:
-            if p.match(filename):
-                return a
+        cache = self._cache
+        try:
+            action = cache.pop(filename)
+        except KeyError:
+            action = self._match(filename)
+            if len(cache) >= self.CACHE_SIZE:
+                try:
+                    cache.popitem(last=False)
+                except KeyError:
+                    pass
+        cache[filename] = action
 
         # if no rule matches, default takes lock action
-        return default_action
+        return default_action if action is None else action
 
     def _make_action(self, action, pattern):
         act = None
@@ -155,6 +213,7 @@ class FileRules(object):
         :type pattern: Regular expression :class:`str`
         """
         self.data.append(self._make_action(action, pattern))
+        self._reset()
 
     def prepend_action(self, action, pattern):
         """Prepend a file rule (action, pattern) to the front of rule list.
@@ -165,6 +224,7 @@ class FileRules(object):
         :type pattern: Regular expression :class:`str`
         """
         self.data.insert(0, self._make_action(action, pattern))
+        self._reset()
 
     def filter(self, files, allow_actions, default_action=LOCK):
         """Return a new iterator on given file iterator, where files not
@@ -195,6 +255,19 @@ class FileRules(object):
             files
         )
 
+    @staticmethod
+    def concat(*rule_sets):
+        """Make a new rule set which checks the rules of each given rule set
+        in order, so that the lookups through several rule sets can share
+        one compiled pattern and cache.
+
+        :param rule_sets: The :class:`FileRules` objects.
+        :return: The new :class:`FileRules` object.
+        """
+        ret = FileRules()
+        ret.data = list(chain(*(r.data for r in rule_sets)))
+        return ret
+
     @staticmethod
     def parse_xml(xmlnode):
         """Load file rules from an xml node object.
@@ -406,9 +479,28 @@ class HwCode(object):
         #: Store the specialized settings for various scorers.
         self.scorers = {}
 
+        #: The :class:`~railgun.common.fileutil.FileManifest` of this code
+        #: package, whose actions are given by
+        #: :meth:`Homework.get_file_rules`.  It is built by
+        #: :class:`Homework` when loaded.
+        self.manifest = None
+
+        #: The SHA-256 hex digest of ``code.xml``.
+        self.digest = None
+
     def __repr__(self):
         return '<HwCode(%s)>' % self.path
 
+    def get_manifest(self):
+        """Get the up-to-date file manifest of this code package.  The
+        status of every file is checked, so the files edited in place are
+        also detected.
+
+        :return: The :class:`~railgun.common.fileutil.FileManifest` object.
+        """
+        self.manifest.validate()
+        return self.manifest
+
     def get_scorer(self, typeName):
         """Get the settings of a particular scorer.
 
@@ -451,8 +543,10 @@ class HwCode(object):
 
         lang = os.path.split(path)[1]
         ret = HwCode(path, lang)
-        tree = ElementTree.parse(os.path.join(path, 'code.xml'))
-        root = tree.getroot()
+        with open(os.path.join(path, 'code.xml'), 'rb') as f:
+            cnt = f.read()
+        ret.digest = hashlib.sha256(cnt).hexdigest()
+        root = ElementTree.fromstring(cnt)
 
         # whether or not this HwCode provides download attachment
         # default value is True if not given
@@ -516,6 +610,11 @@ class Homework(object):
         self._locale_to_info = {}
         #: Cache the mapping from language name to :class:`HwCode` object.
         self._lang_to_code = {}
+        #: The :class:`~railgun.common.fileutil.FileManifest` of the root
+        #: directory, excluding the code packages.
+        self.manifest = None
+        #: The SHA-256 hex digest of ``hw.xml``.
+        self.digest = None
 
     @staticmethod
     def load(path):
@@ -541,9 +640,11 @@ class Homework(object):
         ret = Homework()
         ret.path = path
         ret.slug = os.path.split(path)[1]
-        tree = ElementTree.parse(os.path.join(path, 'hw.xml'))
+        with open(os.path.join(path, 'hw.xml'), 'rb') as f:
+            cnt = f.read()
+        ret.digest = hashlib.sha256(cnt).hexdigest()
 
-        for nd in tree.getroot():
+        for nd in ElementTree.fromstring(cnt):
             if nd.tag == 'uuid':
                 ret.uuid = nd.text.strip()
             elif nd.tag == 'names':
@@ -612,6 +713,7 @@ class Homework(object):
         # Stage 5: Cache necessary objects
         ret._cache_formatted_markdown()
         ret._cache_mappings()
+        ret._cache_manifests()
 
         return ret
 
@@ -619,6 +721,24 @@ class Homework(object):
         """Cache mappings from key to value."""
         self._lang_to_code = {c.lang: c for c in self.codes}
         self._locale_to_info = {i.lang: i for i in self.info}
+        self._lang_to_rules = {
+            c.lang: FileRules.concat(c.file_rules, self.file_rules)
+            for c in self.codes
+        }
+
+    def _cache_manifests(self):
+        """Build the file manifests of this homework and the code packages,
+        so that the directories need not be scanned again for each
+        submission or attachment.
+        """
+        self.manifest = fileutil.FileManifest(
+            self.path, self.file_rules, FileRules.LOCK, prune=('code',))
+        for c in self.codes:
+            # the code packages are small, while their files may be edited
+            # in place, so every file is checked.
+            c.manifest = fileutil.FileManifest(
+                c.path, self._lang_to_rules[c.lang], FileRules.LOCK,
+                check_files=True)
 
     def _cache_formatted_markdown(self):
         """Format the descriptions and solutions in all :class:`HwInfo`.
@@ -652,6 +772,25 @@ class Homework(object):
         """
         return self._lang_to_code[lang]
 
+    def get_file_rules(self, lang):
+        """Get the :class:`FileRules` for the runtime files of given
+        programming language, which checks the rules of the
+        :class:`HwCode` first, and then the rules of this homework.
+
+        :return: The :class:`FileRules` object.
+        :raises: :class:`KeyError` if given language is not found.
+        """
+        return self._lang_to_rules[lang]
+
+    def get_manifest(self):
+        """Get the up-to-date file manifest of the root directory, where the
+        code packages are excluded.
+
+        :return: The :class:`~railgun.common.fileutil.FileManifest` object.
+        """
+        self.manifest.validate()
+        return self.manifest
+
     def count_attach(self):
         """Count the number of :class:`HwCode` objects with attachment."""
         ret = 0
@@ -681,14 +820,15 @@ class Homework(object):
         # only acceptable and locked files are given to students.
         #
         # note that `code` and `desc` directories are defaultly hidden.
-        root_files = self.file_rules.filter(
-            fileutil.dirtree(self.path),
+        root_files = self.get_manifest().filter(
             (FileRules.ACCEPT, FileRules.LOCK)
         )
 
-        # prepare the file list for given `lang`.
+        # prepare the file list for given `lang`.  the actions in the
+        # manifest also take the homework rules, so only the rules of
+        # `code` are checked here.
         code_files = code.file_rules.filter(
-            fileutil.dirtree(code.path),
+            (e.path for e in code.get_manifest()),
             (FileRules.ACCEPT, FileRules.LOCK)
         )
 
@@ -722,11 +862,11 @@ class Homework(object):
             re.compile('^code$|^code/\\.*|^desc$|^desc/\\.*|^hw\\.xml$')
         root_files = ifilter(
             lambda s: not root_hide.match(s),
-            fileutil.dirtree(self.path)
+            (e.path for e in self.get_manifest())
         )
 
         # get list of code files
-        code_files = fileutil.dirtree(code.path)
+        code_files = (e.path for e in code.get_manifest())
 
         return chain(root_files, code_files)
 
@@ -7,14 +7,55 @@
 
 import os
 import time
-import math
+import fcntl
+import errno
+import ctypes
+import select
+import resource
+import collections
 import signal
+import threading
 import subprocess
+import ctypes.util
 
 
 class ProcessTimeout(Exception):
-    """Indicate that the timeout was reached when executing a process."""
-    pass
+    """Indicate that the timeout was reached when executing a process.
+
+    :param message: The error message.
+    :param usage: The resource usage of the killed process, see
+        :func:`make_usage`.
+    :type usage: :class:`dict`
+    """
+
+    def __init__(self, message, usage=None):
+        super(ProcessTimeout, self).__init__(message)
+        self.usage = usage
+
+
+def make_usage(rusage, wall_time):
+    """Convert the resource usage of a process into a plain dict.
+
+    :param rusage: The resource usage returned by :func:`os.wait4`.
+    :type rusage: :class:`resource.struct_rusage`
+    :param wall_time: The wall-clock seconds from start to exit.
+    :type wall_time: :class:`float`
+
+    :return: A :class:`dict` with ``cpu_user`` and ``cpu_system``
+        (seconds), ``max_rss`` (kilobytes), ``io_inblock`` and
+        ``io_oublock`` (block operations), ``ctx_voluntary`` and
+        ``ctx_involuntary`` (context switches), and ``wall_time`` (seconds).
+    """
+    return {
+        'cpu_user': rusage.ru_utime,
+        'cpu_system': rusage.ru_stime,
+        'max_rss': rusage.ru_maxrss,
+        'io_inblock': rusage.ru_inblock,
+        'io_oublock': rusage.ru_oublock,
+        'ctx_voluntary': rusage.ru_nvcsw,
+        'ctx_involuntary': rusage.ru_nivcsw,
+        'wall_time': wall_time,
+    }
 
 
 def is_running(pid):
@@ -24,56 +65,498 @@ def is_running(pid):
     :type pid: :class:`int`
 
     :return: :data:`True` if the process is still alive, :data:`False`
-        otherwise.
+        otherwise.  A process owned by another user, which cannot be
+        signaled by us, is also alive.
     """
     try:
         os.kill(pid, 0)
         return True
-    except OSError:
+    except OSError, ex:
+        return ex.errno == errno.EPERM
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        return clock_gettime
+    except Exception:
+        return None
+
+_clock_gettime = _load_clock_gettime()
+
+#: The ``CLOCK_MONOTONIC`` clock id on Linux.
+CLOCK_MONOTONIC = 1
+
+
+def monotonic():
+    """Get the time in seconds of a clock which never goes backwards.
+
+    Deadlines should be computed with this clock, so that they will not be
+    affected by the changes of system time.  Falls back to :func:`time.time`
+    if ``clock_gettime`` is not available.
+
+    :rtype: :class:`float`
+    """
+    if _clock_gettime is not None:
+        t = _timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) == 0:
+            return t.tv_sec + t.tv_nsec * 1e-9
+    return time.time()
+
+
+def _load_syscall():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        return libc.syscall
+    except Exception:
+        return None
+
+_syscall = _load_syscall()
+
+#: The ``ioprio_set`` syscall numbers on Linux of the known architectures.
+_IOPRIO_SET_NR = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+                  'armv7l': 314, 'ppc64le': 273}
+
+#: The I/O scheduling classes of ``ioprio_set``.
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+
+
+def set_io_priority(ioclass, level=0):
+    """Set the I/O scheduling class and priority level of the calling
+    thread (see ``ioprio_set(2)``).  Only supported on Linux.
+
+    :param ioclass: The I/O scheduling class, :data:`IOPRIO_CLASS_BE` or
+        :data:`IOPRIO_CLASS_IDLE`.
+    :type ioclass: :class:`int`
+    :param level: The priority level in the class, from 0 (highest) to 7.
+    :type level: :class:`int`
+
+    :return: :data:`True` if succeeded, :data:`False` otherwise.
+    """
+    nr = _IOPRIO_SET_NR.get(os.uname()[4])
+    if _syscall is None or nr is None:
         return False
+    # ioprio_set(IOPRIO_WHO_PROCESS, 0, IOPRIO_PRIO_VALUE(class, data))
+    return _syscall(nr, 1, 0, (ioclass << 13) | level) == 0
 
 
-def execute(cmd, timeout=None, **kwargs):
-    """Execute a command, read the output and return it back.
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class ResourceLimits(object):
+    """Kernel resource limits to be applied to a child process by
+    :func:`resource.setrlimit`.
+
+    Each limit is optional.  The limits will be inherited by all the
+    descendants of the process.
+
+    :param memory: Maximum bytes of the address space (``RLIMIT_AS``).
+    :type memory: :class:`int`
+    :param cputime: Maximum CPU seconds (``RLIMIT_CPU``).  The process
+        receives ``SIGXCPU`` when exceeded, and ``SIGKILL`` one second later.
+    :type cputime: :class:`int`
+    :param nproc: Maximum processes of the user (``RLIMIT_NPROC``).
+    :type nproc: :class:`int`
+    :param fsize: Maximum bytes of a written file (``RLIMIT_FSIZE``).
+    :type fsize: :class:`int`
+    :param nofile: Maximum open file descriptors (``RLIMIT_NOFILE``).
+    :type nofile: :class:`int`
+    """
+
+    #: Map the limit names to the resource constants.
+    RESOURCES = {
+        'memory': resource.RLIMIT_AS,
+        'cputime': resource.RLIMIT_CPU,
+        'nproc': resource.RLIMIT_NPROC,
+        'fsize': resource.RLIMIT_FSIZE,
+        'nofile': resource.RLIMIT_NOFILE,
+    }
+
+    def __init__(self, memory=None, cputime=None, nproc=None, fsize=None,
+                 nofile=None):
+        self.memory = memory
+        self.cputime = cputime
+        self.nproc = nproc
+        self.fsize = fsize
+        self.nofile = nofile
+
+    def __nonzero__(self):
+        return any(self.to_plain().itervalues())
+
+    def to_plain(self):
+        """Get the limits as a :class:`dict`, excluding unset ones."""
+        return {k: getattr(self, k) for k in self.RESOURCES
+                if getattr(self, k) is not None}
+
+    def apply(self):
+        """Apply the limits to current process.  Usually called in the
+        child process before `exec`, e.g., as `preexec_fn` of
+        :class:`subprocess.Popen`.
+        """
+        for k, v in self.to_plain().iteritems():
+            res = self.RESOURCES[k]
+            hard = v + 1 if k == 'cputime' else v
+            # unprivileged processes cannot raise the hard limit
+            cur_hard = resource.getrlimit(res)[1]
+            if cur_hard != resource.RLIM_INFINITY:
+                hard = min(hard, cur_hard)
+            resource.setrlimit(res, (min(v, hard), hard))
+
+
+def _utf8_head(data):
+    """Strip the incomplete UTF-8 sequence at the end of `data`."""
+    for i in xrange(1, min(4, len(data)) + 1):
+        c = ord(data[-i])
+        if c < 0x80:
+            break
+        if c >= 0xC0:
+            # the leading byte of a sequence, check whether it's complete
+            if c >= 0xF0:
+                need = 4
+            elif c >= 0xE0:
+                need = 3
+            else:
+                need = 2
+            if need > i:
+                return data[:-i]
+            break
+    return data
+
+
+def _utf8_tail(data):
+    """Strip the incomplete UTF-8 sequence at the beginning of `data`."""
+    for i in xrange(min(3, len(data))):
+        if not (0x80 <= ord(data[i]) < 0xC0):
+            return data[i:]
+    return data[min(3, len(data)):]
+
+
+class BoundedBuffer(object):
+    """Capture a byte stream, but only keep its head and tail.
+
+    The data between the head and the tail will be dropped, and replaced
+    by :attr:`MARKER` in :meth:`getvalue`.  If the stream is truncated,
+    the incomplete UTF-8 sequences at the boundaries will be stripped,
+    so that a valid UTF-8 stream remains valid after truncation.
+
+    :param head: Maximum bytes to keep at the beginning of the stream.
+        Keep everything if :data:`None`.
+    :type head: :class:`int`
+    :param tail: Maximum bytes to keep at the end of the stream.
+    :type tail: :class:`int`
+    """
+
+    #: The text to replace the truncated data.
+    MARKER = '\n... (%(omitted)d bytes truncated) ...\n'
+
+    def __init__(self, head=None, tail=None):
+        self.head = head
+        self.tail = tail or 0
+
+        #: The total bytes written into this buffer.
+        self.total = 0
+
+        self._head = []
+        self._head_size = 0
+        self._tail = collections.deque()
+        self._tail_size = 0
+
+    def write(self, data):
+        """Append `data` to the stream."""
+        self.total += len(data)
+        if self.head is None:
+            self._head.append(data)
+            return
+        room = self.head - self._head_size
+        if room > 0:
+            self._head.append(data[:room])
+            self._head_size += min(room, len(data))
+            data = data[room:]
+        if data and self.tail > 0:
+            self._tail.append(data)
+            self._tail_size += len(data)
+            # drop the chunks which are entirely out of the tail window
+            while self._tail_size - len(self._tail[0]) >= self.tail:
+                self._tail_size -= len(self._tail.popleft())
+
+    @property
+    def truncated(self):
+        """Whether some data has been dropped?"""
+        return self.total > self._head_size + min(self._tail_size, self.tail)\
+            if self.head is not None else False
+
+    def getvalue(self):
+        """Get the captured data, with :attr:`MARKER` inserted if it is
+        truncated."""
+        head = ''.join(self._head)
+        if not self.truncated:
+            return head + ''.join(self._tail)
+        tail = ''.join(self._tail)[-self.tail:] if self.tail > 0 else ''
+        head, tail = _utf8_head(head), _utf8_tail(tail)
+        omitted = self.total - len(head) - len(tail)
+        return head + self.MARKER % {'omitted': omitted} + tail
+
+
+class ProcessSupervisor(object):
+    """Wait for a child process, and drain its output pipes at the same time.
+
+    The supervisor blocks in :func:`select.poll` on the stdout and stderr
+    pipes of the process.  If it runs in the main thread, a ``SIGCHLD``
+    handler together with :func:`signal.set_wakeup_fd` will wake it up
+    as soon as the process exits.  Otherwise it has to check the process
+    every :attr:`TICK` seconds.
+
+    The process is reaped by :func:`os.wait4`, so that the resource usage
+    of the process (including its waited children) will be available in
+    :attr:`usage`.
+
+    :param process: The process to be supervised, whose stdout and stderr
+        should be pipes.
+    :type process: :class:`subprocess.Popen`
+    :param timeout: Kill the process after `timeout` seconds.  Wait until
+        the process exits if not given.
+    :type timeout: :class:`float`
+    :param head: Maximum bytes to keep at the beginning of each output.
+    :type head: :class:`int`
+    :param tail: Maximum bytes to keep at the end of each output.
+    :type tail: :class:`int`
+    """
+
+    #: Interval in seconds to check the process if there's no ``SIGCHLD``
+    #: wakeup.
+    TICK = 0.05
+
+    def __init__(self, process, timeout=None, head=None, tail=None):
+        self.process = process
+        self.timeout = timeout
+        self.head = head
+        self.tail = tail
+
+        #: Whether the process has been killed due to the timeout?
+        self.timed_out = False
+
+        #: The resource usage of the process after it exits, see
+        #: :func:`make_usage`.
+        self.usage = None
+
+        # the wall clock starts as soon as the supervisor is created
+        self._start_time = monotonic()
+
+        #: The :class:`BoundedBuffer` of each pipe.
+        self.buffers = {}
+
+    def get_buffer(self, fd):
+        """Get the :class:`BoundedBuffer` of the pipe `fd`."""
+        if fd not in self.buffers:
+            self.buffers[fd] = BoundedBuffer(self.head, self.tail)
+        return self.buffers[fd]
+
+    def on_output(self, fd, data):
+        """Called when `data` is read from the pipe `fd`.
+
+        :param fd: The file descriptor of the pipe.
+        :type fd: :class:`int`
+        :param data: The data read from the pipe.
+        :type data: :class:`str`
+        """
+        self.get_buffer(fd).write(data)
+
+    def _install_wakeup(self):
+        """Install the ``SIGCHLD`` wakeup, and return the pipe to poll on, or
+        :data:`None` if not possible."""
+        if not isinstance(threading.current_thread(), threading._MainThread):
+            return None
+        r, w = os.pipe()
+        _set_nonblocking(r)
+        _set_nonblocking(w)
+        old_handler = signal.signal(signal.SIGCHLD, lambda s, f: None)
+        signal.siginterrupt(signal.SIGCHLD, False)
+        old_fd = signal.set_wakeup_fd(w)
+        if old_fd != -1:
+            # someone else is using the wakeup fd, do not steal it
+            signal.set_wakeup_fd(old_fd)
+            signal.signal(signal.SIGCHLD, old_handler)
+            os.close(r)
+            os.close(w)
+            return None
+        self._wakeup = (r, w, old_handler)
+        return r
+
+    def _uninstall_wakeup(self):
+        r, w, old_handler = self._wakeup
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, old_handler)
+        os.close(r)
+        os.close(w)
+
+    def reap(self, block=False):
+        """Reap the process if it has exited, and collect its resource usage.
+
+        :param block: Whether or not to wait for the process to exit?
+        :type block: :class:`bool`
+        :return: The exit code, or :data:`None` if still running.
+        """
+        p = self.process
+        if p.returncode is not None:
+            return p.returncode
+        while True:
+            try:
+                pid, status, rusage = os.wait4(
+                    p.pid, 0 if block else os.WNOHANG)
+                break
+            except OSError, ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno == errno.ECHILD:
+                    # someone else has reaped the process
+                    return p.poll()
+                raise
+        if pid == p.pid:
+            p._handle_exitstatus(status)
+            self.usage = make_usage(rusage, monotonic() - self._start_time)
+        return p.returncode
+
+    def kill(self):
+        """Kill the process if it is still running."""
+        if self.reap() is None:
+            try:
+                os.kill(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.reap(block=True)
+
+    def wait(self):
+        """Wait for the process to exit, while draining its output pipes.
+
+        :return: The exit code of the process.
+        :raises: :class:`ProcessTimeout` if the timeout was reached, and the
+            process has been killed.
+        """
+        p = self.process
+        pipes = {}
+        for f in (p.stdout, p.stderr):
+            if f is not None:
+                pipes[f.fileno()] = f
+        poller = select.poll()
+        for fd in pipes:
+            poller.register(fd, select.POLLIN | select.POLLPRI)
+
+        self._wakeup = None
+        wakeup_fd = self._install_wakeup()
+        if wakeup_fd is not None:
+            poller.register(wakeup_fd, select.POLLIN)
+
+        deadline = monotonic() + self.timeout if self.timeout else None
+        try:
+            while True:
+                self.reap()
+                if p.returncode is not None and not pipes:
+                    break
+
+                # compute how long to block in poll
+                wait = None
+                if deadline is not None:
+                    wait = deadline - monotonic()
+                    if wait <= 0:
+                        if p.returncode is None:
+                            self.timed_out = True
+                            self.kill()
+                            raise ProcessTimeout(
+                                "Process timeout has been reached.",
+                                self.usage)
+                        # the process has exited, but its pipes are held
+                        # by orphan processes
+                        break
+                if wakeup_fd is None and p.returncode is None:
+                    wait = self.TICK if wait is None else min(wait, self.TICK)
+
+                try:
+                    events = poller.poll(
+                        -1 if wait is None else int(wait * 1000) + 1)
+                except select.error, ex:
+                    if ex.args[0] == errno.EINTR:
+                        continue
+                    raise
+
+                for fd, _ in events:
+                    if fd == wakeup_fd:
+                        try:
+                            os.read(wakeup_fd, 512)
+                        except OSError:
+                            pass
+                        continue
+                    data = os.read(fd, 65536)
+                    if data:
+                        self.on_output(fd, data)
+                    else:
+                        poller.unregister(fd)
+                        del pipes[fd]
+        finally:
+            if self._wakeup is not None:
+                self._uninstall_wakeup()
+            for f in (p.stdout, p.stderr):
+                if f is not None:
+                    f.close()
+
+        return p.returncode
+
+
+def capture(cmd, timeout=None, head=None, tail=None, **kwargs):
+    """Execute a command, and capture the head and tail of its output.
 
     :param cmd: Command to execute.
     :type cmd: :class:`str`
-    :param timeout: Process timeout in seconds.
-    :type timeout: :class:`int`
+    :param timeout: Process timeout in seconds, may be fractional.
+    :type timeout: :class:`float`
+    :param head: Maximum bytes to keep at the beginning of each output.
+        Keep everything if :data:`None`.
+    :type head: :class:`int`
+    :param tail: Maximum bytes to keep at the end of each output.
+    :type tail: :class:`int`
     :param kwargs: Named arguments for `subprocess.Popen`.
-    :return: (stdout, stderr, exit code)
+    :return: (exit code, stdout, stderr, usage), where stdout and stderr
+        are :class:`BoundedBuffer` objects, and usage is the resource usage
+        from :func:`make_usage`.
     :rtype: :class:`tuple`
 
     :raises: :class:`OSError` on missing command or any other OS errors.
     :raises: :class:`ProcessTimeout` if a timeout was reached.
     """
-
-    ph_out = None   # process output
-    ph_err = None   # stderr
-    ph_ret = None   # return code
-
     p = subprocess.Popen(cmd, shell=True,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE,
                          **kwargs)
-    # if timeout is not set wait for process to complete
-    if not timeout:
-        ph_ret = p.wait()
-    else:
-        fin_time = math.ceil(time.time() + timeout)
-        while p.poll() is None and fin_time > time.time():
-            time.sleep(1)
-
-        # if timeout reached, raise an exception
-        if fin_time < time.time():
-
-            # starting 2.6 subprocess has a kill() method which is preferable
-            # p.kill()
-            if is_running(p.pid):
-                os.kill(p.pid, signal.SIGKILL)
-                raise ProcessTimeout("Process timeout has been reached.")
-
-        ph_ret = p.returncode
-
-    ph_out, ph_err = p.communicate()
-    return (ph_ret, ph_out, ph_err)
+    out_fd, err_fd = p.stdout.fileno(), p.stderr.fileno()
+    supervisor = ProcessSupervisor(p, timeout, head, tail)
+    ret = supervisor.wait()
+    return (ret, supervisor.get_buffer(out_fd), supervisor.get_buffer(err_fd),
+            supervisor.usage)
+
+
+def execute(cmd, timeout=None, **kwargs):
+    """Execute a command, read the output and return it back.
+
+    :param cmd: Command to execute.
+    :type cmd: :class:`str`
+    :param timeout: Process timeout in seconds, may be fractional.
+    :type timeout: :class:`float`
+    :param kwargs: Named arguments for `subprocess.Popen`.
+    :return: (exit code, stdout, stderr)
+    :rtype: :class:`tuple`
+
+    :raises: :class:`OSError` on missing command or any other OS errors.
+    :raises: :class:`ProcessTimeout` if a timeout was reached.
+    """
+    ret, out, err, _ = capture(cmd, timeout, **kwargs)
+    return (ret, out.getvalue(), err.getvalue())
@@ -10,7 +10,7 @@ import uuid
 import config
 import shutil
 
-from .fileutil import remove_firstdir
+from .fileutil import remove_firstdir, ArchiveLimitExceeded
 
 
 class TempDir(object):
@@ -26,11 +26,19 @@ class TempDir(object):
             with open(fpath, 'wb') as f:
                 f.write('hello, world!')
 
+    If the owner of the files is known before they are written, you may
+    call :meth:`set_owner` first, so that each directory and file will be
+    created with its final owner and mode, instead of walking through the
+    whole tree by :meth:`chown` and :meth:`chmod` afterwards.
+
     :param name: The name of this temporary directory.  If not given,
         it will generate a randomized name by ``uuid.uuid4().get_hex()``.
     :type name: :class:`str`
     """
 
+    #: The buffer size to copy the extracted files.
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(self, name=None):
         #: Hold the name of this temporary directory.
         self.name = name if name else uuid.uuid4().get_hex()
@@ -38,6 +46,10 @@ class TempDir(object):
         #: Hold the path of this temporary directory.
         self.path = os.path.join(config.TEMPORARY_DIR, self.name)
 
+        #: The (uid, gid) of new directories and files, or :data:`None` to
+        #: keep the owner of current process.  (See :meth:`set_owner`.)
+        self.owner = None
+
     def open(self, mode=0700):
         """Create the temporary directory.
 
@@ -58,6 +70,75 @@ class TempDir(object):
         if os.path.isdir(self.path):
             shutil.rmtree(self.path)
 
+    def set_owner(self, uid, gid):
+        """Change the owner of this directory, and let all the directories
+        and files created by this object from now on have the same owner.
+
+        :param uid: The owner user id.
+        :type uid: :class:`int`
+        :param gid: The owner group id.
+        :type gid: :class:`int`
+        """
+        os.chown(self.path, uid, gid)
+        self.owner = (uid, gid)
+
+    def makedirs(self, dpath, mode=0700):
+        """Create a directory and all its missing parents under this
+        directory, with :attr:`owner` and `mode`.
+
+        :param dpath: The full path of the directory.
+        :type dpath: :class:`str`
+        :param mode: Unix file system mode for new directories.
+        :type mode: :class:`int`
+        """
+        if os.path.isdir(dpath):
+            return
+        parent_path = os.path.dirname(dpath)
+        if parent_path != self.path:
+            self.makedirs(parent_path, mode)
+        os.mkdir(dpath)
+        self.claim(dpath, mode)
+
+    def claim(self, fpath, mode=0700):
+        """Give a new directory or file under this directory the
+        :attr:`owner` and `mode`.  Used for the files created by other
+        utilities.
+
+        :param fpath: The full path of the directory or file.
+        :type fpath: :class:`str`
+        :param mode: Unix file system mode.
+        :type mode: :class:`int`
+        """
+        if self.owner:
+            os.lchown(fpath, self.owner[0], self.owner[1])
+        os.chmod(fpath, mode)
+
+    def create(self, fpath, mode=0700):
+        """Create a new file under this directory with :attr:`owner` and
+        `mode`, and open it for writing.
+
+        The existing file may be linked to a shared template, so it will be
+        replaced instead of written into.  The parent directory should have
+        been created by :meth:`makedirs`.
+
+        :param fpath: The full path of the file.
+        :type fpath: :class:`str`
+        :param mode: Unix file system mode for the new file.
+        :type mode: :class:`int`
+        :return: The file object opened in ``wb`` mode.
+        """
+        if os.path.lexists(fpath):
+            os.remove(fpath)
+        fd = os.open(fpath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        try:
+            if self.owner:
+                os.fchown(fd, self.owner[0], self.owner[1])
+            os.fchmod(fd, mode)
+            return os.fdopen(fd, 'wb')
+        except Exception:
+            os.close(fd)
+            raise
+
     def fullpath(self, subpath):
         """Get the fullpath for child entity.
 
@@ -92,18 +173,24 @@ class TempDir(object):
                 parent_path = os.path.dirname(dstpath)
 
                 # Create the container directory for this file if necessary
-                if not os.path.isdir(parent_path):
-                    os.makedirs(parent_path, mode)
+                self.makedirs(parent_path, mode)
 
-                # Copy the file and set the mode
-                shutil.copyfile(srcpath, dstpath)
-                os.chmod(dstpath, mode)
+                # Copy the file into a new file with the owner and mode
+                with open(srcpath, 'rb') as fsrc:
+                    with self.create(dstpath, mode) as fdst:
+                        shutil.copyfileobj(fsrc, fdst)
 
-    def extract(self, extractor, should_skip=None, mode=0700):
+    def extract(self, extractor, should_skip=None, mode=0700,
+                max_file_size=None, max_total_size=None):
         """Extract files into this directory.
 
+        The files are copied through a buffer of :attr:`CHUNK_SIZE` bytes,
+        so the memory used does not grow with the sizes of the files.  The
+        copied bytes are counted against the limits, since the sizes
+        declared by the archive may be forged.
+
         :param extractor: An extractor object.
-        :type extractor: :class:`railgun.common.fsutil.Extractor`
+        :type extractor: :class:`railgun.common.fileutil.Extractor`
         :param should_skip: A callback to determine whether a given file
             should be skipped.
         :type should_skip: method(fpath) -> bool
@@ -111,11 +198,20 @@ class TempDir(object):
             This parameter will not affect existing directories.  Call
             `chown` to ensure it.
         :type mode: :class:`int`
+        :param max_file_size: The maximum bytes of an extracted file.
+        :type max_file_size: :class:`int`
+        :param max_total_size: The maximum bytes of all extracted files.
+        :type max_total_size: :class:`int`
+
+        :return: The total bytes of extracted files.
+        :raises: :class:`~railgun.common.fileutil.ArchiveLimitExceeded` if
+            any of the limits is exceeded.  The extracted files are left.
         """
         # check the arguments
         should_skip = should_skip or (lambda p: False)
         canonical_path = remove_firstdir \
             if extractor.onedir() else (lambda p: p)
+        total = 0
 
         for fname, fobj in extractor.extract():
             fpath = canonical_path(fname)
@@ -126,15 +222,27 @@ class TempDir(object):
                 continue
 
             # create the parent directory if not exist
-            parent_path = os.path.dirname(dstpath)
-            if not os.path.isdir(parent_path):
-                os.makedirs(parent_path, mode)
-
-            with open(dstpath, 'wb') as f:
-                f.write(fobj.read())
-            os.chmod(dstpath, mode)
-
-    def chown(self, uid, gid=None, recursive=False):
+            self.makedirs(os.path.dirname(dstpath), mode)
+
+            # the existing file may be linked to a shared template, so
+            # `create` replaces it instead of writing into it
+            with self.create(dstpath, mode) as f:
+                size = 0
+                while True:
+                    buf = fobj.read(self.CHUNK_SIZE)
+                    if not buf:
+                        break
+                    size += len(buf)
+                    total += len(buf)
+                    if max_file_size is not None and size > max_file_size:
+                        raise ArchiveLimitExceeded('file_size')
+                    if max_total_size is not None and total > max_total_size:
+                        raise ArchiveLimitExceeded('total_size')
+                    f.write(buf)
+
+        return total
+
+    def chown(self, uid, gid=None, recursive=False, skip=None):
         """Change the owner uid and gid of this directory.
 
         :param uid: Name or id of owner user.
@@ -144,30 +252,42 @@ class TempDir(object):
         :type uid: :class:`str` or :class:`int`
         :param recursive: Whether or not to chown all children?
         :type recursive: :class:`bool`
+        :param skip: A callback to determine whether the given file (full
+            path) should be left untouched in recursive mode.
+        :type skip: method(fpath) -> bool
         """
         if gid is None:
             gid = os.stat(self.path).st_gid
         if recursive:
+            skip = skip or (lambda p: False)
             for dpath, _, fnames in os.walk(self.path):
                 os.chown(dpath, uid, gid)
                 for fn in fnames:
-                    os.chown(os.path.join(dpath, fn), uid, gid)
+                    fpath = os.path.join(dpath, fn)
+                    if not skip(fpath):
+                        os.chown(fpath, uid, gid)
         else:
             os.chown(self.path, uid, gid)
 
-    def chmod(self, mode, recursive=False):
+    def chmod(self, mode, recursive=False, skip=None):
         """Change the Unix file system mode of this directory.
 
         :param mode: File system mode number.
         :type mode: :class:`int`
         :param recursive: Whether or not to chmod all children?
         :type recursive: :class:`bool`
+        :param skip: A callback to determine whether the given file (full
+            path) should be left untouched in recursive mode.
+        :type skip: method(fpath) -> bool
         """
         if recursive:
+            skip = skip or (lambda p: False)
             for dpath, _, fnames in os.walk(self.path):
                 os.chmod(dpath, mode)
                 for fn in fnames:
-                    os.chmod(os.path.join(dpath, fn), mode)
+                    fpath = os.path.join(dpath, fn)
+                    if not skip(fpath):
+                        os.chmod(fpath, mode)
         else:
             os.chmod(self.path, mode)
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/maintain/dbschema.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from .base import Task, tasks
+
+
+def make_upgrade_sql(engine, metadata):
+    """Make the SQL commands to add the columns (and their indexes) which
+    are defined in `metadata` but missing in the existing tables.
+
+    `db.create_all()` only creates the missing tables, so the columns added
+    to the existing models must be added by these commands.
+
+    :param engine: The database engine.
+    :type engine: :class:`sqlalchemy.engine.Engine`
+    :param metadata: The metadata of all the models.
+    :type metadata: :class:`sqlalchemy.MetaData`
+
+    :return: :class:`list` of SQL commands.
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    ret = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = set(c['name'] for c in inspector.get_columns(table.name))
+        missing = [c for c in table.columns if c.name not in columns]
+        for c in missing:
+            ret.append('ALTER TABLE %s ADD COLUMN %s' % (
+                table.name, CreateColumn(c).compile(dialect=engine.dialect)))
+        missing = set(c.name for c in missing)
+        for idx in table.indexes:
+            if any(c.name in missing for c in idx.columns):
+                ret.append(str(CreateIndex(idx).compile(
+                    dialect=engine.dialect)).strip())
+    return ret
+
+
+class DbUpgradeTask(Task):
+    """Task to add the missing columns of existing database tables."""
+
+    def execute(self, apply=False):
+        """Log the SQL commands to upgrade the database, and run them if
+        `apply` is :data:`True`.
+        """
+        # Import the models, so that the new tables will be created.
+        from railgun.website.models import db
+
+        try:
+            commands = make_upgrade_sql(db.engine, db.metadata)
+            if not commands:
+                self.logger.info('The database is up to date.')
+                return
+            for sql in commands:
+                self.logger.info('%s;' % sql)
+                if apply:
+                    db.engine.execute(sql)
+            if apply:
+                self.logger.info('%d command(s) executed.' % len(commands))
+        except Exception:
+            self.logger.exception('Upgrade database failed.')
+
+
+tasks.add('dbupgrade', DbUpgradeTask)
@@ -5,5 +5,6 @@
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # This file is released under BSD 2-clause license.
 
-from . import (apiclient, context, errors, handin, host, hw, permcheck,
-               runconfig, tasks)
+from . import (apiclient, autoscale, context, errors, handin, host, hw,
+               metrics, outbox, permcheck, reaper, resultcache, runconfig,
+               scheduler, supervisor, tasks, template, zygote)
@@ -8,20 +8,61 @@
 import os
 import json
 import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
+from railgun.common.blobstore import BlobNotFound
 from railgun.common.crypto import EncryptMessage
 from railgun.common.hw import HwScore
 from . import runconfig
+from .outbox import Outbox, OutboxSender
+from .resultcache import put_memo
+
+# The cached secret keys, path -> key.
+_comm_keys = {}
 
 
 def get_comm_key():
     """Load the secret key from ``keys/commKey.txt``.
 
+    The key is read from disk only once in each process.
+
     :return: The secret key to encrypt and decrypt API post data.
     """
     path = os.path.join(runconfig.RAILGUN_ROOT, 'keys/commKey.txt')
-    with open(path, 'rb') as f:
-        return f.read().strip()
+    if path not in _comm_keys:
+        with open(path, 'rb') as f:
+            _comm_keys[path] = f.read().strip()
+    return _comm_keys[path]
+
+
+def make_session():
+    """Create a :class:`requests.Session` with keep-alive connection pool
+    and bounded retries.
+
+    The failed connections and the responses of ``502``, ``503`` and
+    ``504`` will be retried for ``config.RUNNER_API_RETRIES`` times,
+    with an exponential backoff of ``config.RUNNER_API_BACKOFF`` seconds.
+
+    :return: The new session object.
+    """
+    kwargs = {
+        'total': runconfig.RUNNER_API_RETRIES,
+        'backoff_factor': runconfig.RUNNER_API_BACKOFF,
+        'status_forcelist': (502, 503, 504),
+        'raise_on_status': False,
+    }
+    # The API requests are all POST, which are not retried by default.
+    try:
+        retry = Retry(allowed_methods=False, **kwargs)
+    except TypeError:
+        retry = Retry(method_whitelist=False, **kwargs)
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 class ApiClient(object):
@@ -31,6 +72,10 @@ class ApiClient(object):
     submissions via website api.
     Refer to :ref:`design_webapi` for more details.
 
+    Each client holds a keep-alive HTTP session, so the runner queue should
+    use the process-wide client from :func:`get_client` instead of creating
+    new ones.
+
     :param baseurl: The base url of website api.
     :type baseurl: :class:`str`
     """
@@ -40,40 +85,196 @@ class ApiClient(object):
         self.baseurl = baseurl.rstrip('/')
         #: Store the secret communication key.
         self.key = get_comm_key()
+        #: The :class:`requests.Session` from :func:`make_session`.
+        self.session = make_session()
+        #: The pending messages in batching mode, or :data:`None` if the
+        #: client is not batching.  See :meth:`batch`.
+        self._batch = None
+        #: The :class:`~railgun.runner.outbox.Outbox` to store the messages,
+        #: or :data:`None` if the messages should be sent immediately.
+        #: See :meth:`use_outbox`.
+        self.outbox = None
+        #: The :class:`~railgun.runner.outbox.OutboxSender` thread.
+        self.sender = None
 
     def _get_url(self, action):
         return '%s%s' % (self.baseurl, action)
 
-    def post(self, action, payload):
+    def post(self, action, payload, stream=False):
         """Send `payload` to remote server and execute given `action`.
 
         :param action: The url of the performing action.
         :type action: :class:`str`
         :param payload: The plain object to be sent.
         :type payload: :class:`object`
+        :param stream: Whether to read the response content lazily?
+        :type stream: :class:`bool`
 
         :return: The :class:`requests.Response` object.
         """
 
         payload = EncryptMessage(json.dumps(payload), self.key)
-        return requests.post(
+        return self.session.post(
             self._get_url(action),
             data=payload,
             headers={'Content-Type': 'application/octet-stream'},
-            verify=False
+            verify=False,
+            stream=stream,
+            timeout=(runconfig.RUNNER_API_CONNECT_TIMEOUT,
+                     runconfig.RUNNER_API_READ_TIMEOUT)
         )
 
-    def report(self, handid, hwscore):
+    def fetch_blob(self, digest):
+        """Download an uploaded file from the website.
+
+        :param digest: The SHA-256 digest of the file.
+        :type digest: :class:`str`
+        :return: The file object to read the content.
+        :raises: :class:`~railgun.common.blobstore.BlobNotFound` if the
+            website does not have this file.
+        """
+        resp = self.post('/blob/', payload={'digest': digest}, stream=True)
+        if resp.status_code == 404:
+            resp.close()
+            raise BlobNotFound(digest)
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        return resp.raw
+
+    def use_outbox(self, path):
+        """Store the messages into a durable outbox at `path`, and send
+        them in a background thread, instead of sending them immediately.
+
+        :param path: The path of the outbox database.
+        :type path: :class:`str`
+        """
+        self.outbox = Outbox(path)
+        self.sender = OutboxSender(self.outbox, self)
+        self.sender.start()
+
+    def _send(self, action, handid, obj, memo=None):
+        """Post the handin message `obj`, or queue it in batching mode.
+
+        In batching mode, a later process log of the same submission will
+        replace the earlier one, while the duplicated state transitions and
+        reports will be discarded, since the website would reject them
+        anyway.
+
+        The `memo` is kept with the message, and stored into the result
+        cache once the website has accepted the message.
+        """
+        message = {'action': action, 'uuid': handid, 'payload': obj}
+        if memo is not None:
+            message['memo'] = memo
+        if self._batch is None:
+            if self.outbox is not None:
+                self._put([message])
+            else:
+                resp = self.post('/handin/%s/%s/' % (action, handid),
+                                 payload=obj)
+                self._accepted(message, resp)
+            return
+        for i, m in enumerate(self._batch):
+            if m['action'] == action and m['uuid'] == handid:
+                if action == 'proclog':
+                    self._batch[i] = message
+                return
+        self._batch.append(message)
+
+    def _put(self, messages):
+        self.outbox.put(messages)
+        self.sender.wake()
+
+    def _accepted(self, message, resp):
+        # Memoize the result carried by `message`, if the website has
+        # accepted it with the response `resp`.
+        if message.get('memo') is not None and resp.status_code == 200 and \
+                resp.text == 'OK':
+            put_memo(message['memo'], message['payload'])
+
+    def post_batch(self, messages):
+        """Send `messages` via a single ``/handin/batch/`` request.
+
+        If the website does not provide the batch api, the messages will
+        be sent one by one instead.
+
+        :param messages: A :class:`list` of ``{"action": ..., "uuid": ...,
+            "payload": ...}`` messages, optionally with unique `msgid` so
+            that the website can discard the duplicated ones, and the `memo`
+            to be stored once the message is accepted (see :meth:`report`).
+        :raises: :class:`requests.RequestException` if the messages were not
+            stored by the website.
+        """
+        # The memos are kept by the runner.
+        payload = [dict((k, v) for k, v in m.iteritems() if k != 'memo')
+                   for m in messages]
+        resp = self.post('/handin/batch/', payload={'messages': payload})
+        if resp.status_code == 404:
+            for m in messages:
+                r = self.post('/handin/%s/%s/' % (m['action'], m['uuid']),
+                              payload=m['payload'])
+                r.raise_for_status()
+                self._accepted(m, r)
+            return
+        resp.raise_for_status()
+        results = resp.json()
+        if 'update database failed' in results:
+            raise requests.RequestException('Website database failure.')
+        for m, result in zip(messages, results):
+            if m.get('memo') is not None and result == 'OK':
+                put_memo(m['memo'], m['payload'])
+
+    def flush(self):
+        """Send all the pending messages in batching mode, or store them
+        into the outbox if :attr:`outbox` is set."""
+        messages, self._batch = self._batch, []
+        if not messages:
+            return
+        if self.outbox is not None:
+            self._put(messages)
+        else:
+            self.post_batch(messages)
+
+    @contextmanager
+    def batch(self):
+        """Enter the batching mode, so that the messages sent by
+        :meth:`report`, :meth:`start` and :meth:`proclog` are coalesced
+        and sent together when leaving the context::
+
+            with api.batch():
+                api.report(handid, score)
+                api.proclog(handid, exitcode, stdout, stderr)
+
+        The nested contexts are merged into the outermost one.  The pending
+        messages are sent even if an exception is raised in the context.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        finally:
+            try:
+                self.flush()
+            finally:
+                self._batch = None
+
+    def report(self, handid, hwscore, memo=None):
         """Send the score of given submission.
 
         :param handid: The uuid of the submission.
         :type handid: :class:`str`
         :param hwscore: The score object.
         :type hwscore: :class:`~railgun.common.hw.HwScore`
+        :param memo: The pending result of the submission, which will be
+            memoized with this score once the website has accepted it.
+            See :attr:`~railgun.runner.handin.BaseHandin.memo`.
+        :type memo: :class:`dict`
         """
         obj = hwscore.to_plain()
         obj['uuid'] = handid
-        self.post('/handin/report/%s/' % handid, payload=obj)
+        self._send('report', handid, obj, memo)
 
     def start(self, handid):
         """Change the status of submission to `Running`.
@@ -82,9 +283,9 @@ class ApiClient(object):
         :type handid: :class:`str`
         """
         obj = {'uuid': handid}
-        self.post('/handin/start/%s/' % handid, payload=obj)
+        self._send('start', handid, obj)
 
-    def proclog(self, handid, exitcode, stdout, stderr):
+    def proclog(self, handid, exitcode, stdout, stderr, stats=None):
         """Store the process exitcode, standard output and standard error
         output of the submission.
 
@@ -96,10 +297,38 @@ class ApiClient(object):
         :type stdout: :class:`str`
         :param stderr: The standard error output of the process.
         :type stderr: :class:`str`
+        :param stats: The statistics of the process (output sizes and
+            resource usage), see :attr:`~railgun.runner.host.BaseHost.stats`.
+        :type stats: :class:`dict`
         """
         obj = {'uuid': handid, 'exitcode': exitcode, 'stdout': stdout,
-               'stderr': stderr}
-        self.post('/handin/proclog/%s/' % handid, payload=obj)
+               'stderr': stderr, 'stats': stats or {}}
+        self._send('proclog', handid, obj)
+
+
+# The process-wide client, and the process id which creates it.
+_client = None
+_client_pid = None
+
+
+def get_client():
+    """Get the process-wide :class:`ApiClient` of the runner queue.
+
+    A new client will be created after the worker process is forked, since
+    the connections in the session must not be shared between processes.
+    If ``config.RUNNER_API_OUTBOX`` is enabled, the client will store the
+    messages into the durable outbox shared by all runner processes.
+
+    :return: The :class:`ApiClient` object.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = ApiClient(runconfig.WEBSITE_API_BASEURL)
+        _client_pid = os.getpid()
+        if runconfig.RUNNER_API_OUTBOX:
+            _client.use_outbox(os.path.join(
+                runconfig.TEMPORARY_DIR, '.outbox/outbox.db'))
+    return _client
 
 
 def report_error(handid, err):
@@ -110,9 +339,8 @@ def report_error(handid, err):
     :param err: A runner error object holding the error message.
     :type err: :class:`~railgun.runner.errors.RunnerError`
     """
-    api = ApiClient(runconfig.WEBSITE_API_BASEURL)
     score = HwScore(False, result=err.message, compile_error=err.compile_error)
-    api.report(handid, score)
+    get_client().report(handid, score)
 
 
 def report_start(handid):
@@ -121,5 +349,4 @@ def report_start(handid):
     :param handid: The uuid of the submission.
     :type handid: :class:`str`
     """
-    api = ApiClient(runconfig.WEBSITE_API_BASEURL)
-    api.start(handid)
+    get_client().start(handid)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/autoscale.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the autoscaler of runner workers.
+
+The default :class:`~celery.worker.autoscale.Autoscaler` of Celery only
+counts the tasks prefetched by the worker itself, which are at most a few
+times of its current concurrency, so the worker grows slowly when thousands
+of submissions arrive before a deadline.  It also does not care about other
+workers on the same machine.
+
+:class:`LoadAwareAutoscaler` is installed by ``CELERYD_AUTOSCALER`` in
+:mod:`~railgun.runner.runconfig`, and takes effect when the worker is
+started with ``--autoscale`` (see :mod:`railgun.runner.supervisor`).  It
+grows the worker towards the number of tasks waiting in the broker queues
+consumed by this worker, but stops growing while the load average per CPU
+is above ``config.RUNNER_AUTOSCALE_MAX_LOAD``.
+"""
+
+import os
+import multiprocessing
+
+import redis
+from celery.worker.autoscale import Autoscaler
+
+from . import runconfig
+from .context import logger
+
+
+def host_load():
+    """Get the 1-minute load average per CPU of this machine.
+
+    :return: The load, or :data:`None` if not available.
+    """
+    try:
+        return os.getloadavg()[0] / multiprocessing.cpu_count()
+    except (OSError, NotImplementedError):
+        return None
+
+
+class LoadAwareAutoscaler(Autoscaler):
+    """The autoscaler which considers the broker queue depth and the host
+    load.  See the module documentation for more details.
+    """
+
+    # The Redis client to the broker, or :data:`False` if the broker is not
+    # a Redis server.
+    _broker = None
+
+    def queue_depth(self):
+        """Get the number of tasks waiting in the broker queues consumed by
+        this worker.
+
+        :return: The number of tasks, or 0 if the broker is not a Redis
+            server or is not reachable.
+        """
+        if self._broker is None:
+            url = runconfig.BROKER_URL
+            self._broker = url.startswith('redis://') and \
+                redis.StrictRedis.from_url(url)
+        if not self._broker:
+            return 0
+        try:
+            queues = list(self.worker.app.amqp.queues.consume_from)
+            # The Redis transport of Celery stores each queue as a list
+            # named after the queue itself.
+            return sum(self._broker.llen(q) for q in queues)
+        except Exception:
+            logger.debug('Could not get the depth of broker queues.',
+                         exc_info=1)
+            return 0
+
+    @property
+    def qty(self):
+        reserved = super(LoadAwareAutoscaler, self).qty
+        wanted = reserved + self.queue_depth()
+        load = host_load()
+        if load is not None and load > runconfig.RUNNER_AUTOSCALE_MAX_LOAD:
+            # Keep the current processes busy, but do not grow any more.
+            wanted = min(wanted, self.processes)
+        return wanted
@@ -101,3 +101,27 @@ def release_online_user(user):
     """
     if runconfig.ONLINE_USER_HOST:
         _put(runconfig.ONLINE_USER_HOST, user)
+
+
+def count_offline_users():
+    """Get the number of offline system accounts.
+
+    :return: The number of accounts in the credential server, or
+        :data:`None` if no credential server is configured.
+    :raises: Various :class:`Exception` if the server is not reachable.
+    """
+    if runconfig.OFFLINE_USER_HOST:
+        host = runconfig.OFFLINE_USER_HOST
+        return UserHostClient(host[0], host[1]).size()
+
+
+def count_online_users():
+    """Get the number of online system accounts.
+
+    :return: The number of accounts in the credential server, or
+        :data:`None` if no credential server is configured.
+    :raises: Various :class:`Exception` if the server is not reachable.
+    """
+    if runconfig.ONLINE_USER_HOST:
+        host = runconfig.ONLINE_USER_HOST
+        return UserHostClient(host[0], host[1]).size()
@@ -106,6 +106,40 @@ class ArchiveContainTooManyFileError(RunnerError):
         ), **kwargs)
 
 
+class ArchiveFileTooLargeError(RunnerError):
+    """The submission archive contains a file larger than
+    ``config.MAX_SUBMISSION_FILE_SIZE`` after extraction.
+    """
+
+    def __init__(self, **kwargs):
+        super(ArchiveFileTooLargeError, self).__init__(lazy_gettext(
+            "Archive contains too large files."
+        ), **kwargs)
+
+
+class ArchiveTooLargeError(RunnerError):
+    """The files in the submission archive are larger than
+    ``config.MAX_SUBMISSION_TOTAL_SIZE`` in total after extraction.
+    """
+
+    def __init__(self, **kwargs):
+        super(ArchiveTooLargeError, self).__init__(lazy_gettext(
+            "Archive is too large after extraction."
+        ), **kwargs)
+
+
+class ArchiveCompressRatioError(RunnerError):
+    """The submission archive is compressed more than
+    ``config.MAX_SUBMISSION_COMPRESS_RATIO``, which is likely to be an
+    archive bomb.
+    """
+
+    def __init__(self, **kwargs):
+        super(ArchiveCompressRatioError, self).__init__(lazy_gettext(
+            "Archive is compressed too much."
+        ), **kwargs)
+
+
 class LanguageNotSupportError(RunnerError):
     """The submission language doesn't belong to corresponding homework.
 
@@ -156,6 +190,47 @@ class RunnerTimeout(RunnerError):
         ), **kwargs)
 
 
+class ResourceLimitExceeded(RunnerError):
+    """The submission has exceeded one of the kernel resource limits
+    declared in `code.xml`.  Derived classes tell which limit.
+
+    You may refer to :meth:`~railgun.runner.host.BaseHost.check_limits`
+    to see how the limits are detected.
+    """
+
+    def __init__(self, message=None, **kwargs):
+        super(ResourceLimitExceeded, self).__init__(message or lazy_gettext(
+            'Your submission has exceeded the resource limits.'
+        ), **kwargs)
+
+
+class CpuTimeLimitExceeded(ResourceLimitExceeded):
+    """The submission has used up its CPU time."""
+
+    def __init__(self, **kwargs):
+        super(CpuTimeLimitExceeded, self).__init__(lazy_gettext(
+            'Your submission has run out of CPU time.'
+        ), **kwargs)
+
+
+class MemoryLimitExceeded(ResourceLimitExceeded):
+    """The submission has exceeded the memory limit."""
+
+    def __init__(self, **kwargs):
+        super(MemoryLimitExceeded, self).__init__(lazy_gettext(
+            'Your submission has exceeded the memory limit.'
+        ), **kwargs)
+
+
+class FileSizeLimitExceeded(ResourceLimitExceeded):
+    """The submission has written a file that is too large."""
+
+    def __init__(self, **kwargs):
+        super(FileSizeLimitExceeded, self).__init__(lazy_gettext(
+            'Your submission has written a file that is too large.'
+        ), **kwargs)
+
+
 class NonUTF8OutputError(RunnerError):
     """The runner host produces invalid UTF-8 sequence.
     You should tell the students to encode their source code in UTF-8.
@@ -17,56 +17,46 @@ the csv data), and prepares for the runner host.
 
 import os
 import base64
+import hashlib
+from contextlib import contextmanager
+from cStringIO import StringIO
 
 from . import runconfig
+from .apiclient import get_client
+from .context import logger
 from .hw import homeworks
 from .errors import (InternalServerError, LanguageNotSupportError,
                      ExtractFileFailure)
 from .host import PythonHost, NetApiHost, InputClassHost
+from .resultcache import get_result_cache, is_deterministic, make_key
+from railgun.common.blobstore import FileBlobStore, HttpBlobStore
 from railgun.common.fileutil import Extractor
+from railgun.common.hw import HwScore
 
+# The blob store of uploaded files, created on first use.
+_blob_store = None
 
-class TempDiskUploadFile(object):
-    """Decode base64 file content and save to disk as a temporary file.
 
-    The file will be placed under ``config.TEMPORARY_DIR``.  If you manage
-    the :class:`TempDiskUploadFile` via ``with`` statement, then the file
-    will be removed automatically.  For example::
+def get_blob_store():
+    """Get the :class:`~railgun.common.blobstore.BlobStore` to read the
+    uploaded files, according to ``config.RUNNER_BLOB_STORE``.
 
-        with TempDiskUploadFile(upload, '%s.zip' % uuid) as tempFile:
-            os.system('7z x "%s"' % tempeFile.path)
-
-    :param upload: The base64 encoded file content.
-    :type upload: :class:`str`
-    :param fname: The temporary file name.  If the chosen file name exists,
-        it will be overwritten.
-    :type fname: :class:`str`
-    :param ignore_error: A :class:`bool` indicating whether we should ignore
-        system exceptions when we are trying to delete the temporary file?
-    :type ignore_error: :class:`bool`
+    :return: The blob store object.
     """
-
-    def __init__(self, upload, fname, ignore_error=False):
-        #: Store the full path of this temporary file.
-        self.path = os.path.join(runconfig.TEMPORARY_DIR, fname)
-        #: The original base64 encoded file content.
-        self.upload = upload
-        #: Whether we should ignore the system exceptions when we are trying
-        #: to delete the temporary file?
-        self.ignore_error = ignore_error
-
-    def __enter__(self):
-        with open(self.path, 'wb') as f:
-            f.write(base64.b64decode(self.upload))
-        return self
-
-    def __exit__(self, ignore1, ignore2, ignore3):
-        try:
-            if os.path.isfile(self.path):
-                os.remove(self.path)
-        except Exception:
-            if not self.ignore_error:
-                raise
+    global _blob_store
+    if _blob_store is None:
+        if runconfig.RUNNER_BLOB_STORE == 'http':
+            _blob_store = HttpBlobStore(
+                lambda digest: get_client().fetch_blob(digest),
+                os.path.join(runconfig.TEMPORARY_DIR, '.blobs')
+            )
+        else:
+            # The compressed blobs are decompressed into our own directory.
+            _blob_store = FileBlobStore(
+                runconfig.BLOB_STORE_DIR,
+                cache_dir=os.path.join(runconfig.TEMPORARY_DIR, '.blobs')
+            )
+    return _blob_store
 
 
 class BaseHandin(object):
@@ -109,6 +99,90 @@ class BaseHandin(object):
         self.upload = upload
         #: The extra options of this submission.
         self.options = options
+        #: The statistics of the submission process, taken from
+        #: :attr:`~railgun.runner.host.BaseHost.stats`.
+        self.stats = {}
+        #: The :class:`~railgun.common.hw.HwScore` of this submission taken
+        #: from the sandbox (see :meth:`open_host`) or memoized (see
+        #: :meth:`memoize`), which should be reported by the runner.
+        self.score = None
+        #: The pending result of this submission to be memoized, which is
+        #: sent along with :attr:`score` and stored only after the website
+        #: has accepted the score.  See :meth:`memoize`.
+        self.memo = None
+        #: The file manifest of the homework code package validated for this
+        #: submission, which is shared with the host.  See :meth:`memoize`.
+        self.manifest = None
+
+    def memoize(self, run, *parts):
+        """Run the submission by `run`, unless the homework is deterministic
+        and the result of the same submission content has been memoized in
+        the :class:`~railgun.runner.resultcache.ResultCache`.
+
+        :param run: Method to run the submission.
+        :type run: method() -> (exitcode, stdout, stderr)
+        :param parts: The digest of the submission content, and any other
+            attributes of the submission that may affect the result.
+        :return: A :class:`tuple` of (`exitcode`, `stdout`, `stderr`).
+        """
+        cache = get_result_cache()
+        hwcode = self.hw.get_code(self.lang)
+        if cache is None or not is_deterministic(hwcode):
+            return run()
+
+        # The manifest is validated only once, and then shared by the host.
+        self.manifest = hwcode.get_manifest()
+        key = make_key(self.hw, hwcode, self.manifest, *parts)
+        try:
+            result = cache.get(key)
+        except Exception:
+            logger.exception('Cannot read the result cache.')
+            return run()
+        if result is not None:
+            logger.info(
+                'Submission[%(handid)s] of hw[%(hwid)s]: result memoized.' %
+                {'handid': self.handid, 'hwid': self.hw.uuid}
+            )
+            self.score = HwScore.from_plain(result['score'])
+            self.stats = result['stats']
+            return (result['exitcode'], result['stdout'], result['stderr'])
+
+        exitcode, stdout, stderr = run()
+        # Only the clean runs reported by the sandbox itself are memoized,
+        # with the score which has been accepted by the website, so the
+        # memoized result never differs from the one of this submission.
+        if exitcode == 0 and self.score is not None:
+            try:
+                self.memo = {
+                    'key': key,
+                    'exitcode': exitcode,
+                    'stdout': unicode(stdout, 'utf-8'),
+                    'stderr': unicode(stderr, 'utf-8'),
+                    # The stage timings only belong to this run.
+                    'stats': dict((k, v) for k, v in self.stats.iteritems()
+                                  if k != 'timings'),
+                }
+            except UnicodeError:
+                pass
+        return (exitcode, stdout, stderr)
+
+    @contextmanager
+    def open_host(self, host):
+        """Enter the runner `host` of this submission, and take the score
+        written by the sandbox into :attr:`score` when the host exits.
+
+        :param host: The runner host.
+        :type host: :class:`~railgun.runner.host.BaseHost`
+        :return: A context manager yielding the entered `host`.
+        """
+        with host:
+            self.stats = host.stats
+            if self.manifest is not None:
+                host.manifest = self.manifest
+            try:
+                yield host
+            finally:
+                self.score = host.take_score()
 
     def execute(self):
         """Run this submission and store the result.  Derived classes should
@@ -126,30 +200,59 @@ class PythonHandin(BaseHandin):
     :type handid: :class:`str`
     :param hwid: The uuid of the homework.
     :type hwid: :class:`str`
-    :param upload: The base64 encoded archive file content.
+    :param upload: The base64 encoded archive file content, or :data:`None`
+        if the archive file is in the blob store.
     :type upload: :class:`str`
-    :param options: {'filename': the original uploaded file name}
+    :param options: {'filename': the original uploaded file name,
+        'digest': the digest of archive file in the blob store,
+        'size': the size of archive file}
     :type options: :class:`dict`
     """
 
     def __init__(self, handid, hwid, upload, options):
         super(PythonHandin, self).__init__('python', handid, hwid, upload,
                                            options)
+        #: The archive file content decoded from `upload`, or :data:`None`
+        #: if the archive file is in the blob store.
+        self.data = None
+
+    def _run_archive(self, host, source):
+        try:
+            extractor = Extractor.open(source, self.options['filename'])
+        except Exception:
+            raise ExtractFileFailure()
+        with extractor:
+            host.acquire_user()
+            host.prepare_hwcode()
+            host.extract_handin(extractor)
+        return host.run()
 
     def execute(self):
-        with PythonHost(self.handid, self.hw) as host:
-            # put uploaded file content onto disk and then open the archive
-            # this is because some Extractors may rely on disk files.
-            archive_fext = os.path.splitext(self.options['filename'])[1]
-            archive_file = '%s%s' % (self.handid, archive_fext)
-            with TempDiskUploadFile(self.upload, archive_file) as f:
+        digest = self.options.get('digest')
+        if not digest:
+            # The uploaded content is decoded only once.
+            self.data = base64.b64decode(self.upload)
+            digest = hashlib.sha256(self.data).hexdigest()
+        # The archive format is sniffed from the content, but the file
+        # extension is still used when the magic bytes are not known, so it
+        # is a part of the memoization key.
+        archive_fext = os.path.splitext(self.options['filename'])[1]
+        return self.memoize(self._execute, digest, archive_fext.lower())
+
+    def _execute(self):
+        with self.open_host(PythonHost(self.handid, self.hw)) as host:
+            digest = self.options.get('digest')
+            if digest:
+                # open the archive in the blob store directly
+                store = get_blob_store()
+                with host.stage('fetch'):
+                    fpath = store.fetch(digest)
                 try:
-                    extractor = Extractor.open(f.path)
-                except Exception:
-                    raise ExtractFileFailure()
-                host.prepare_hwcode()
-                host.extract_handin(extractor)
-                return host.run()
+                    return self._run_archive(host, fpath)
+                finally:
+                    store.release(fpath)
+            # extract the uploaded file content from memory
+            return self._run_archive(host, StringIO(self.data))
 
 
 class NetApiHandin(BaseHandin):
@@ -172,9 +275,12 @@ class NetApiHandin(BaseHandin):
         self.remote_addr = upload
 
     def execute(self):
-        with NetApiHost(self.remote_addr, self.handid, self.hw) as host:
+        with self.open_host(NetApiHost(self.remote_addr, self.handid,
+                                       self.hw)) as host:
+            host.acquire_user()
             host.prepare_hwcode()
-            host.compile()
+            with host.stage('compile'):
+                host.compile()
             return host.run()
 
 
@@ -196,8 +302,16 @@ class InputClassHandin(BaseHandin):
                                                options)
 
     def execute(self):
-        with InputClassHost(self.handid, self.hw) as host:
+        data = self.upload
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return self.memoize(self._execute, hashlib.sha256(data).hexdigest())
+
+    def _execute(self):
+        with self.open_host(InputClassHost(self.handid, self.hw)) as host:
+            host.acquire_user()
             host.prepare_hwcode()
-            with open(os.path.join(host.tempdir.path, 'data.csv'), 'wb') as f:
+            with host.tempdir.create(host.tempdir.fullpath('data.csv'),
+                                     host.file_mode) as f:
                 f.write(self.upload)
             return host.run()
@@ -17,24 +17,75 @@ programming language.
 
 import os
 import re
+import json
+import math
+import stat
+import errno
+import signal
+import multiprocessing
 import pwd
 import grp
 import socket
 import urllib
 
-from railgun.common.hw import FileRules
+from railgun.common.hw import FileRules, HwScore
 from railgun.common.lazy_i18n import lazy_gettext
-from railgun.common.fileutil import dirtree, remove_firstdir
-from railgun.common.osutil import ProcessTimeout, execute
+from railgun.common.fileutil import remove_firstdir, ArchiveLimitExceeded
+from railgun.common.osutil import ProcessTimeout, ResourceLimits, capture
 from railgun.common.tempdir import TempDir
-from . import runconfig
+from . import metrics, runconfig
 from .context import logger
+from .reaper import discard
+from .template import get_template
+from .zygote import ZygoteProcess, ZygoteUnavailable, pool as zygote_pool
 from .credential import (acquire_offline_user, release_offline_user,
                          acquire_online_user, release_online_user)
 from .errors import (RunnerError, FileDenyError, RunnerTimeout,
                      NetApiAddressRejected, ExtractFileFailure,
                      RuntimeFileCopyFailure, SpawnProcessFailure,
-                     ArchiveContainTooManyFileError)
+                     ArchiveContainTooManyFileError, CpuTimeLimitExceeded,
+                     MemoryLimitExceeded, FileSizeLimitExceeded,
+                     ArchiveFileTooLargeError, ArchiveTooLargeError,
+                     ArchiveCompressRatioError)
+
+#: The runner errors of the limits in
+#: :meth:`~railgun.common.fileutil.ArchiveIndex.check`.
+ARCHIVE_LIMIT_ERRORS = {
+    'count': ArchiveContainTooManyFileError,
+    'file_size': ArchiveFileTooLargeError,
+    'total_size': ArchiveTooLargeError,
+    'ratio': ArchiveCompressRatioError,
+}
+
+#: The score files larger than such bytes are considered as broken.
+MAX_SCORE_FILE_SIZE = 4 * 1024 * 1024
+
+
+def pop_score(fpath):
+    """Read and remove the score file written by the sandbox.
+
+    :param fpath: The path of the score file.
+    :type fpath: :class:`str`
+    :return: The :class:`~railgun.common.hw.HwScore` object, or :data:`None`
+        if the sandbox has not written a valid score.
+    """
+    try:
+        with open(fpath, 'rb') as f:
+            cnt = f.read(MAX_SCORE_FILE_SIZE + 1)
+        os.remove(fpath)
+    except (IOError, OSError), ex:
+        if ex.errno != errno.ENOENT:
+            raise
+        return None
+    if not cnt:
+        return None
+    try:
+        if len(cnt) > MAX_SCORE_FILE_SIZE:
+            raise ValueError('Score file is too large.')
+        return HwScore.from_plain(json.loads(cnt))
+    except Exception:
+        logger.warning('Broken score file %s.' % fpath)
+        return None
 
 
 class HostConfig(dict):
@@ -79,11 +130,77 @@ class HostConfig(dict):
         return ret
 
 
+def parse_size(value):
+    """Parse a size string like ``512``, ``64K``, ``256M`` or ``1G`` into
+    bytes (the units are powers of 1024).
+
+    :param value: The size string.
+    :type value: :class:`str`
+    :return: The size in bytes, or :data:`None` if `value` is empty.
+    :raises: :class:`ValueError` if `value` is not a valid size.
+    """
+    value = (value or '').strip().upper()
+    if not value:
+        return None
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def parse_limits(params):
+    """Parse the kernel resource limits from the runner parameters.
+
+    The attributes ``memory`` and ``fsize`` are sizes (see
+    :func:`parse_size`), ``cputime`` is the CPU seconds, while ``nproc``
+    and ``nofile`` are counts.  For example::
+
+        <runner entry="run.py" memory="256M" cputime="2" nproc="16"
+                fsize="10M" nofile="64" />
+
+    :param params: The xml node of runner parameters.
+    :return: A :class:`~railgun.common.osutil.ResourceLimits` object.
+    """
+    if params is None:
+        return ResourceLimits()
+
+    def get_int(name):
+        value = (params.get(name) or '').strip()
+        return int(math.ceil(float(value))) if value else None
+
+    return ResourceLimits(
+        memory=parse_size(params.get('memory')),
+        cputime=get_int('cputime'),
+        nproc=get_int('nproc'),
+        fsize=parse_size(params.get('fsize')),
+        nofile=get_int('nofile'),
+    )
+
+
+def parse_parallel(value):
+    """Parse the number of scorers which may run at the same time.
+
+    :param value: A positive number, ``auto`` for the number of CPUs, or
+        empty to run the scorers one by one.
+    :type value: :class:`str`
+    :return: The number of scorers, at most the number of CPUs.
+    :raises: :class:`ValueError` if `value` is not valid.
+    """
+    cpus = multiprocessing.cpu_count()
+    if not value:
+        return 1
+    if value.lower() == 'auto':
+        return cpus
+    return max(min(int(value), cpus), 1)
+
+
 class BaseHost(object):
     """The base interface for a runner host.
 
     A runner host will hold a working directory under ``config.TEMPORARY_DIR``,
-    whose name is ``uuid``.  This directory will be automatically removed
+    whose name is ``<pid>-<uuid>``, so that the directories left by the
+    crashed workers can be found (see :func:`railgun.runner.reaper.sweep`).
+    This directory will be automatically removed
     if :class:`BaseHost` is managed by ``with`` statement, for example::
 
         with BaseHost(uuid, hw, 'python') as host:
@@ -97,10 +214,15 @@ class BaseHost(object):
     :type lang: :class:`str`
     """
 
+    #: The process is considered to have exceeded the memory limit if its
+    #: peak resident memory has reached such ratio of the limit, since the
+    #: limit is put on the address space, which is always larger.
+    MEMORY_RSS_RATIO = 0.8
+
     def __init__(self, uuid, hw, lang):
         #: A :class:`~railgun.common.tempdir.TempDir`, whose directory name
-        #: is `uuid`.
-        self.tempdir = TempDir(uuid)
+        #: is `uuid` prefixed by the pid of this process.
+        self.tempdir = TempDir('%d-%s' % (os.getpid(), uuid))
 
         #: The uuid of the submission.
         self.uuid = uuid
@@ -111,6 +233,10 @@ class BaseHost(object):
         #: The :class:`~railgun.common.hw.HwCode` of corresponding language.
         self.hwcode = hw.get_code(lang)
 
+        #: The :class:`~railgun.common.hw.FileRules` of :attr:`hwcode` and
+        #: then :attr:`hw` (see :meth:`get_file_action`).
+        self.file_rules = hw.get_file_rules(lang)
+
         #: The xml node of compiler parameters.
         #: You may refer to :attr:`HwCode.compiler_params` for more details.
         self.compiler_params = self.hwcode.compiler_params
@@ -119,6 +245,20 @@ class BaseHost(object):
         #: You may refer to :attr:`HwCode.runner_params` for more details.
         self.runner_params = self.hwcode.runner_params
 
+        #: The kernel resource limits of the process
+        #: (from :attr:`BaseHost.runner_params`).
+        self.limits = parse_limits(self.runner_params)
+
+        #: The file manifest of :attr:`hwcode`, which is validated only once
+        #: for each submission (see :meth:`get_manifest`).  The handler may
+        #: set the manifest it has validated.
+        self.manifest = None
+
+        #: The path of the file where the sandbox writes the score, so that
+        #: the score is reported by the runner (see :meth:`take_score`), or
+        #: :data:`None` if the sandbox does not report any score.
+        self.score_file = None
+
         #: The :class:`HostConfig` for the process.
         self.config = HostConfig(handid=uuid, hwid=self.hw.uuid)
 
@@ -134,17 +274,75 @@ class BaseHost(object):
         #: instead.
         self.runner_user = None
 
+        #: The full paths of files in :attr:`tempdir` which are hard links
+        #: to the shared code template.  They must not be chowned or
+        #: chmoded.
+        self.linked_files = set()
+
+        #: The Unix file system mode of the files prepared in :attr:`tempdir`.
+        #: It is 0700 if they are created with the owner of the acquired
+        #: system account (see :meth:`set_user`), otherwise 0777, and
+        #: :meth:`secure_tempdir` will correct them before :meth:`spawn`.
+        self.file_mode = 0777
+
+        #: The statistics of the submission process, which will be sent to
+        #: the website along with the outputs.  Includes ``stdout_size``
+        #: and ``stderr_size``, the total bytes of the untruncated outputs,
+        #: and ``usage``, the resource usage of the process (see
+        #: :func:`~railgun.common.osutil.make_usage`), and ``timings``, the
+        #: seconds spent in each stage (see :meth:`stage`).
+        self.stats = {'timings': {}}
+
     def __enter__(self):
         #: We create the directory with mode 0777, while the owner is the owner
         #: of runner queue process.
         #: The permissions and the owner will be set to `config['user_id']`
         #: until :meth:`spawn`.
         self.tempdir.open(mode=0777)
+        if self.score_file:
+            # The score must not be read or forged by other submissions.
+            score_dir = os.path.dirname(self.score_file)
+            if not os.path.isdir(score_dir):
+                os.makedirs(score_dir, 0700)
+            # A stale file left by a killed runner is never taken.
+            pop_score(self.score_file)
         return self
 
     def __exit__(self, ignore1, ignore2, ignore3):
-        #: The temporary directory will be removed here.
-        self.tempdir.close()
+        #: The system account and the temporary directory will be released
+        #: here.
+        try:
+            self.release_user()
+        finally:
+            with self.stage('cleanup'):
+                if runconfig.RUNNER_DEFERRED_CLEANUP:
+                    discard(self.tempdir)
+                else:
+                    self.tempdir.close()
+
+    def take_score(self):
+        """Read and remove the score written by the sandbox into
+        :attr:`score_file`, which should then be reported by the runner.
+
+        :return: The :class:`~railgun.common.hw.HwScore` object, or
+            :data:`None` if no valid score has been written.
+        """
+        if not self.score_file:
+            return None
+        return pop_score(self.score_file)
+
+    def stage(self, name):
+        """Measure the seconds spent in the ``with`` block as a stage of
+        running this submission, and add them to ``stats['timings']``.
+        For example::
+
+            with host.stage('extract'):
+                host.extract_handin(archive)
+
+        :param name: The name of the stage.
+        :type name: :class:`str`
+        """
+        return metrics.stage(self.stats['timings'], name)
 
     def spawn(self, cmdline, timeout=None):
         """Spawn an external process to execute the given commands.
@@ -152,7 +350,8 @@ class BaseHost(object):
         If the owner user of current process (runner queue) is `root`,
         and ``config['user_id']`` != 0, the owner of :attr:`tempdir`
         will be changed to that user, and the file system mode will
-        be changed to 0700.
+        be changed to 0700.  The kernel resource :attr:`limits` will be
+        applied to the process before `exec`.
 
         :param cmdline: The command line to be executed.
         :type cmdline: :class:`str`
@@ -165,29 +364,21 @@ class BaseHost(object):
         """
 
         try:
-            # Before spawn the process, we've already known the process
-            # user.  And we'll try to chown & chmod if our runner queue
-            # runs at root privilege (otherwise we cannot change the
-            # owner user).
-            if os.getuid() == 0:
-                # If config['user_id'] is 0, runner_user must be None,
-                # where we shouldn't go any more.
-                if self.config['user_id'] != 0:
-                    self.tempdir.chown(
-                        self.config['user_id'],
-                        self.config['group_id'],
-                        True
-                    )
-                    self.tempdir.chmod(0700, True)
+            self.secure_tempdir()
             # Now we can execute the host process safely!
-            return execute(
-                cmdline,
-                timeout or runconfig.RUNNER_DEFAULT_TIMEOUT,
-                cwd=self.tempdir.path,
-                env=self.config.make_environ(),
-                close_fds=True
-            )
-        except ProcessTimeout:
+            with self.stage('sandbox'):
+                result = capture(
+                    cmdline,
+                    timeout or runconfig.RUNNER_DEFAULT_TIMEOUT,
+                    head=runconfig.RUNNER_OUTPUT_HEAD,
+                    tail=runconfig.RUNNER_OUTPUT_TAIL,
+                    cwd=self.tempdir.path,
+                    env=self.config.make_environ(),
+                    close_fds=True,
+                    preexec_fn=(self.limits.apply if self.limits else None)
+                )
+        except ProcessTimeout, ex:
+            self.stats['usage'] = ex.usage
             raise RunnerTimeout()
         except Exception:
             logger.exception(
@@ -196,6 +387,119 @@ class BaseHost(object):
                 {'hwid': self.hw.uuid, 'handid': self.uuid}
             )
             raise SpawnProcessFailure()
+        return self.collect_output(*result)
+
+    def collect_output(self, exitcode, stdout, stderr, usage):
+        """Record the output sizes and resource usage in :attr:`stats`, and
+        get the truncated outputs.
+
+        :param exitcode: The exit code of the process.
+        :param stdout: The captured standard output.
+        :type stdout: :class:`~railgun.common.osutil.BoundedBuffer`
+        :param stderr: The captured standard error output.
+        :type stderr: :class:`~railgun.common.osutil.BoundedBuffer`
+        :param usage: The resource usage of the process.
+        :type usage: :class:`dict`
+
+        :return: A :class:`tuple` of (exitcode, stdout, stderr).
+        :raises: :class:`~railgun.runner.errors.ResourceLimitExceeded` if the
+            process has been killed by any of :attr:`limits`.
+        """
+        self.stats['stdout_size'] = stdout.total
+        self.stats['stderr_size'] = stderr.total
+        self.stats['usage'] = usage
+        output = (exitcode, stdout.getvalue(), stderr.getvalue())
+        err = self.check_limits(exitcode, usage)
+        if err is not None:
+            # Keep the outputs, so that they can still be logged.
+            err.output = output
+            raise err
+        return output
+
+    def check_limits(self, exitcode, usage):
+        """Detect whether the process has failed because of :attr:`limits`.
+
+        Only the evidence left by the kernel is trusted, since the outputs
+        are under the control of the submission: the signal that killed
+        the process (``SIGXCPU`` or ``SIGXFSZ``), the CPU time and the peak
+        resident memory reported by `wait4`, and the files in
+        :attr:`tempdir` which have grown up to the size limit.  The limits
+        on processes and open files leave no such evidence, so failures
+        caused by them are reported as ordinary errors.
+
+        :param exitcode: The exit code of the process.
+        :param usage: The resource usage of the process.
+        :return: A :class:`~railgun.runner.errors.ResourceLimitExceeded`
+            object, or :data:`None` if no limit is exceeded.
+        """
+        if exitcode == 0 or not self.limits:
+            return None
+        # The signal that killed the process.  If the process is executed
+        # by the shell, the exit code will be 128 + signal.
+        sig = -exitcode if exitcode < 0 else (
+            exitcode - 128 if exitcode > 128 else None)
+        usage = usage or {}
+        limits = self.limits
+
+        if limits.cputime:
+            cputime = usage.get('cpu_user', 0) + usage.get('cpu_system', 0)
+            if sig == signal.SIGXCPU or cputime >= limits.cputime:
+                return CpuTimeLimitExceeded()
+        if limits.fsize:
+            # Python ignores SIGXFSZ, so the written files are checked.
+            if sig == signal.SIGXFSZ or self.has_file_of_size(limits.fsize):
+                return FileSizeLimitExceeded()
+        if limits.memory:
+            # `max_rss` is in kilobytes.
+            max_rss = usage.get('max_rss', 0) * 1024
+            if max_rss >= limits.memory * self.MEMORY_RSS_RATIO:
+                return MemoryLimitExceeded()
+        return None
+
+    def has_file_of_size(self, size):
+        """Whether any file in :attr:`tempdir` is at least `size` bytes?
+
+        :param size: The file size in bytes.
+        :type size: :class:`int`
+        """
+        for parent, _, files in os.walk(self.tempdir.path):
+            for f in files:
+                try:
+                    st = os.lstat(os.path.join(parent, f))
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode) and st.st_size >= size:
+                    return True
+        return False
+
+    def secure_tempdir(self):
+        """Change the owner of :attr:`tempdir` to ``config['user_id']``,
+        and the file system mode to 0700, before the submission is executed.
+
+        Nothing will be done unless the owner user of current process
+        (runner queue) is `root`, and ``config['user_id']`` != 0.
+        """
+        # Before spawn the process, we've already known the process
+        # user.  And we'll try to chown & chmod if our runner queue
+        # runs at root privilege (otherwise we cannot change the
+        # owner user).
+        if os.getuid() == 0:
+            # If config['user_id'] is 0, runner_user must be None,
+            # where we shouldn't go any more.
+            if self.config['user_id'] != 0:
+                # The files have been created with the owner and the mode.
+                owner = (self.config['user_id'], self.config['group_id'])
+                if self.tempdir.owner == owner:
+                    return
+                skip = self.linked_files.__contains__
+                with self.stage('secure_tempdir'):
+                    self.tempdir.chown(
+                        self.config['user_id'],
+                        self.config['group_id'],
+                        True,
+                        skip=skip
+                    )
+                    self.tempdir.chmod(0700, True, skip=skip)
 
     def set_user(self, uid, gid=None):
         """Set the user and the group in host config.
@@ -237,6 +541,31 @@ class BaseHost(object):
         self.config['user_id'] = uid
         self.config['group_id'] = gid
 
+        # If no file has been prepared yet, create them with the owner and
+        # the final mode from now on, so that :meth:`secure_tempdir` need
+        # not walk through them again.
+        if os.getuid() == 0 and os.path.isdir(self.tempdir.path) and \
+                not os.listdir(self.tempdir.path):
+            self.tempdir.set_owner(uid, gid)
+            self.tempdir.chmod(0700)
+            self.file_mode = 0700
+
+    def acquire_user(self):
+        """Acquire the system account to run this submission.  Call this
+        before :meth:`prepare_hwcode`, so that the files can be created
+        with the owner of the account.
+
+        Derived classes which run the submission at another system account
+        should override this, and call :meth:`set_user`.
+        """
+        pass
+
+    def release_user(self):
+        """Release the system account acquired by :meth:`acquire_user`.
+        This method is called when leaving the ``with`` block.
+        """
+        pass
+
     def compile(self):
         """Call to compile the submission.  Some programming language may
         skip this process.
@@ -250,24 +579,75 @@ class BaseHost(object):
         """
         raise NotImplementedError()
 
+    def isolated(self):
+        """Whether the submission will run at another system account than
+        the runner queue?  Derived classes should override this if they
+        acquire system accounts in :meth:`run`.
+        """
+        return False
+
+    def get_file_action(self, path):
+        """Get the action of given file according to the
+        :class:`~railgun.common.hw.FileRules` in :attr:`hwcode` and then
+        in :attr:`hw`.
+
+        :param path: The relative path of the file.
+        :type path: :class:`str`
+        :return: One of the actions defined in
+            :class:`~railgun.common.hw.FileRules`.
+        """
+        # The rules in HwCode are checked before the rules in Homework.
+        return self.file_rules.get_action(path, default_action=FileRules.LOCK)
+
+    def get_manifest(self):
+        """Get the file manifest of :attr:`hwcode`, which is validated on
+        first call, and shared by all the stages of this submission.
+
+        :return: The :class:`~railgun.common.fileutil.FileManifest` object.
+        """
+        if self.manifest is None:
+            self.manifest = self.hwcode.get_manifest()
+        return self.manifest
+
     def prepare_hwcode(self):
         """Prepare the runner context by copying files from `hw/code` into
         :attr:`tempdir`.  This method should be called before
         :meth:`extract_handin`.
+
+        If ``config.RUNNER_CODE_TEMPLATE`` is enabled, the files will be
+        materialized from the shared template of :attr:`hwcode` (see
+        :mod:`railgun.runner.template`).  Files which the students may
+        overwrite are always private copies.
         """
-        try:
-            self.tempdir.copyfiles(
-                self.hwcode.path,
-                dirtree(self.hwcode.path),
-                mode=0777
-            )
-        except Exception:
-            logger.exception(
-                'Cannot copy code files into tempdir for homework %(hwid)s '
-                'when executing submission %(handid)s.' %
-                {'hwid': self.hw.uuid, 'handid': self.uuid}
-            )
-            raise RuntimeFileCopyFailure()
+        with self.stage('prepare_hwcode'):
+            try:
+                # The manifest holds the files and their actions, so the
+                # code package is not scanned for each submission.
+                manifest = self.get_manifest()
+                if runconfig.RUNNER_CODE_TEMPLATE:
+                    # Hard links are only safe if the runner queue is root, and
+                    # the submission does not own these files.
+                    template = get_template(self.hwcode, manifest)
+                    accepted = set(manifest.filter((FileRules.ACCEPT,)))
+                    self.linked_files = template.materialize(
+                        self.tempdir,
+                        accepted.__contains__,
+                        hardlink=(os.getuid() == 0 and self.isolated()),
+                        mode=self.file_mode
+                    )
+                else:
+                    self.tempdir.copyfiles(
+                        self.hwcode.path,
+                        [e.path for e in manifest.files()],
+                        mode=self.file_mode
+                    )
+            except Exception:
+                logger.exception(
+                    'Cannot copy code files into tempdir for homework '
+                    '%(hwid)s when executing submission %(handid)s.' %
+                    {'hwid': self.hw.uuid, 'handid': self.uuid}
+                )
+                raise RuntimeFileCopyFailure()
 
     def extract_handin(self, archive):
         """Extract the given archive file into :attr:`tempdir`.
@@ -280,56 +660,55 @@ class BaseHost(object):
         :type archive: :class:`~railgun.common.fileutil.Extractor`
         """
 
-        try:
-            # We limit the count of files in an archive file, since too many
-            # files may slow down the runner queue.
-            maxCount = runconfig.MAX_SUBMISSION_FILE_COUNT
-            if archive.countfiles(maxCount) > maxCount:
-                raise ArchiveContainTooManyFileError()
-
-            # If the archive file contains only one top-level directory,
-            # it is likely that all the code files are placed under it.
-            #
-            # So we remove the top-level directory and extract the files
-            # in it directly to :attr:`tempdir`.
-            onedir = archive.onedir()
-            canonical_path = remove_firstdir if onedir else (lambda s: s)
-
-            # Use the :class:`FileRules` to filter out unwanted files.
-            def should_skip(path):
-                path = canonical_path(path)
-                # First, check the rules in HwCode
-                action = self.hwcode.file_rules.get_action(
-                    path, default_action=-1
+        with self.stage('extract'):
+            try:
+                # We limit the count and the sizes of files in an archive
+                # file, since too many or too large files may slow down the
+                # runner queue, or even fill up the disk.
+                archive.index().check(
+                    max_count=runconfig.MAX_SUBMISSION_FILE_COUNT,
+                    max_file_size=runconfig.MAX_SUBMISSION_FILE_SIZE,
+                    max_total_size=runconfig.MAX_SUBMISSION_TOTAL_SIZE,
+                    max_ratio=runconfig.MAX_SUBMISSION_COMPRESS_RATIO
                 )
-                if action == FileRules.DENY:
-                    raise FileDenyError(path)
-                if action == FileRules.ACCEPT:
-                    return False
-                if action != -1:
-                    # action is not None, and action != ACCEPT, this means
-                    # that rules in `hwcode` rejects this file.
-                    return True
-                # Next, check the rules in Homework
-                action = self.hw.file_rules.get_action(
-                    path, default_action=FileRules.LOCK
+
+                # If the archive file contains only one top-level directory,
+                # it is likely that all the code files are placed under it.
+                #
+                # So we remove the top-level directory and extract the files
+                # in it directly to :attr:`tempdir`.
+                onedir = archive.onedir()
+                canonical_path = remove_firstdir if onedir else (lambda s: s)
+
+                # Use the :class:`FileRules` to filter out unwanted files.
+                def should_skip(path):
+                    action = self.get_file_action(canonical_path(path))
+                    if action == FileRules.DENY:
+                        raise FileDenyError(canonical_path(path))
+                    return (action != FileRules.ACCEPT)
+
+                # Call utility to do the extraction.  If the owner is not
+                # known yet, the file mode is 0777, and we'll correct this
+                # problem in :meth:`spawn`
+                #
+                # The sizes are checked again on the extracted bytes, since
+                # the sizes declared by the archive may be forged.
+                self.tempdir.extract(
+                    archive, should_skip, mode=self.file_mode,
+                    max_file_size=runconfig.MAX_SUBMISSION_FILE_SIZE,
+                    max_total_size=runconfig.MAX_SUBMISSION_TOTAL_SIZE
                 )
-                if action == FileRules.DENY:
-                    raise FileDenyError(path)
-                return (action != FileRules.ACCEPT)
-
-            # Call utility to do the extraction.  Initial file mode is 0777,
-            # and we'll correct this problem in :meth:`spawn`
-            self.tempdir.extract(archive, should_skip, mode=0777)
-        except RunnerError:
-            raise
-        except Exception:
-            logger.exception(
-                'Cannot extract archive into tempdir for homework %(hwid)s '
-                'when executing submission %(handid)s.' %
-                {'hwid': self.hw.uuid, 'handid': self.uuid}
-            )
-            raise ExtractFileFailure()
+            except ArchiveLimitExceeded, ex:
+                raise ARCHIVE_LIMIT_ERRORS[ex.limit]()
+            except RunnerError:
+                raise
+            except Exception:
+                logger.exception(
+                    'Cannot extract archive into tempdir for homework '
+                    '%(hwid)s when executing submission %(handid)s.' %
+                    {'hwid': self.hw.uuid, 'handid': self.uuid}
+                )
+                raise ExtractFileFailure()
 
 
 class PythonHost(BaseHost):
@@ -356,6 +735,10 @@ class PythonHost(BaseHost):
     :type offline: :class:`bool`
     """
 
+    #: Seconds reserved for preparing the files of a submission, since the
+    #: system account is acquired before that.
+    PREPARE_SECONDS = 10
+
     def __init__(self, uuid, hw, lang="python", offline=True):
         super(PythonHost, self).__init__(uuid, hw, lang)
 
@@ -380,40 +763,162 @@ class PythonHost(BaseHost):
         #: The main Python script file (from :attr:`BaseHost.runner_params`).
         self.entry = self.runner_params.get('entry')
 
-        #: The timeout limit of this submission
+        #: The wall-clock timeout limit of this submission
         #: (from :attr:`BaseHost.runner_params`).
-        self.timeout = int(self.runner_params.get('timeout') or
-                           runconfig.RUNNER_DEFAULT_TIMEOUT)
+        #:
+        #: If ``timeout`` is not given but ``cputime`` is, the wall-clock
+        #: timeout will be ``config.RUNNER_WALL_CPU_RATIO`` times of the
+        #: CPU time, so that a loaded runner will not kill an honest
+        #: submission too early.
+        timeout = self.runner_params.get('timeout')
+        if timeout:
+            self.timeout = float(timeout)
+        elif self.limits.cputime:
+            self.timeout = self.limits.cputime * \
+                runconfig.RUNNER_WALL_CPU_RATIO
+        else:
+            self.timeout = float(runconfig.RUNNER_DEFAULT_TIMEOUT)
 
         #: The parent directory of :attr:`entry` file.
         self.entry_path = os.path.join(self.tempdir.path, self.entry)
 
-    def run(self):
-        """Run this Python submission."""
+        #: Whether this submission may be forked from a warm zygote?
+        #: (from ``config.RUNNER_WARM_POOL`` and
+        #: :attr:`BaseHost.runner_params`).
+        self.warm = runconfig.RUNNER_WARM_POOL and \
+            self.runner_params.get('warmpool', 'true').lower() != 'false'
+
+        #: The homework modules to be preloaded in the zygote
+        #: (from :attr:`BaseHost.runner_params`).
+        self.preload = [
+            m.strip() for m in self.runner_params.get('preload', '').split(',')
+            if m.strip()
+        ]
+
+        #: The maximum number of scorers running at the same time in forked
+        #: processes (from ``parallel`` of :attr:`BaseHost.runner_params`,
+        #: either a number or ``auto``, limited to the number of CPUs).
+        self.scorer_parallel = parse_parallel(
+            self.runner_params.get('parallel'))
+        self.config['scorer_parallel'] = self.scorer_parallel
+
+        # The SafeRunner writes the score into this file instead of posting
+        # it to the website, and the score will be reported by the runner.
+        self.score_file = os.path.join(
+            runconfig.TEMPORARY_DIR, '.scores',
+            '%s.%d.json' % (uuid, os.getpid()))
+        self.config['score_file'] = self.score_file
+
+    def isolated(self):
+        """Whether the acquired system account will not be `root`?"""
+        if self.offline:
+            host, user = (runconfig.OFFLINE_USER_HOST,
+                          runconfig.OFFLINE_USER_ID)
+        else:
+            host, user = (runconfig.ONLINE_USER_HOST,
+                          runconfig.ONLINE_USER_ID)
+        if host:
+            return True
+        if user and not isinstance(user, int):
+            user = pwd.getpwnam(user).pw_uid
+        return bool(user)
+
+    def make_zygote(self):
+        """Create a new :class:`~railgun.runner.zygote.ZygoteProcess` for
+        the homework code package of this host.
+
+        The zygote runs at the privilege of runner queue, and each forked
+        sandbox will drop to the acquired system account by itself.
+        """
+        config = HostConfig(
+            user_id=0, group_id=0, hwid=self.hw.uuid, zygote=1,
+            PYTHONPATH=self.config['PYTHONPATH']
+        )
+        return ZygoteProcess(self.safe_runner, self.hwcode,
+                             config.make_environ(), self.preload)
+
+    def spawn_warm(self):
+        """Fork this submission from the warm zygote of the homework.
+
+        :return: A :class:`tuple` of (exitcode, stdout, stderr), or
+            :data:`None` if the zygote is not available.
+        """
         try:
-            # Get a free system account.
-            #
-            # Note that we'll keep the process running for at most `timeout`
-            # seconds (with a 1~2 second error), so we hold the system
-            # account for at most such a long time.
-            expires = self.timeout + 2
+            # The zygote is retired if the code package has been modified.
+            zygote = zygote_pool.get(
+                (self.hw.uuid, self.hwcode.lang), self.get_manifest().digest,
+                self.make_zygote)
+            self.secure_tempdir()
+            with self.stage('sandbox'):
+                result = zygote.execute(
+                    self.tempdir.path,
+                    self.config.make_environ(),
+                    self.config['user_id'],
+                    self.config['group_id'],
+                    self.entry_path,
+                    self.timeout,
+                    self.limits
+                )
+        except ZygoteUnavailable:
+            logger.warning(
+                'Zygote of homework %(hwid)s is not available, start '
+                'submission %(handid)s by SafeRunner.' %
+                {'hwid': self.hw.uuid, 'handid': self.uuid}
+            )
+            return None
+        except ProcessTimeout, ex:
+            self.stats['usage'] = ex.usage
+            raise RunnerTimeout()
+        except Exception:
+            logger.exception(
+                'Error when executing submission %(handid)s of homework '
+                '%(hwid)s.' %
+                {'hwid': self.hw.uuid, 'handid': self.uuid}
+            )
+            raise SpawnProcessFailure()
+        return self.collect_output(*result)
+
+    def acquire_user(self):
+        """Get a free system account for this submission."""
+        if 'user_id' in self.config:
+            return
+        # Note that we'll keep the process running for at most `timeout`
+        # seconds, so we hold the system account for at most such a long
+        # time (plus some time to prepare the files and to clean up).
+        expires = int(math.ceil(self.timeout)) + self.PREPARE_SECONDS + 2
+        kind = 'offline' if self.offline else 'online'
+        with metrics.account_wait_seconds.time(kind=kind), \
+                self.stage('acquire_user'):
             if self.offline:
                 user_login = acquire_offline_user(expires)
             else:
                 user_login = acquire_online_user(expires)
-            self.set_user(user_login)
+        self.set_user(user_login)
 
-            return self.spawn(
-                '"%s" "%s"' % (self.safe_runner, self.entry_path),
-                self.timeout
-            )
-        finally:
-            # Whether succeeded or not, we must release the system account.
-            if self.runner_user:
-                if self.offline:
-                    release_offline_user(self.runner_user)
-                else:
-                    release_online_user(self.runner_user)
+    def release_user(self):
+        """Release the acquired system account."""
+        if self.runner_user:
+            if self.offline:
+                release_offline_user(self.runner_user)
+            else:
+                release_online_user(self.runner_user)
+            self.runner_user = None
+
+    def run(self):
+        """Run this Python submission.
+
+        The system account is acquired here if :meth:`acquire_user` has not
+        been called, and will be released when leaving the ``with`` block.
+        """
+        self.acquire_user()
+        if self.warm:
+            ret = self.spawn_warm()
+            if ret is not None:
+                return ret
+        return self.spawn(
+            '"%s" "%s"' % (self.safe_runner, self.entry_path),
+            self.timeout
+        )
 
 
 class NetApiHost(PythonHost):
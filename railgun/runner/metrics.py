@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/metrics.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module collects the metrics of the runner.
+
+The metrics are recorded in memory by each runner process, and are added
+into a SQLite database under ``config.TEMPORARY_DIR/.metrics`` by
+:meth:`MetricsRegistry.flush` in a background thread, every
+``config.RUNNER_METRICS_FLUSH_INTERVAL`` seconds and before the worker
+process exits.  So the metrics of all the runner processes on this machine
+are aggregated without a database transaction for each submission, and
+survive the restarts of the workers.
+
+The metrics can be exported in the text exposition format of Prometheus
+by :meth:`MetricsRegistry.render`, either by ``python runner.py metrics``
+(e.g., for the textfile collector of the node exporter), or by the HTTP
+endpoint ``/metrics`` on ``config.RUNNER_METRICS_PORT`` served by
+``python runner.py supervise``.
+
+The metrics of the runner are defined at the end of this module.  The
+counters and histograms are summed over all the processes, while the
+gauges are summed over the processes which are still alive.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from . import runconfig
+from .context import logger
+from railgun.common.osutil import monotonic, is_running
+
+#: The schema of the metrics database.
+#:
+#: The counters and the histograms are stored with ``pid = 0``, while the
+#: gauges are stored with the pid of each runner process.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, pid)
+);
+'''
+
+#: The default buckets (in seconds) of the latency histograms.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, unicode(v).replace('\\', '\\\\').replace('"', '\\"')
+                     .replace('\n', '\\n').encode('utf-8'))
+        for k, v in labels
+    )
+
+
+class Metric(object):
+    """The base class of all metrics.
+
+    :param registry: The registry of this metric.
+    :type registry: :class:`MetricsRegistry`
+    :param name: The name of this metric.
+    :type name: :class:`str`
+    :param help: The description of this metric.
+    :type help: :class:`str`
+    :param labelnames: The names of the labels.
+    :type labelnames: :class:`tuple` of :class:`str`
+    """
+
+    #: The Prometheus type of this metric.
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels):
+        if sorted(labels) != sorted(self.labelnames):
+            raise ValueError('Metric %s requires labels %r.' %
+                             (self.name, self.labelnames))
+        return tuple((k, labels[k]) for k in self.labelnames)
+
+
+class Counter(Metric):
+    """A counter that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter.
+
+        :param amount: The amount to increase.
+        :param labels: The label values.
+        """
+        self.registry._add(self.name, self._labels(labels), amount)
+
+
+class Gauge(Metric):
+    """A gauge of each runner process."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the gauge.
+
+        :param value: The new value.
+        :param labels: The label values.
+        """
+        self.registry._set(self.name, self._labels(labels), value)
+
+    def inc(self, amount=1, **labels):
+        """Increase the gauge.
+
+        :param amount: The amount to increase, may be negative.
+        :param labels: The label values.
+        """
+        key = self._labels(labels)
+        self.registry._set(
+            self.name, key, self.registry._gauges.get((self.name, key), 0) +
+            amount
+        )
+
+
+class Histogram(Metric):
+    """A histogram of observed values.
+
+    :param buckets: The upper bounds of the buckets.
+    :type buckets: :class:`tuple` of :class:`float`
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """Observe a value.
+
+        :param value: The observed value.
+        :param labels: The label values.
+        """
+        key = self._labels(labels)
+        for b in self.buckets:
+            if value <= b:
+                self.registry._add(self.name + '_bucket',
+                                   key + (('le', _format_value(b)),), 1)
+        self.registry._add(self.name + '_sum', key, value)
+        self.registry._add(self.name + '_count', key, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the ``with`` block."""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(monotonic() - start, **labels)
+
+
+class MetricsRegistry(object):
+    """The registry of metrics.
+
+    :param path: The directory of the metrics database.
+    :type path: :class:`str`
+    :param flush_interval: The seconds between two flushes in a background
+        thread, or :data:`None` to flush only by calling :meth:`flush`.
+    :type flush_interval: :class:`float`
+    """
+
+    def __init__(self, path, flush_interval=None):
+        #: The directory of the metrics database.
+        self.path = path
+
+        #: The seconds between two flushes in the background thread.
+        self.flush_interval = flush_interval
+
+        #: The registered :class:`Metric` objects, in order.
+        self.metrics = []
+
+        # The pending increments of counters and histograms, and the current
+        # values of gauges in this process.
+        self._deltas = {}
+        self._gauges = {}
+        self._dirty = set()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._flusher_pid = None
+
+    def counter(self, name, help, labelnames=()):
+        """Register a :class:`Counter`."""
+        return self._register(Counter(self, name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        """Register a :class:`Gauge`."""
+        return self._register(Gauge(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Register a :class:`Histogram`."""
+        return self._register(
+            Histogram(self, name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def _check_fork(self):
+        # The pending values inherited from the parent process belong to
+        # the parent only.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._deltas.clear()
+            self._gauges.clear()
+            self._dirty.clear()
+
+    def _start_flusher(self):
+        # The flusher thread of the parent process does not survive the
+        # fork, so each process starts its own on first use.
+        if self.flush_interval and self._flusher_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            thread = threading.Thread(target=self._flush_forever,
+                                      name='MetricsFlusher')
+            thread.daemon = True
+            thread.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _add(self, name, labels, amount):
+        with self._lock:
+            self._check_fork()
+            self._start_flusher()
+            key = (name, labels)
+            self._deltas[key] = self._deltas.get(key, 0) + amount
+
+    def _set(self, name, labels, value):
+        with self._lock:
+            self._check_fork()
+            self._start_flusher()
+            self._gauges[(name, labels)] = value
+            self._dirty.add((name, labels))
+
+    def _connect(self):
+        if not self._ready:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, 0700)
+            with closing(sqlite3.connect(
+                    os.path.join(self.path, 'metrics.db'),
+                    timeout=60, isolation_level=None)) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+            self._ready = True
+        # The transactions are managed explicitly.
+        return sqlite3.connect(os.path.join(self.path, 'metrics.db'),
+                               timeout=60, isolation_level=None)
+
+    def _purge(self, conn):
+        # Delete the gauges of the processes which have exited, or the
+        # table grows with every restarted worker.  The workers running
+        # as other users are alive, though they cannot be signaled.
+        pids = [r[0] for r in conn.execute(
+            'SELECT DISTINCT pid FROM samples WHERE pid <> 0')]
+        for pid in pids:
+            if not is_running(pid):
+                conn.execute('DELETE FROM samples WHERE pid = ?', (pid,))
+
+    def flush(self):
+        """Add the pending metrics of this process into the database.
+
+        The gauges of the processes which have exited are deleted.  Errors
+        are logged but not raised, since the metrics should never break the
+        grading of submissions.
+        """
+        with self._lock:
+            self._check_fork()
+            deltas, self._deltas = self._deltas, {}
+            gauges = [(k, self._gauges[k]) for k in self._dirty]
+            self._dirty = set()
+        if not deltas and not gauges:
+            return
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for (name, labels), amount in deltas.iteritems():
+                    labels = json.dumps(labels)
+                    conn.execute(
+                        'INSERT OR IGNORE INTO samples (name, labels, pid, '
+                        'value) VALUES (?, ?, 0, 0)', (name, labels))
+                    conn.execute(
+                        'UPDATE samples SET value = value + ? WHERE '
+                        'name = ? AND labels = ? AND pid = 0',
+                        (amount, name, labels))
+                for (name, labels), value in gauges:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO samples (name, labels, pid, '
+                        'value) VALUES (?, ?, ?, ?)',
+                        (name, json.dumps(labels), self._pid, value))
+                self._purge(conn)
+                conn.execute('COMMIT')
+        except Exception:
+            logger.warning('Could not flush the runner metrics.', exc_info=1)
+
+    def render(self):
+        """Render the metrics of all the runner processes in the Prometheus
+        text format.
+
+        The gauges of the processes which have exited are deleted.
+
+        :return: The text of metrics.
+        :rtype: :class:`str`
+        """
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._purge(conn)
+            rows = conn.execute(
+                'SELECT name, labels, SUM(value) FROM samples '
+                'GROUP BY name, labels').fetchall()
+            conn.execute('COMMIT')
+
+        samples = {}
+        for name, labels, value in rows:
+            labels = tuple(tuple(p) for p in json.loads(labels))
+            samples.setdefault(name, []).append((labels, value))
+
+        def sort_key(sample):
+            # Sort the buckets of a histogram by their upper bounds.
+            labels = sample[0]
+            if labels and labels[-1][0] == 'le':
+                return (labels[:-1], float(labels[-1][1]))
+            return (labels, 0)
+
+        lines = []
+        for m in self.metrics:
+            lines.append('# HELP %s %s' % (m.name, m.help))
+            lines.append('# TYPE %s %s' % (m.name, m.kind))
+            if m.kind == 'histogram':
+                names = [m.name + s for s in ('_bucket', '_sum', '_count')]
+            else:
+                names = [m.name]
+            for name in names:
+                for labels, value in sorted(samples.get(name, ()),
+                                            key=sort_key):
+                    lines.append('%s%s %s' % (name, _format_labels(labels),
+                                              _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def stage(timings, name):
+    """Measure the seconds spent in the ``with`` block as a stage of
+    running a submission.  The seconds are added to ``timings[name]``, and
+    observed by :data:`stage_seconds`.
+
+    :param timings: The stage timings of the submission.
+    :type timings: :class:`dict`
+    :param name: The name of the stage.
+    :type name: :class:`str`
+    """
+    start = monotonic()
+    try:
+        yield
+    finally:
+        seconds = monotonic() - start
+        timings[name] = timings.get(name, 0) + seconds
+        stage_seconds.observe(seconds, stage=name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = registry.render()
+        except Exception:
+            logger.exception('Could not render the runner metrics.')
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, interface=''):
+    """Serve the ``/metrics`` endpoint in a background thread.
+
+    :param port: The port to listen on.
+    :type port: :class:`int`
+    :param interface: The interface to listen on.
+    :type interface: :class:`str`
+    :return: The :class:`~BaseHTTPServer.HTTPServer` object.
+    """
+    server = HTTPServer((interface, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+#: The :class:`MetricsRegistry` of the runner.
+registry = MetricsRegistry(os.path.join(runconfig.TEMPORARY_DIR, '.metrics'),
+                           runconfig.RUNNER_METRICS_FLUSH_INTERVAL)
+
+#: The number of processed submissions, by the programming language and the
+#: outcome (``ok``, ``nonzero_exit``, ``runner_error`` or ``internal_error``).
+submissions = registry.counter(
+    'railgun_runner_submissions_total',
+    'Submissions processed by the runner.', ('lang', 'outcome'))
+
+#: The seconds spent in each stage of running a submission (see
+#: :func:`stage`).
+stage_seconds = registry.histogram(
+    'railgun_runner_stage_seconds',
+    'Seconds spent in each stage of running a submission.', ('stage',))
+
+#: The number of submissions killed on timeout.
+timeouts = registry.counter(
+    'railgun_runner_timeouts_total',
+    'Submissions killed on timeout.', ('lang',))
+
+#: The number of :class:`~railgun.runner.errors.RunnerError`, by class.
+errors = registry.counter(
+    'railgun_runner_errors_total',
+    'Runner errors reported for submissions, by class.', ('error',))
+
+#: The seconds spent to acquire a system account.
+account_wait_seconds = registry.histogram(
+    'railgun_runner_account_wait_seconds',
+    'Seconds spent to acquire a system account.', ('kind',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+#: The number of submissions being run.
+inflight = registry.gauge(
+    'railgun_runner_inflight',
+    'Submissions being run by the runner processes.')
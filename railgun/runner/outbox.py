@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/outbox.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the durable outbox of website api messages.
+
+If ``config.RUNNER_API_OUTBOX`` is enabled, the state transitions, reports
+and process logs of submissions are not posted by the runner task itself.
+Instead, they are written into a SQLite database under
+``config.TEMPORARY_DIR/.outbox``, and a background :class:`OutboxSender`
+thread in each runner process will send them via the batch api
+(see :func:`railgun.website.api.api_handin_batch`).
+
+So the runner task may finish as soon as the submission has been graded,
+even if the website is slow or being restarted, and the results will never
+be lost until the website has accepted them.
+
+Each message carries a unique `msgid`, so that the website can discard the
+duplicated messages if a batch is sent twice (e.g., the response was lost).
+The messages of the same submission are always sent in order.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import closing
+
+from . import runconfig
+from .context import logger
+
+#: The schema of the outbox database.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    msgid TEXT NOT NULL UNIQUE,
+    action TEXT NOT NULL,
+    uuid TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    memo TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_try REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_uuid ON messages (uuid, next_try);
+'''
+
+#: The claimed messages will be sent again by any runner process after
+#: such seconds, if the claiming process has not acknowledged them (e.g.,
+#: it has been killed).
+CLAIM_EXPIRES = 10 + (runconfig.RUNNER_API_RETRIES + 1) * (
+    runconfig.RUNNER_API_CONNECT_TIMEOUT + runconfig.RUNNER_API_READ_TIMEOUT)
+
+
+class Outbox(object):
+    """The durable queue of website api messages, shared by all runner
+    processes on this machine.
+
+    :param path: The path of the SQLite database file.
+    :type path: :class:`str`
+    """
+
+    def __init__(self, path):
+        #: The path of the SQLite database file.
+        self.path = path
+
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            # The process outputs must not be read by the submissions.
+            os.makedirs(parent, 0700)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # The transactions are managed explicitly.
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def put(self, messages):
+        """Append `messages` to the outbox in one transaction.
+
+        :param messages: A :class:`list` of ``{"action": ..., "uuid": ...,
+            "payload": ...}`` messages, optionally with the `memo` of the
+            result.  A unique `msgid` will be assigned to each of them.
+        """
+        rows = [(uuid.uuid4().get_hex(), m['action'], m['uuid'],
+                 json.dumps(m['payload']),
+                 json.dumps(m['memo']) if m.get('memo') is not None else None)
+                for m in messages]
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO messages (msgid, action, uuid, payload, memo) '
+                'VALUES (?, ?, ?, ?, ?)', rows)
+            conn.execute('COMMIT')
+
+    def claim(self, limit):
+        """Take at most `limit` messages to be sent, in their creation order.
+
+        A submission whose earlier messages are being sent (or waiting to be
+        retried) by someone else will be skipped, so that the messages of
+        each submission are always received by the website in order.
+
+        :param limit: The maximum number of messages.
+        :type limit: :class:`int`
+        :return: A :class:`list` of (id, attempts, message).
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT id, attempts, msgid, action, uuid, payload, memo '
+                'FROM messages WHERE next_try <= ? AND uuid NOT IN '
+                '(SELECT uuid FROM messages WHERE next_try > ?) '
+                'ORDER BY id LIMIT ?', (now, now, limit)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE messages SET next_try = ? WHERE id = ?',
+                [(now + CLAIM_EXPIRES, r[0]) for r in rows]
+            )
+            conn.execute('COMMIT')
+        ret = []
+        for r in rows:
+            message = {'msgid': r[2], 'action': r[3], 'uuid': r[4],
+                       'payload': json.loads(r[5])}
+            if r[6] is not None:
+                message['memo'] = json.loads(r[6])
+            ret.append((r[0], r[1], message))
+        return ret
+
+    def ack(self, ids):
+        """Remove the messages which have been accepted by the website.
+
+        :param ids: The ids returned by :meth:`claim`.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('DELETE FROM messages WHERE id = ?',
+                             [(i,) for i in ids])
+            conn.execute('COMMIT')
+
+    def retry(self, ids, delay):
+        """Release the claimed messages, and send them again after `delay`
+        seconds.
+
+        :param ids: The ids returned by :meth:`claim`.
+        :param delay: The seconds to wait before retrying.
+        :type delay: :class:`float`
+        """
+        next_try = time.time() + delay
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'UPDATE messages SET next_try = ?, attempts = attempts + 1 '
+                'WHERE id = ?', [(next_try, i) for i in ids])
+            conn.execute('COMMIT')
+
+    def count(self):
+        """Get the number of messages in the outbox."""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+class OutboxSender(threading.Thread):
+    """The background thread that drains :class:`Outbox`.
+
+    The failed batches are retried with an exponential backoff of
+    ``config.RUNNER_API_BACKOFF`` seconds, limited by
+    ``config.RUNNER_OUTBOX_MAX_BACKOFF``.
+
+    :param outbox: The outbox to be drained.
+    :type outbox: :class:`Outbox`
+    :param client: The client to send messages.
+    :type client: :class:`~railgun.runner.apiclient.ApiClient`
+    """
+
+    #: Check the outbox for such seconds even if not waken up, since other
+    #: runner processes may leave their messages.
+    IDLE_INTERVAL = 1.0
+
+    def __init__(self, outbox, client):
+        super(OutboxSender, self).__init__(name='OutboxSender')
+        self.daemon = True
+        self.outbox = outbox
+        self.client = client
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """Notify the sender that new messages have been put."""
+        self._wakeup.set()
+
+    def send_once(self):
+        """Claim and send one batch of messages.
+
+        :return: Whether any message has been claimed.
+        """
+        claimed = self.outbox.claim(runconfig.RUNNER_OUTBOX_BATCH)
+        if not claimed:
+            return False
+        ids = [c[0] for c in claimed]
+        try:
+            self.client.post_batch([c[2] for c in claimed])
+        except Exception:
+            attempts = min(c[1] for c in claimed)
+            delay = min(runconfig.RUNNER_API_BACKOFF * (2 ** attempts),
+                        runconfig.RUNNER_OUTBOX_MAX_BACKOFF)
+            logger.exception('Cannot send %d messages, retry after %s secs.'
+                             % (len(ids), delay))
+            self.outbox.retry(ids, delay)
+        else:
+            self.outbox.ack(ids)
+        return True
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while self.send_once():
+                    pass
+            except Exception:
+                logger.exception('Cannot read the outbox.')
+            self._wakeup.wait(self.IDLE_INTERVAL)
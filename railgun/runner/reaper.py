@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/reaper.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the deferred cleanup of submission directories.
+
+Removing the working directory of a submission may take a long time if the
+student code has written thousands of files.  If
+``config.RUNNER_DEFERRED_CLEANUP`` is enabled, :func:`discard` only renames
+the directory into ``config.TEMPORARY_DIR/.trash``, which is atomic and
+cheap, so that the runner process may start the next submission at once.
+The directories in the trash are then removed by a background
+:class:`Reaper` thread of the same process, at the lowest best-effort I/O
+priority.
+
+The directories in the trash are named ``<pid>-<random>``, so each reaper
+only removes the directories of its own process.  The directories left by
+the processes which are no longer running (e.g., the workers which have
+crashed) are taken over by the first reaper that finds them, which happens
+when a reaper starts, and every :attr:`Reaper.SWEEP_INTERVAL` seconds.
+
+The working directories of submissions are also named ``<pid>-<uuid>``
+(see :class:`~railgun.runner.host.BaseHost`), and the score files are named
+``<uuid>.<pid>.json``.  Those left by the crashed workers are swept by
+:func:`sweep` when each worker process starts, whether or not
+``config.RUNNER_DEFERRED_CLEANUP`` is enabled.
+"""
+
+import os
+import uuid
+import shutil
+import threading
+
+from railgun.common.osutil import is_running, set_io_priority, \
+    IOPRIO_CLASS_BE
+from . import runconfig
+from .context import logger
+
+#: The directory of discarded submission directories.
+TRASH_DIR = os.path.join(runconfig.TEMPORARY_DIR, '.trash')
+
+
+class Reaper(threading.Thread):
+    """The background thread that removes the directories in the trash.
+
+    :param trash_dir: The path of the trash directory.
+    :type trash_dir: :class:`str`
+    """
+
+    #: Look for the directories left by dead processes for such seconds
+    #: even if not waken up.
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self, trash_dir):
+        super(Reaper, self).__init__(name='Reaper')
+        self.daemon = True
+        self.trash_dir = trash_dir
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """Notify the reaper that a directory has been discarded."""
+        self._wakeup.set()
+
+    def reap_once(self):
+        """Remove the directories of this process in the trash, and take
+        over the directories of dead processes.
+
+        :return: The number of removed directories.
+        """
+        count = 0
+        pid = os.getpid()
+        for name in os.listdir(self.trash_dir):
+            owner, _, rest = name.partition('-')
+            fpath = os.path.join(self.trash_dir, name)
+            if not owner.isdigit():
+                continue
+            if int(owner) != pid:
+                if is_running(int(owner)):
+                    continue
+                # Only one of the reapers can rename the directory.
+                try:
+                    newpath = os.path.join(self.trash_dir,
+                                           '%d-%s' % (pid, rest))
+                    os.rename(fpath, newpath)
+                    fpath = newpath
+                except OSError:
+                    continue
+            shutil.rmtree(fpath, ignore_errors=True)
+            count += 1
+        return count
+
+    def take_stale(self, temp_dir):
+        """Move the working directories under `temp_dir` left by the
+        processes which are no longer running into the trash of this
+        process, and remove their score files.
+
+        :param temp_dir: The directory of working directories, usually
+            ``config.TEMPORARY_DIR``.
+        :type temp_dir: :class:`str`
+        :return: The number of moved directories.
+        """
+        count = 0
+        pid = os.getpid()
+        for name in os.listdir(temp_dir):
+            owner, _, rest = name.partition('-')
+            fpath = os.path.join(temp_dir, name)
+            # The names of the runner's own directories start with a dot.
+            if not owner.isdigit() or is_running(int(owner)) or \
+                    not os.path.isdir(fpath):
+                continue
+            try:
+                os.rename(fpath, os.path.join(self.trash_dir,
+                                              '%d-%s' % (pid, rest)))
+                count += 1
+            except OSError:
+                continue
+        score_dir = os.path.join(temp_dir, '.scores')
+        if os.path.isdir(score_dir):
+            for name in os.listdir(score_dir):
+                owner = name.split('.')[-2:-1]
+                if owner and owner[0].isdigit() and \
+                        not is_running(int(owner[0])):
+                    try:
+                        os.remove(os.path.join(score_dir, name))
+                    except OSError:
+                        pass
+        return count
+
+    def run(self):
+        if not set_io_priority(IOPRIO_CLASS_BE, 7):
+            logger.debug('Could not set the I/O priority of reaper.')
+        while True:
+            self._wakeup.clear()
+            try:
+                self.reap_once()
+            except Exception:
+                logger.exception('Cannot remove the directories in trash.')
+            self._wakeup.wait(self.SWEEP_INTERVAL)
+
+
+# The process-wide reaper, and the process id which creates it.
+_reaper = None
+_reaper_pid = None
+
+
+def get_reaper():
+    """Get the process-wide :class:`Reaper`, and start it if necessary.
+
+    A new reaper will be started after the worker process is forked, since
+    the threads do not survive the fork.
+
+    :return: The :class:`Reaper` object.
+    """
+    global _reaper, _reaper_pid
+    if _reaper is None or _reaper_pid != os.getpid():
+        if not os.path.isdir(TRASH_DIR):
+            os.makedirs(TRASH_DIR, 0700)
+        _reaper = Reaper(TRASH_DIR)
+        _reaper_pid = os.getpid()
+        _reaper.start()
+    return _reaper
+
+
+def sweep():
+    """Remove the working directories and the score files left by the
+    crashed workers in background.  This should be called when a worker
+    process starts.
+    """
+    try:
+        reaper = get_reaper()
+        if reaper.take_stale(runconfig.TEMPORARY_DIR):
+            reaper.wake()
+    except Exception:
+        logger.exception('Cannot sweep the stale working directories.')
+
+
+def discard(tempdir):
+    """Move a temporary directory into the trash, which will be removed by
+    the reaper in background.  If it could not be moved, it will be removed
+    at once.
+
+    :param tempdir: The temporary directory.
+    :type tempdir: :class:`~railgun.common.tempdir.TempDir`
+    """
+    if not os.path.isdir(tempdir.path):
+        return
+    try:
+        reaper = get_reaper()
+        os.rename(tempdir.path, os.path.join(
+            reaper.trash_dir, '%d-%s' % (os.getpid(), uuid.uuid4().get_hex())))
+    except Exception:
+        logger.warning('Could not move %s into trash.' % tempdir.path,
+                       exc_info=1)
+        tempdir.close()
+    else:
+        reaper.wake()
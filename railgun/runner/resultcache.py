@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/resultcache.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module memoizes the grading results of deterministic homeworks.
+
+The students often submit byte-identical archives again and again, and the
+admins may rerun all the submissions of a homework after fixing a typo in
+its description.  If a homework is marked as deterministic in ``code.xml``::
+
+    <runner entry="run.py" deterministic="true" />
+
+the runner will store the reported score, the exit code and the truncated
+outputs of each submission in a :class:`ResultCache`, keyed by the digest
+of the homework definition and code package plus the digest of the
+submission content.  A later submission with the same key will be answered
+from the cache at once, without spawning the sandbox.
+
+The score is passed to the runner by the sandbox through a score file (see
+:meth:`~railgun.runner.host.BaseHost.take_score`), and the result is stored
+only after the website has accepted this score (see :func:`put_memo`), so
+a memoized result is always the one recorded for an earlier submission.
+The cache is a SQLite database under ``config.TEMPORARY_DIR/.results``,
+shared by all the runner processes on this machine, and holds at most
+``config.RUNNER_RESULT_CACHE_SIZE`` least recently used results.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+
+from . import runconfig
+from .context import logger
+from railgun.common.hw import parse_bool
+
+#: The schema of the result cache database.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    score TEXT NOT NULL,
+    exitcode INTEGER,
+    stdout BLOB,
+    stderr BLOB,
+    stats TEXT NOT NULL,
+    atime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_atime ON results (atime);
+'''
+
+
+def is_deterministic(hwcode):
+    """Whether the results of `hwcode` only depend on the submission?
+
+    :param hwcode: The homework code package.
+    :type hwcode: :class:`~railgun.common.hw.HwCode`
+    :return: :data:`True` if the runner parameters of `hwcode` declare
+        ``deterministic="true"``.
+    """
+    params = hwcode.runner_params
+    return params is not None and parse_bool(params.get('deterministic'))
+
+
+def make_key(hw, hwcode, manifest, *parts):
+    """Make the cache key of a submission.
+
+    Besides the files of the code package, the key covers ``hw.xml``,
+    ``code.xml`` and the effective file rules, which decide the files
+    taken from the submission.
+
+    :param hw: The homework.
+    :type hw: :class:`~railgun.common.hw.Homework`
+    :param hwcode: The homework code package.
+    :type hwcode: :class:`~railgun.common.hw.HwCode`
+    :param manifest: The up-to-date file manifest of `hwcode`, whose
+        content digest is taken.
+    :type manifest: :class:`~railgun.common.fileutil.FileManifest`
+    :param parts: The digest of the submission content, and any other
+        attributes of the submission that may affect the result.
+    :return: The hex digest string.
+    """
+    h = hashlib.sha256()
+    h.update('%s\0%s\0%s\0%s\0' % (hw.digest, hwcode.lang, hwcode.digest,
+                                   manifest.digest))
+    for action, pattern in hw.get_file_rules(hwcode.lang).data:
+        h.update('%s\0%s\0' % (action, pattern.pattern))
+    for p in parts:
+        h.update('%s\0' % p)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """The LRU cache of grading results.
+
+    :param path: The directory of the cache.
+    :type path: :class:`str`
+    :param capacity: The maximum number of results.
+    :type capacity: :class:`int`
+    """
+
+    def __init__(self, path, capacity):
+        #: The directory of the cache.
+        self.path = path
+
+        #: The maximum number of results.
+        self.capacity = capacity
+
+        if not os.path.isdir(path):
+            # The results must not be read or forged by the submissions.
+            os.makedirs(path, 0700)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # The transactions are managed explicitly.
+        return sqlite3.connect(os.path.join(self.path, 'results.db'),
+                               timeout=60, isolation_level=None)
+
+    def get(self, key):
+        """Get the memoized result, and mark it as recently used.
+
+        :param key: The cache key from :func:`make_key`.
+        :return: A :class:`dict` of ``{"score": plain score object,
+            "exitcode": ..., "stdout": ..., "stderr": ..., "stats": ...}``,
+            or :data:`None` if not found.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT score, exitcode, stdout, stderr, stats FROM results '
+                'WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE results SET atime = ? WHERE key = ?',
+                             (time.time(), key))
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        return {
+            'score': json.loads(row[0]),
+            'exitcode': row[1],
+            'stdout': str(row[2]) if row[2] is not None else None,
+            'stderr': str(row[3]) if row[3] is not None else None,
+            'stats': json.loads(row[4]),
+        }
+
+    def put(self, key, score, exitcode, stdout, stderr, stats):
+        """Memoize a result, and evict the least recently used ones if
+        there are more than :attr:`capacity` results.
+
+        :param key: The cache key from :func:`make_key`.
+        :param score: The plain score object.
+        :type score: :class:`dict`
+        :param exitcode: The exit code of the submission.
+        :param stdout: The truncated standard output.
+        :type stdout: :class:`str`
+        :param stderr: The truncated standard error output.
+        :type stderr: :class:`str`
+        :param stats: The statistics of the submission process.
+        :type stats: :class:`dict`
+        """
+        def blob(s):
+            return sqlite3.Binary(s) if s is not None else None
+
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT OR REPLACE INTO results (key, score, exitcode, '
+                'stdout, stderr, stats, atime) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, json.dumps(score), exitcode, blob(stdout),
+                 blob(stderr), json.dumps(stats), time.time())
+            )
+            conn.execute(
+                'DELETE FROM results WHERE key IN (SELECT key FROM results '
+                'ORDER BY atime DESC LIMIT -1 OFFSET ?)', (self.capacity,)
+            )
+            conn.execute('COMMIT')
+
+    def count(self):
+        """Get the number of memoized results."""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+# The result cache of this process, created on first use.
+_result_cache = None
+
+
+def get_result_cache():
+    """Get the :class:`ResultCache` of this runner process.
+
+    :return: The result cache, or :data:`None` if it is disabled by
+        ``config.RUNNER_RESULT_CACHE_SIZE``.
+    """
+    global _result_cache
+    if _result_cache is None and runconfig.RUNNER_RESULT_CACHE_SIZE > 0:
+        _result_cache = ResultCache(
+            os.path.join(runconfig.TEMPORARY_DIR, '.results'),
+            runconfig.RUNNER_RESULT_CACHE_SIZE
+        )
+    return _result_cache
+
+
+def put_memo(memo, score):
+    """Memoize the result of a submission, after its score has been accepted
+    by the website.
+
+    :param memo: The pending result of the submission, see
+        :attr:`~railgun.runner.handin.BaseHandin.memo`.
+    :type memo: :class:`dict`
+    :param score: The plain score object accepted by the website.
+    :type score: :class:`dict`
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return
+    score = dict((k, v) for k, v in score.iteritems() if k != 'uuid')
+    try:
+        cache.put(memo['key'], score, memo['exitcode'],
+                  memo['stdout'].encode('utf-8'),
+                  memo['stderr'].encode('utf-8'), memo['stats'])
+    except Exception:
+        logger.exception('Cannot memoize the result %s.' % memo.get('key'))
@@ -17,6 +17,9 @@ WEBSITE_API_BASEURL = WEBSITE_BASEURL + '/api'
 # NOTE: format of Redis server is redis://:password@hostname:port/db_number
 BROKER_URL = 'redis://localhost:6379/0'
 
+# ---- specify the Redis server of the fair scheduler ----
+RUNNER_SCHEDULER_REDIS = BROKER_URL
+
 # ---- celery run queues ----
 CELERY_DEFAULT_QUEUE = 'default'
 CELERY_CREATE_MISSING_QUEUES = True
@@ -25,6 +28,9 @@ CELERY_ROUTES = {
     # 'railgun.runner.tasks.helloWorld': {'queue': 'example'}
 }
 
+# ---- autoscaler of the workers started with --autoscale ----
+CELERYD_AUTOSCALER = 'railgun.runner.autoscale:LoadAwareAutoscaler'
+
 # ---- List of modules to import when celery starts ----
 CELERY_IMPORTS = ()
 
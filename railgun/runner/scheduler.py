@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/scheduler.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the fair scheduler of submissions.
+
+The Celery queue is in FIFO order, so a batch of reruns or a class-wide
+regrade would starve the fresh submissions of students.  If
+``config.RUNNER_SCHEDULER`` is enabled, the submissions are not put into
+the Celery queue directly.  Instead, the website pushes each of them into
+a :class:`FairScheduler` in Redis, along with a
+:func:`~railgun.runner.tasks.dispatch` task into the Celery queue.  The
+dispatch task then pops the submission that should be run next, at the
+time when a runner is available.
+
+The submissions are divided into priority classes (see
+:data:`PRIORITY_CLASSES`), and a class is served only if all the classes
+above it are empty.  Within a class, the users are served in round-robin
+order, one submission at a time.  A user whose submission is close to the
+next deadline of its homework gets a head start of at most
+``config.RUNNER_SCHEDULER_DEADLINE_BOOST`` seconds.
+"""
+
+import json
+import time
+
+import redis
+
+from . import runconfig
+from railgun.common.dateutil import utc_now
+
+#: The priority classes of submissions, from the highest to the lowest.
+#:
+#: *   ``interactive``: The fresh submissions of students.
+#: *   ``rerun``: The submissions rerun by the admins one by one.
+#: *   ``regrade``: The bulk regrade of a whole homework.
+PRIORITY_CLASSES = ('interactive', 'rerun', 'regrade')
+
+# Append a job to the queue of a user, and add the user to the round-robin
+# ring of the priority class if absent.
+#
+# KEYS: the ring, the queue of the user, the depth hash.
+# ARGV: user, score of the user in the ring, job, priority class.
+_PUSH_SCRIPT = '''
+redis.call('RPUSH', KEYS[2], ARGV[3])
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+  redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+redis.call('HINCRBY', KEYS[3], ARGV[4], 1)
+'''
+
+# Pop the first job of the first user in the highest non-empty class, and
+# move that user to the end of the ring if there are more jobs.
+#
+# KEYS: the depth hash.
+# ARGV: key prefix, current time, priority classes.
+_POP_SCRIPT = '''
+for i = 3, #ARGV do
+  local ring = ARGV[1] .. ARGV[i] .. ':ring'
+  while true do
+    local users = redis.call('ZRANGE', ring, 0, 0)
+    if #users == 0 then
+      break
+    end
+    local queue = ARGV[1] .. ARGV[i] .. ':user:' .. users[1]
+    local job = redis.call('LPOP', queue)
+    if redis.call('LLEN', queue) > 0 then
+      redis.call('ZADD', ring, ARGV[2], users[1])
+    else
+      redis.call('ZREM', ring, users[1])
+    end
+    if job then
+      redis.call('HINCRBY', KEYS[1], ARGV[i], -1)
+      return job
+    end
+  end
+end
+return nil
+'''
+
+
+class FairScheduler(object):
+    """The priority-aware and per-user fair queue of runner tasks.
+
+    :param client: The Redis client.
+    :type client: :class:`redis.StrictRedis`
+    :param prefix: The prefix of all the Redis keys.
+    :type prefix: :class:`str`
+    """
+
+    def __init__(self, client, prefix='railgun:scheduler:'):
+        self.client = client
+        self.prefix = prefix
+        self._push = client.register_script(_PUSH_SCRIPT)
+        self._pop = client.register_script(_POP_SCRIPT)
+
+    @property
+    def depth_key(self):
+        return self.prefix + 'depth'
+
+    def push(self, priority, user, task, args, deadline=None):
+        """Queue a runner task.
+
+        :param priority: One of :data:`PRIORITY_CLASSES`.
+        :type priority: :class:`str`
+        :param user: The id of the user who owns the submission.
+        :param task: The name of the runner task.
+        :type task: :class:`str`
+        :param args: The arguments of the runner task.
+        :type args: :class:`list`
+        :param deadline: The next deadline of the homework.
+        :type deadline: :class:`~datetime.datetime`
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError('Unknown priority class %r.' % priority)
+        # The closer the deadline is, the earlier the user is served.
+        score = time.time()
+        window = runconfig.RUNNER_SCHEDULER_DEADLINE_BOOST
+        if deadline is not None and window:
+            remain = (deadline - utc_now()).total_seconds()
+            if remain >= 0:
+                score -= max(window - remain, 0)
+        job = json.dumps({'task': task, 'args': list(args)})
+        self._push(
+            keys=[self.prefix + priority + ':ring',
+                  '%s%s:user:%s' % (self.prefix, priority, user),
+                  self.depth_key],
+            args=[user, score, job, priority]
+        )
+
+    def pop(self):
+        """Take the runner task that should be run next.
+
+        :return: A :class:`dict` of ``{"task": name, "args": arguments}``,
+            or :data:`None` if the scheduler is empty.
+        """
+        job = self._pop(keys=[self.depth_key],
+                        args=[self.prefix, time.time()] +
+                        list(PRIORITY_CLASSES))
+        return json.loads(job) if job is not None else None
+
+    def depth(self):
+        """Get the number of queued tasks in each priority class.
+
+        :return: A :class:`dict` from priority classes to numbers.
+        """
+        ret = dict.fromkeys(PRIORITY_CLASSES, 0)
+        for k, v in self.client.hgetall(self.depth_key).iteritems():
+            if k in ret:
+                ret[k] = max(int(v), 0)
+        return ret
+
+    def clear(self):
+        """Discard all the queued tasks."""
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+# The scheduler of this process, created on first use.
+_scheduler = None
+
+
+def get_scheduler():
+    """Get the :class:`FairScheduler` connected to
+    ``config.RUNNER_SCHEDULER_REDIS``.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler(
+            redis.StrictRedis.from_url(runconfig.RUNNER_SCHEDULER_REDIS))
+    return _scheduler
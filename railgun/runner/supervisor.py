@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/supervisor.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the supervisor of runner workers.
+
+``python runner.py supervise`` starts one Celery worker for each queue in
+``config.RUNNER_QUEUES``, and restarts the workers if they crash.  The
+workers are started with ``--autoscale``, so that each of them grows and
+shrinks between a minimum and a maximum number of runner processes by the
+:class:`~railgun.runner.autoscale.LoadAwareAutoscaler`.  The supervisor
+also serves the runner metrics (see :mod:`railgun.runner.metrics`) on
+``config.RUNNER_METRICS_PORT``, and removes the submission directories
+left in the trash by the crashed workers (see :mod:`railgun.runner.reaper`).
+
+The maximum concurrency of a worker is ``config.RUNNER_MAX_CONCURRENCY``,
+or the number of CPUs if not given.  If the system accounts are assigned by
+a credential server (see :mod:`railgun.runner.credential`), the accounts
+are divided among the queues sharing that server, since a submission could
+not run without an account.  The ``online`` queue uses the online accounts,
+while the other queues use the offline accounts.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import multiprocessing
+import subprocess
+
+from . import runconfig
+from .metrics import serve_metrics
+from .reaper import get_reaper
+from .credential import count_offline_users, count_online_users
+
+logger = logging.getLogger(__name__)
+
+#: A worker which has been running for such seconds is considered healthy,
+#: and the delay before restarting it will be reset.
+HEALTHY_SECONDS = 60
+
+
+def count_accounts(queue):
+    """Get the number of system accounts available to a queue.
+
+    :param queue: The name of the run queue.
+    :type queue: :class:`str`
+    :return: The number of accounts, or :data:`None` if not limited.
+    """
+    try:
+        if queue == 'online':
+            return count_online_users()
+        return count_offline_users()
+    except Exception:
+        logger.warning('Could not get the number of system accounts for '
+                       'queue "%s".' % queue, exc_info=1)
+        return None
+
+
+def plan_concurrency(queues):
+    """Decide the concurrency range of the worker for each queue.
+
+    :param queues: The names of the run queues.
+    :type queues: :class:`list` of :class:`str`
+    :return: A :class:`dict` from queue names to (`min`, `max`) tuples.
+    """
+    max_procs = runconfig.RUNNER_MAX_CONCURRENCY or \
+        multiprocessing.cpu_count()
+    # The queues sharing the same credential server divide its accounts.
+    sharing = {}
+    for q in queues:
+        key = 'online' if q == 'online' else 'offline'
+        sharing.setdefault(key, []).append(q)
+
+    ret = {}
+    for group in sharing.itervalues():
+        accounts = count_accounts(group[0])
+        for q in group:
+            hi = max_procs
+            if accounts is not None:
+                hi = min(hi, accounts // len(group))
+            hi = max(hi, 1)
+            lo = min(max(runconfig.RUNNER_MIN_CONCURRENCY, 0), hi)
+            ret[q] = (lo, hi)
+    return ret
+
+
+def worker_args(queue, concurrency, logfile):
+    """Make the command line arguments of a Celery worker.
+
+    :param queue: The name of the run queue.
+    :type queue: :class:`str`
+    :param concurrency: The fixed number of runner processes, or a
+        (`min`, `max`) tuple to enable autoscaling.
+    :param logfile: The path of the log file.
+    :type logfile: :class:`str`
+    :return: A :class:`list` of arguments.
+    """
+    if isinstance(concurrency, tuple):
+        scale = '--autoscale=%d,%d' % (concurrency[1], concurrency[0])
+    else:
+        scale = '--concurrency=%d' % concurrency
+    return [
+        'celery',
+        '-A',
+        'railgun.runner.context',
+        'worker',
+        '-Q',
+        queue,
+        '-n',
+        '%s@%%h' % queue,
+        scale,
+        '--logfile=%s' % logfile,
+    ]
+
+
+class WorkerProcess(object):
+    """The state of a supervised worker.
+
+    :param queue: The name of the run queue.
+    :type queue: :class:`str`
+    :param args: The command line arguments.
+    :type args: :class:`list`
+    """
+
+    def __init__(self, queue, args):
+        #: The name of the run queue.
+        self.queue = queue
+
+        #: The command line arguments.
+        self.args = args
+
+        #: The :class:`subprocess.Popen` object, or :data:`None` if the
+        #: worker is not running.
+        self.proc = None
+
+        #: The time when the worker was started.
+        self.start_time = None
+
+        #: The worker will not be restarted before this time.
+        self.next_start = 0
+
+        #: The delay (in seconds) before the next restart.
+        self.backoff = 1
+
+
+class Supervisor(object):
+    """Run and watch the workers of run queues.
+
+    :param queues: The names of the run queues.
+    :type queues: :class:`list` of :class:`str`
+    :param env: The environment variables of the workers.
+    :type env: :class:`dict`
+    :param logdir: The directory of the worker log files.
+    :type logdir: :class:`str`
+    """
+
+    def __init__(self, queues, env, logdir):
+        self.env = env
+        self.workers = []
+        self._stopping = False
+
+        plan = plan_concurrency(queues)
+        for q in queues:
+            logfile = os.path.join(logdir, 'celery-%s.log' % q)
+            args = worker_args(q, plan[q], logfile)
+            logger.info('Worker of queue "%s": %s' % (q, ' '.join(args)))
+            self.workers.append(WorkerProcess(q, args))
+
+    def _start(self, w):
+        w.proc = subprocess.Popen(w.args, env=self.env)
+        w.start_time = time.time()
+        logger.info('Started worker of queue "%s" (pid %d).' %
+                    (w.queue, w.proc.pid))
+
+    def _check(self, w):
+        exitcode = w.proc.poll()
+        if exitcode is None:
+            return
+        uptime = time.time() - w.start_time
+        w.proc = None
+        # Restart the crashing workers with exponential backoff, so that a
+        # broken configuration will not spin the CPU.
+        if uptime >= HEALTHY_SECONDS:
+            w.backoff = 1
+        w.next_start = time.time() + w.backoff
+        logger.warning('Worker of queue "%s" exited with code %s after %d '
+                       'seconds, restarting in %d seconds.' %
+                       (w.queue, exitcode, uptime, w.backoff))
+        w.backoff = min(w.backoff * 2, runconfig.RUNNER_RESTART_MAX_BACKOFF)
+
+    def stop(self, *args):
+        """Ask the supervisor to stop all the workers and exit."""
+        self._stopping = True
+
+    def run(self):
+        """Run the workers until :meth:`stop` is called, or SIGTERM or
+        SIGINT is received.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while not self._stopping:
+            for w in self.workers:
+                if w.proc is not None:
+                    self._check(w)
+                if w.proc is None and time.time() >= w.next_start:
+                    self._start(w)
+            time.sleep(1)
+
+        # Warm shutdown: the workers finish the running submissions.
+        for w in self.workers:
+            if w.proc is not None and w.proc.poll() is None:
+                w.proc.send_signal(signal.SIGTERM)
+        for w in self.workers:
+            if w.proc is not None:
+                w.proc.wait()
+        logger.info('All workers have exited.')
+
+
+def supervise(env, logdir):
+    """Run the workers of ``config.RUNNER_QUEUES`` until terminated.
+
+    :param env: The environment variables of the workers.
+    :type env: :class:`dict`
+    :param logdir: The directory of the worker log files.
+    :type logdir: :class:`str`
+    """
+    logging.basicConfig(
+        stream=sys.stderr, level=logging.INFO,
+        format='[%(asctime)s: %(levelname)s/supervisor] %(message)s')
+    if runconfig.RUNNER_METRICS_PORT:
+        serve_metrics(runconfig.RUNNER_METRICS_PORT)
+        logger.info('Serving runner metrics at port %d.' %
+                    runconfig.RUNNER_METRICS_PORT)
+    if runconfig.RUNNER_DEFERRED_CLEANUP:
+        # Remove the directories left in the trash by crashed workers.
+        get_reaper()
+    Supervisor(list(runconfig.RUNNER_QUEUES), env, logdir).run()
@@ -32,14 +32,52 @@ process::
 :ref:`celery:guide-calling` about how to call a task.
 """
 
-from . import runconfig, permcheck
-from .apiclient import ApiClient, report_error, report_start
+import time
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from . import metrics, permcheck, runconfig
+from .apiclient import get_client, report_error, report_start
 from .context import app, logger
 from .handin import PythonHandin, NetApiHandin, InputClassHandin
 from .errors import (RunnerError, InternalServerError, NonUTF8OutputError,
-                     RunnerPermissionError)
+                     RunnerPermissionError, RunnerTimeout)
+from .reaper import sweep
+from .scheduler import get_scheduler
 from railgun.common.hw import HwScore
 from railgun.common.lazy_i18n import lazy_gettext
+from railgun.common.osutil import monotonic
+
+
+def _merge_timings(stats, timings, start):
+    # Put the stage timings of `run_handin` and the total seconds since
+    # `start` into a copy of `stats`.
+    ret = dict(stats)
+    ret['timings'] = dict(stats.get('timings') or {})
+    ret['timings'].update(timings)
+    ret['timings']['total'] = monotonic() - start
+    return ret
+
+
+@worker_process_init.connect
+def _sweep(**kwargs):
+    # The previous worker may have crashed while running submissions.
+    sweep()
+
+
+@worker_process_shutdown.connect
+def _flush_metrics(**kwargs):
+    # The metrics recorded since the last timed flush.
+    metrics.registry.flush()
+
+
+def _report_score(api, handid, handler):
+    # Report the score taken by `handler`, if it has been created and the
+    # sandbox has written a score.  The result is memoized only if the
+    # website accepts this score.
+    score = getattr(handler, 'score', None)
+    if score is not None:
+        api.report(handid, score, memo=getattr(handler, 'memo', None))
 
 
 def run_handin(handler, handid, hwid):
@@ -58,18 +96,36 @@ def run_handin(handler, handid, hwid):
     :param hwid: The uuid of the homework.
     :type hwid: :class:`str`
     """
-    # Create the api client, we may use it once or twice
-    api = ApiClient(runconfig.WEBSITE_API_BASEURL)
+    # Get the api client, we may use it once or twice
+    api = get_client()
     # Immediately report error if permcheck has error
     if permcheck.checker.has_error():
         report_error(handid, RunnerPermissionError())
+        metrics.errors.inc(error='RunnerPermissionError')
         return
+    # The metrics are flushed by the registry on a timer, instead of on
+    # each submission.
+    metrics.inflight.inc()
+    lang = 'unknown'
+    outcome = 'internal_error'
+    start = monotonic()
+    start_time = time.time()
+    # The seconds spent in each stage, besides those measured by the host.
+    timings = {}
     try:
-        report_start(handid)
-        # create and launch this handler
-        if callable(handler):
-            handler = handler()
-        exitcode, stdout, stderr = handler.execute()
+        with metrics.stage(timings, 'report_start'):
+            report_start(handid)
+        with metrics.stage(timings, 'setup'):
+            # create and launch this handler
+            if callable(handler):
+                handler = handler()
+            lang = handler.lang
+        # The time between queued by the website and started by us.
+        queued_at = handler.options.get('queued_at')
+        if queued_at:
+            timings['queue'] = max(start_time - queued_at, 0)
+        with metrics.stage_seconds.time(stage='execute'):
+            exitcode, stdout, stderr = handler.execute()
         # try to convert stdout & stderr to unicode in UTF-8 encoding
         # if not success, report the client has produced non UTF-8 output
         try:
@@ -78,7 +134,8 @@ def run_handin(handler, handid, hwid):
         except UnicodeError:
             # This routine will terminate the try-catch structure so that
             # we must report the exitcode earlier as well.
-            api.proclog(handid, exitcode, None, None)
+            api.proclog(handid, exitcode, None, None,
+                        _merge_timings(handler.stats, timings, start))
             raise NonUTF8OutputError()
         # log the handin execution
         if exitcode != 0:
@@ -91,42 +148,78 @@ def run_handin(handler, handid, hwid):
             )
         # Report failure if exitcode != 0. In this case the host itself may
         # not have the chance to report handin scores
-        if exitcode != 0:
-            # We do not raise RunnerError here, because under this situation,
-            # we must have logged such exception, and do not want to log
-            # again.
-            score = HwScore(
-                False,
-                lazy_gettext('Exitcode %(exitcode)s != 0.',
-                             exitcode=exitcode)
-            )
-            api.report(handid, score)
-        # Update exitcode, stdout and stderr here, which cannot be set in
-        # the host itself.
         #
-        # This process may also change Handin.state, if previous process
-        # exit with code 0 before it reported the score. See website/api.py
-        # for more details.
-        api.proclog(handid, exitcode, stdout, stderr)
+        # We do not raise RunnerError here, because under this situation,
+        # we must have logged such exception, and do not want to log again.
+        #
+        # The report and the process log are sent in one batch request.
+        with metrics.stage_seconds.time(stage='report'), api.batch():
+            # The score taken from the sandbox (or memoized) is reported by
+            # us, and the website only accepts the first report.
+            _report_score(api, handid, handler)
+            if exitcode != 0:
+                score = HwScore(
+                    False,
+                    lazy_gettext('Exitcode %(exitcode)s != 0.',
+                                 exitcode=exitcode)
+                )
+                api.report(handid, score)
+            # Update exitcode, stdout and stderr here, which cannot be set
+            # in the host itself.
+            #
+            # This process may also change Handin.state, if previous process
+            # exit with code 0 before it reported the score. See
+            # website/api.py for more details.
+            #
+            # The outputs have been truncated by the host, while their total
+            # sizes are carried in `handler.stats`.
+            api.proclog(handid, exitcode, stdout, stderr,
+                        _merge_timings(handler.stats, timings, start))
+        outcome = 'ok' if exitcode == 0 else 'nonzero_exit'
         # Log that we've succesfully done this job.
         logger.info(
             'Submission[%(handid)s] of hw[%(hwid)s]: OK.' %
             {'handid': handid, 'hwid': hwid}
         )
     except RunnerError, ex:
+        outcome = 'runner_error'
+        metrics.errors.inc(error=ex.__class__.__name__)
+        if isinstance(ex, RunnerTimeout):
+            metrics.timeouts.inc(lang=lang)
         # RunnerError is logically OK and sent to client only.
         # So we just log the message of this exception, not exception detail.
         logger.warning(
             'Submission[%(handid)s] of hw[%(hwid)s]: %(message)s.' %
             {'handid': handid, 'hwid': hwid, 'message': ex.message}
         )
-        report_error(handid, ex)
+        with metrics.stage_seconds.time(stage='report'), api.batch():
+            # The sandbox may have reported its score before the error.
+            _report_score(api, handid, handler)
+            report_error(handid, ex)
+            # The outputs and the resource usage are still valuable if the
+            # process has been killed (e.g., on timeout or resource limits).
+            stats = getattr(handler, 'stats', None)
+            if stats is not None:
+                stats = _merge_timings(stats, timings, start)
+            exitcode, stdout, stderr = getattr(ex, 'output',
+                                               (None, None, None))
+            if stdout is not None or (stats and stats.get('usage')):
+                if stdout is not None:
+                    stdout = unicode(stdout, 'utf-8', 'replace')
+                    stderr = unicode(stderr, 'utf-8', 'replace')
+                api.proclog(handid, exitcode, stdout, stderr, stats)
     except Exception:
         logger.exception(
             'Error executing submission "%(handid)s" for homework "%(hwid)s".'
             % {'handid': handid, 'hwid': hwid}
         )
-        report_error(handid, InternalServerError())
+        with api.batch():
+            _report_score(api, handid, handler)
+            report_error(handid, InternalServerError())
+    finally:
+        metrics.stage_seconds.observe(monotonic() - start, stage='total')
+        metrics.submissions.inc(lang=lang, outcome=outcome)
+        metrics.inflight.inc(-1)
 
 
 @app.task
@@ -138,9 +231,13 @@ def run_python(handid, hwid, upload, options):
     :type handid: :class:`str`
     :param hwid: The uuid of the homework.
     :type hwid: :class:`str`
-    :param upload: The uploaded archive file content encoded in base64.
+    :param upload: The uploaded archive file content encoded in base64,
+        or :data:`None` if the file is in the blob store.
     :type upload: :class:`str`
-    :param options: {'filename': the uploaded filename}
+    :param options: {'filename': the uploaded filename,
+        'digest': the digest of uploaded file in the blob store,
+        'size': the size of uploaded file,
+        'queued_at': the timestamp when the submission was queued}
     :type options: :class:`dict`
     """
     # The actual creation of `PythonHandin` is delayed until `run_handin` is
@@ -163,7 +260,8 @@ def run_netapi(handid, hwid, remote_addr, options):
     :type hwid: :class:`str`
     :param remote_addr: The submitted url address.
     :type remote_addr: :class:`str`
-    :param options: {}
+    :param options: {'queued_at': the timestamp when the submission was
+        queued}
     :type options: :class:`dict`
     """
     return run_handin(
@@ -184,7 +282,8 @@ def run_input(handid, hwid, csvdata, options):
     :type hwid: :class:`str`
     :param csvdata: The submitted csv file content.
     :type csvdata: :class:`str`
-    :param options: {}
+    :param options: {'queued_at': the timestamp when the submission was
+        queued}
     :type options: :class:`dict`
     """
     return run_handin(
@@ -192,3 +291,50 @@ def run_input(handid, hwid, csvdata, options):
         handid,
         hwid
     )
+
+
+#: The tasks that can be queued in the fair scheduler.
+SCHEDULED_TASKS = {
+    'run_python': run_python,
+    'run_netapi': run_netapi,
+    'run_input': run_input,
+}
+
+
+@app.task
+def dispatch():
+    """Run the submission chosen by the fair scheduler.
+
+    Each submission queued in the scheduler is accompanied by one
+    :func:`dispatch` task in the Celery queue, so that the submission to
+    run is decided when a runner becomes available.  See
+    :mod:`railgun.runner.scheduler` for more details.
+    """
+    job = get_scheduler().pop()
+    if job is None:
+        return
+    task = SCHEDULED_TASKS[job['task']]
+    return task(*job['args'])
+
+
+def schedule(task, args, priority, user, deadline=None):
+    """Queue a runner task of submission.
+
+    If ``config.RUNNER_SCHEDULER`` is enabled, the task will be pushed
+    into the fair scheduler, otherwise it will be put into the Celery queue
+    directly.
+
+    :param task: One of :data:`SCHEDULED_TASKS`.
+    :param args: The arguments of the task.
+    :type args: :class:`tuple`
+    :param priority: One of
+        :data:`~railgun.runner.scheduler.PRIORITY_CLASSES`.
+    :type priority: :class:`str`
+    :param user: The id of the user who owns the submission.
+    :param deadline: The next deadline of the homework.
+    :type deadline: :class:`~datetime.datetime`
+    """
+    if not runconfig.RUNNER_SCHEDULER:
+        return task.delay(*args)
+    get_scheduler().push(priority, user, task.__name__, args, deadline)
+    dispatch.delay()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/template.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module maintains the template trees of homework code packages.
+
+Copying every file of a code package into the working directory of each
+submission is expensive if the package carries large datasets or fixtures.
+Instead, the runner keeps an immutable copy of each code package under
+``config.TEMPORARY_DIR/.templates``, whose directory name is the content
+digest of the file manifest.  The files are read-only, so the working
+directory of a submission can be materialized by hard links (or
+copy-on-write clones) to the template files, except for those which the
+students may overwrite.
+
+A template tree is rebuilt automatically when any file in the code package
+is added, removed or modified, which is detected by the file manifest of the
+code package (see :class:`~railgun.common.fileutil.FileManifest`).
+"""
+
+import os
+import time
+import uuid
+import errno
+import shutil
+
+from railgun.common.fileutil import clonefile
+from . import runconfig
+from .context import logger
+
+#: Remove the unused template trees after such seconds.
+TEMPLATE_EXPIRES = 24 * 3600
+
+
+class CodeTemplate(object):
+    """The read-only template tree of a homework code package.
+
+    :param hwcode: The homework code package.
+    :type hwcode: :class:`~railgun.common.hw.HwCode`
+    :param manifest: The up-to-date file manifest of `hwcode`.
+    :type manifest: :class:`~railgun.common.fileutil.FileManifest`
+    """
+
+    def __init__(self, hwcode, manifest):
+        #: The homework code package.
+        self.hwcode = hwcode
+
+        #: A sorted :class:`list` of (relpath, mode) of the files.
+        self.files = sorted((e.path, e.mode) for e in manifest.files())
+
+        #: The content digest of the file manifest.
+        self.digest = manifest.digest
+
+        #: The root path of the template tree.
+        self.path = os.path.join(
+            runconfig.TEMPORARY_DIR, '.templates', self.digest)
+
+    def exists(self):
+        """Whether the template tree has been built?"""
+        return os.path.isdir(self.path)
+
+    def build(self):
+        """Build the template tree if it does not exist.
+
+        The tree is built in a temporary directory and then renamed into
+        :attr:`path`, so that the runner processes sharing the same
+        ``config.TEMPORARY_DIR`` will never see an incomplete template.
+        """
+        if self.exists():
+            return
+        building = '%s.%s' % (self.path, uuid.uuid4().get_hex())
+        try:
+            os.makedirs(building, 0700)
+            for f, mode in self.files:
+                srcpath = os.path.join(self.hwcode.path, f)
+                dstpath = os.path.join(building, f)
+                parent_path = os.path.dirname(dstpath)
+                if not os.path.isdir(parent_path):
+                    os.makedirs(parent_path, 0700)
+                shutil.copyfile(srcpath, dstpath)
+                # The template files must never be modified.
+                os.chmod(dstpath, 0555 if mode & 0111 else 0444)
+            try:
+                os.rename(building, self.path)
+            except OSError, ex:
+                # Another runner process has built the same template.
+                if ex.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            if os.path.isdir(building):
+                shutil.rmtree(building)
+        logger.info('Built template %s for %s.' %
+                    (self.digest, self.hwcode.path))
+
+    def touch(self):
+        """Mark the template tree as being used."""
+        try:
+            os.utime(self.path, None)
+        except OSError:
+            pass
+
+    def materialize(self, tempdir, should_copy, hardlink, mode=0700):
+        """Populate `tempdir` with the files of this template.
+
+        :param tempdir: The working directory of a submission.
+        :type tempdir: :class:`~railgun.common.tempdir.TempDir`
+        :param should_copy: A callback to determine whether the given file
+            (relative path) must be a private copy, since it may be
+            overwritten.
+        :type should_copy: method(fpath) -> bool
+        :param hardlink: Whether or not to make hard links to the template
+            files?  Only safe if the submission runs at another system
+            account, since the owner of a file can always change its mode.
+        :type hardlink: :class:`bool`
+        :param mode: Unix file system mode for new directories and private
+            files, which are owned by the `owner` of `tempdir`.  Hard links
+            keep the read-only mode and the owner of the template.
+        :type mode: :class:`int`
+
+        :return: A :class:`set` of full paths which are hard links.
+        """
+        linked = set()
+        for f, _ in self.files:
+            srcpath = os.path.join(self.path, f)
+            dstpath = tempdir.fullpath(f)
+            tempdir.makedirs(os.path.dirname(dstpath), mode)
+            if clonefile(srcpath, dstpath, hardlink and not should_copy(f)):
+                linked.add(dstpath)
+            else:
+                tempdir.claim(dstpath, mode)
+        return linked
+
+
+def prune_templates(keep):
+    """Remove the template trees which have not been used for
+    :data:`TEMPLATE_EXPIRES` seconds.
+
+    :param keep: The digest of template which should not be removed.
+    :type keep: :class:`str`
+    """
+    root = os.path.join(runconfig.TEMPORARY_DIR, '.templates')
+    expires = time.time() - TEMPLATE_EXPIRES
+    for name in os.listdir(root):
+        fpath = os.path.join(root, name)
+        try:
+            if name != keep and os.stat(fpath).st_mtime < expires:
+                shutil.rmtree(fpath)
+        except OSError:
+            pass
+
+
+def get_template(hwcode, manifest):
+    """Get the up-to-date template tree of `hwcode`, and build it if
+    necessary.
+
+    :param hwcode: The homework code package.
+    :type hwcode: :class:`~railgun.common.hw.HwCode`
+    :param manifest: The up-to-date file manifest of `hwcode`.
+    :type manifest: :class:`~railgun.common.fileutil.FileManifest`
+    :return: A :class:`CodeTemplate` whose tree exists.
+    """
+    template = CodeTemplate(hwcode, manifest)
+    if not template.exists():
+        template.build()
+        prune_templates(template.digest)
+    template.touch()
+    return template
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/runner/zygote.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module manages the warm sandbox pool for Python submissions.
+
+Executing a new `SafeRunner` for every submission has a fixed startup cost:
+the interpreter must be initialized, and the scorer libraries must be
+imported from scratch.  When ``config.RUNNER_WARM_POOL`` is enabled,
+:class:`~railgun.runner.host.PythonHost` will ask a per-homework zygote
+process, which has already imported these modules, to fork a child for
+each submission instead.
+
+The zygote server itself is implemented in ``runlib/python/pyhost/zygote.py``.
+"""
+
+import os
+import json
+import time
+import uuid
+import errno
+import atexit
+import select
+import socket
+import subprocess
+import _multiprocessing
+
+from railgun.common.osutil import ProcessTimeout, BoundedBuffer, monotonic
+from . import runconfig
+from .context import logger
+
+
+class ZygoteUnavailable(Exception):
+    """Indicate that the zygote could not accept the request, so that the
+    submission has not been started at all."""
+    pass
+
+
+class ZygoteProcess(object):
+    """A zygote process serving one programming language of one homework.
+
+    :param safe_runner: The path of `SafeRunner` executable.
+    :type safe_runner: :class:`str`
+    :param hwcode: The homework code package.
+    :type hwcode: :class:`~railgun.common.hw.HwCode`
+    :param environ: The environmental variables for the zygote.
+    :type environ: :class:`dict`
+    :param preload: The homework modules to be preloaded.
+    :type preload: :class:`list` of :class:`str`
+    """
+
+    def __init__(self, safe_runner, hwcode, environ, preload=None):
+        self.safe_runner = safe_runner
+        self.hwcode = hwcode
+        self.environ = environ
+        self.preload = preload or []
+
+        #: The unix socket path of this zygote.
+        self.sock_path = os.path.join(
+            runconfig.TEMPORARY_DIR, '.zygote', uuid.uuid4().get_hex())
+
+        #: The :class:`subprocess.Popen` object of the zygote.
+        self.process = None
+
+    def start(self):
+        """Launch the zygote and wait for it to listen on the socket."""
+        sock_dir = os.path.dirname(self.sock_path)
+        if not os.path.isdir(sock_dir):
+            os.makedirs(sock_dir, 0700)
+
+        script = os.path.join(
+            runconfig.RUNLIB_DIR, 'python/pyhost/zygote.py')
+        args = [self.safe_runner, script, self.sock_path,
+                self.hwcode.path] + self.preload
+        with open(os.devnull, 'rb') as null_file:
+            self.process = subprocess.Popen(
+                args, stdin=null_file, stdout=null_file, stderr=null_file,
+                cwd=self.hwcode.path, env=self.environ, close_fds=True
+            )
+
+        # Wait for the zygote to listen on the socket
+        deadline = monotonic() + runconfig.RUNNER_WARM_POOL_STARTUP
+        while not os.path.exists(self.sock_path):
+            if self.process.poll() is not None or monotonic() > deadline:
+                self.stop()
+                raise ZygoteUnavailable(
+                    'Zygote for %s could not be started.' % self.hwcode.path)
+            time.sleep(0.05)
+
+    def stop(self):
+        """Kill the zygote process."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+        if os.path.exists(self.sock_path):
+            os.remove(self.sock_path)
+
+    def is_alive(self):
+        """Whether the zygote process is still running?"""
+        return self.process is not None and self.process.poll() is None
+
+    def _connect(self, out_fd, err_fd, request):
+        try:
+            sck = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sck.connect(self.sock_path)
+            _multiprocessing.sendfd(sck.fileno(), out_fd)
+            _multiprocessing.sendfd(sck.fileno(), err_fd)
+            sck.sendall('%s\n' % json.dumps(request))
+            return sck
+        except Exception, ex:
+            raise ZygoteUnavailable(str(ex))
+
+    def execute(self, cwd, env, uid, gid, entry, timeout, limits=None):
+        """Fork a sandbox process from the zygote to run `entry`.
+
+        The timeout and the exit code have the same semantics as
+        :func:`railgun.common.osutil.execute`.
+
+        :param cwd: The working directory of the sandbox.
+        :param env: The environmental variables of the sandbox.
+        :param uid: The user id for the sandbox to run at.
+        :param gid: The group id for the sandbox to run at.
+        :param entry: The path of entry script.
+        :param timeout: Process timeout in seconds.
+        :param limits: The kernel resource limits of the sandbox.
+        :type limits: :class:`~railgun.common.osutil.ResourceLimits`
+
+        :return: (exit code, stdout, stderr, usage), where stdout and stderr
+            are :class:`~railgun.common.osutil.BoundedBuffer` objects limited
+            by ``config.RUNNER_OUTPUT_HEAD`` and ``config.RUNNER_OUTPUT_TAIL``,
+            and usage is the resource usage of the sandbox.
+        :raises: :class:`ZygoteUnavailable` if the sandbox could not be
+            forked.
+        :raises: :class:`~railgun.common.osutil.ProcessTimeout` if the
+            timeout was reached.
+        """
+        request = {'cwd': cwd, 'env': env, 'uid': uid, 'gid': gid,
+                   'entry': entry, 'timeout': timeout,
+                   'limits': limits.to_plain() if limits else {}}
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            sck = self._connect(out_w, err_w, request)
+        except Exception:
+            for fd in (out_r, out_w, err_r, err_w):
+                os.close(fd)
+            raise
+        os.close(out_w)
+        os.close(err_w)
+
+        # Drain the pipes and wait for the status messages at the same
+        # time.  The supervisor in the zygote will kill the sandbox after
+        # `timeout`, so we just wait a little longer than that.
+        sck_fd = sck.fileno()
+        buffers = {
+            out_r: BoundedBuffer(runconfig.RUNNER_OUTPUT_HEAD,
+                                 runconfig.RUNNER_OUTPUT_TAIL),
+            err_r: BoundedBuffer(runconfig.RUNNER_OUTPUT_HEAD,
+                                 runconfig.RUNNER_OUTPUT_TAIL),
+            sck_fd: BoundedBuffer(),
+        }
+        opened = set(buffers.iterkeys())
+        deadline = monotonic() + timeout + runconfig.RUNNER_WARM_POOL_STARTUP
+        try:
+            while opened:
+                # After the supervisor has exited, only read the remaining
+                # outputs, in case that the pipes are held by orphans.
+                if sck_fd in opened:
+                    remains = deadline - monotonic()
+                    if remains <= 0:
+                        raise RuntimeError('Zygote did not respond.')
+                else:
+                    remains = 0
+                try:
+                    rlist, _, _ = select.select(list(opened), [], [],
+                                                remains)
+                except select.error, ex:
+                    if ex.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if not rlist and sck_fd not in opened:
+                    break
+                for fd in rlist:
+                    data = os.read(fd, 65536)
+                    if data:
+                        buffers[fd].write(data)
+                    else:
+                        opened.discard(fd)
+        finally:
+            sck.close()
+            os.close(out_r)
+            os.close(err_r)
+
+        lines = buffers[sck_fd].getvalue().splitlines()
+        messages = [json.loads(l) for l in lines if l.strip()]
+        if not messages or 'pid' not in messages[0]:
+            raise ZygoteUnavailable('Sandbox process was not forked.')
+        if len(messages) < 2:
+            raise RuntimeError('Supervisor exited without exit status.')
+        result = messages[1]
+        if result['timeout']:
+            raise ProcessTimeout("Process timeout has been reached.",
+                                 result.get('usage'))
+
+        status = result['status']
+        if os.WIFSIGNALED(status):
+            exitcode = -os.WTERMSIG(status)
+        else:
+            exitcode = os.WEXITSTATUS(status)
+        return (exitcode, buffers[out_r], buffers[err_r], result.get('usage'))
+
+
+class ZygotePool(object):
+    """The zygote processes owned by this runner process.
+
+    Each homework code package (identified by homework uuid and programming
+    language) will have its own zygote, launched on first use.  The zygote
+    is retired when the version of the code package changes, since it has
+    preloaded the old homework modules.
+    """
+
+    def __init__(self):
+        self._zygotes = {}
+        self._pid = os.getpid()
+        atexit.register(self.shutdown)
+
+    def get(self, key, version, factory):
+        """Get the running zygote for `key`, or launch a new one.
+
+        :param key: The identity of the homework code package.
+        :param version: The version of the code package, e.g., the digest
+            of its file manifest.
+        :param factory: Method to create a new :class:`ZygoteProcess`.
+
+        :return: The running :class:`ZygoteProcess`.
+        :raises: :class:`ZygoteUnavailable` if the zygote could not start.
+        """
+        # Zygotes inherited from the parent process do not belong to us.
+        if self._pid != os.getpid():
+            self._zygotes = {}
+            self._pid = os.getpid()
+
+        old_version, zygote = self._zygotes.get(key, (None, None))
+        if zygote is not None and old_version != version:
+            logger.info('Code package %s has changed, retire its zygote.' %
+                        zygote.hwcode.path)
+            zygote.stop()
+            zygote = None
+        if zygote is None or not zygote.is_alive():
+            if zygote is not None:
+                logger.warning('Zygote for %s has exited, restart it.' %
+                               zygote.hwcode.path)
+                zygote.stop()
+            zygote = factory()
+            zygote.start()
+            self._zygotes[key] = (version, zygote)
+        return zygote
+
+    def shutdown(self):
+        """Kill all the zygote processes."""
+        if self._pid != os.getpid():
+            return
+        for _, zygote in self._zygotes.itervalues():
+            try:
+                zygote.stop()
+            except Exception:
+                pass
+        self._zygotes = {}
+
+
+#: The warm sandbox pool of this runner process.
+pool = ZygotePool()
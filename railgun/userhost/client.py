@@ -49,3 +49,12 @@ class UserHostClient(object):
         """
         ret = self._communicate('put %s' % user)
         return ret == 'okay'
+
+    def size(self):
+        """Get the number of accounts managed by the server.
+
+        :return: The number of accounts, or :data:`None` if not available.
+        """
+        ret = self._communicate('size').split(' ')
+        if ret[0] == 'okay':
+            return int(ret[1])
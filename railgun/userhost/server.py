@@ -20,7 +20,8 @@ class UserHostServer(object):
     def _serve_request(self, conn):
         """Serve a incoming request."""
         f = conn.makefile('rw')
-        act, arg = tuple(v for v in f.readline().strip().split(' ') if v)
+        parts = [v for v in f.readline().strip().split(' ') if v]
+        act, arg = parts[0], (parts[1] if len(parts) > 1 else None)
         if act == 'get':
             user = self.pool.acquire(int(arg))
             if user:
@@ -33,6 +34,8 @@ class UserHostServer(object):
             print('put %s -> okay' % arg)
             self.pool.release(arg)
             f.write('okay\n')
+        elif act == 'size':
+            f.write('okay %d\n' % self.pool.size)
         else:
             print('unknown: %s' % act)
             f.write('unknown action\n')
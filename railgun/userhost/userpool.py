@@ -15,6 +15,11 @@ class UserPool(object):
         self.users = users
         self._expires = {u: 0 for u in users}
 
+    @property
+    def size(self):
+        """The number of managed accounts."""
+        return len(self.users)
+
     def current_time(self):
         """Get the current timestamp."""
         return int(time.time())
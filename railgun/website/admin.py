@@ -7,27 +7,33 @@
 
 import csv
 import json
+from datetime import datetime, time, timedelta
 from functools import wraps
 from cStringIO import StringIO
 
 from flask import (Blueprint, render_template, request, g, flash, redirect,
-                   url_for, send_file, make_response)
+                   url_for, send_file, make_response, jsonify)
 from flask.ext.babel import gettext as _
-from flask.ext.babel import get_locale, to_user_timezone, lazy_gettext
+from flask.ext.babel import (get_locale, to_user_timezone, to_utc,
+                             lazy_gettext)
 from flask.ext.login import login_fresh, current_user
 from sqlalchemy import func
 from sqlalchemy.orm import contains_eager
 from werkzeug.exceptions import NotFound
 
 from railgun.runner.context import app as runner_app
+from railgun.runner.scheduler import get_scheduler, PRIORITY_CLASSES
 from .context import app, db
-from .models import User, Handin, FinalScore, Vote, VoteItem, assign_values
-from .forms import AdminUserEditForm, CreateUserForm, VoteJsonEditForm
+from .models import (User, Handin, HandinTiming, FinalScore, Vote, VoteItem,
+                     RegradeJob, assign_values)
+from .forms import (AdminUserEditForm, CreateUserForm, VoteJsonEditForm,
+                    RegradeForm)
 from .userauth import auth_providers
 from .credential import login_manager
 from .navibar import navigates, NaviItem
 from .utility import round_score, group_histogram
 from .codelang import languages
+from .regrade import create_job, pump, get_progress
 
 #: A :class:`~flask.Blueprint` object.  All the views for administration
 #: are registered to this blueprint.
@@ -285,6 +291,10 @@ def user_delete(name):
         # Delete all top scores of this user
         FinalScore.query.filter(FinalScore.user_id == the_user.id).delete()
         # Delete all submissions of this user
+        handin_ids = db.session.query(Handin.id).filter(
+            Handin.user_id == the_user.id)
+        HandinTiming.query.filter(HandinTiming.handin_id.in_(handin_ids)) \
+            .delete(synchronize_session=False)
         Handin.query.filter(Handin.user_id == the_user.id).delete()
         # Delete this user
         User.query.filter(User.id == the_user.id).delete()
@@ -323,10 +333,18 @@ def _show_handins(username=None):
         handins = handins.filter(Handin.user_id == user.id)
     # Sort the handins
     handins = handins.order_by(-Handin.id)
+    # get the depth of each priority class in the fair scheduler
+    queue_depth = None
+    if app.config['RUNNER_SCHEDULER']:
+        try:
+            queue_depth = get_scheduler().depth()
+        except Exception:
+            app.logger.exception('Could not get the depth of run queue.')
     # build pagination object
     return render_template(
         'admin.handins.html', the_page=handins.paginate(page, perpage),
-        username=username
+        username=username, queue_depth=queue_depth,
+        queue_classes=PRIORITY_CLASSES
     )
 
 
@@ -421,6 +439,8 @@ def runqueue_clear():
     from railgun.common.lazy_i18n import lazy_gettext
 
     try:
+        if app.config['RUNNER_SCHEDULER']:
+            get_scheduler().clear()
         runner_app.control.discard_all()
         print db.session.query(Handin) \
             .filter(Handin.state.in_(['Pending', 'Running'])).count()
@@ -440,6 +460,132 @@ def runqueue_clear():
     return redirect(url_for('.handins'))
 
 
+@bp.route('/regrade/<hwid>/', methods=['GET', 'POST'])
+@admin_required
+def regrade(hwid):
+    """The admin page to regrade the submissions of a homework, and to list
+    the existing regrade jobs of it.
+
+    If a new regrade job is created, the visitor will be redirected to
+    :func:`~railgun.website.admin.regrade_job`.
+
+    :route: /admin/regrade/<hwid>/
+    :method: GET, POST
+    :template: admin.regrade.html
+
+    :param hwid: The uuid of the homework.
+    :type hwid: :class:`str`
+    """
+    hw = g.homeworks.get_by_uuid(hwid)
+    if hw is None:
+        raise NotFound()
+
+    form = RegradeForm()
+    form.lang.choices = [('', _('All'))] + [
+        (lang, lang) for lang in hw.get_code_languages()
+    ]
+    if form.validate_on_submit():
+        states = []
+        if form.accepted.data:
+            states.append('Accepted')
+        if form.rejected.data:
+            states.append('Rejected')
+        # The dates are given in the timezone of the admin.
+        since = until = None
+        if form.since.data:
+            since = to_utc(datetime.combine(form.since.data, time()))
+        if form.until.data:
+            until = to_utc(datetime.combine(form.until.data, time()) +
+                           timedelta(days=1))
+        job = create_job(hw, states, form.lang.data, since, until,
+                         form.fullscale.data, current_user)
+        return redirect(url_for('.regrade_job', jobid=job.id))
+
+    jobs = RegradeJob.query.filter(RegradeJob.hwid == hwid) \
+        .order_by(-RegradeJob.id).all()
+    return render_template('admin.regrade.html', hw=hw, form=form, jobs=jobs)
+
+
+def _get_regrade_job(jobid):
+    job = RegradeJob.query.filter(RegradeJob.id == jobid).first()
+    if job is None:
+        raise NotFound()
+    return job
+
+
+@bp.route('/regrade/job/<int:jobid>/')
+@admin_required
+def regrade_job(jobid):
+    """The admin page to show the live progress of a regrade job.
+
+    :route: /admin/regrade/job/<jobid>/
+    :method: GET
+    :template: admin.regrade_job.html
+
+    :param jobid: The id of the regrade job.
+    :type jobid: :class:`int`
+    """
+    job = _get_regrade_job(jobid)
+    return render_template(
+        'admin.regrade_job.html', job=job, progress=get_progress(job),
+        hw=g.homeworks.get_by_uuid(job.hwid)
+    )
+
+
+@bp.route('/regrade/job/<int:jobid>/progress/')
+@admin_required
+def regrade_job_progress(jobid):
+    """Get the progress of a regrade job in JSON format, see
+    :func:`~railgun.website.regrade.get_progress`.  The next chunk of the
+    job will be put into the runner queue if possible.
+
+    :route: /admin/regrade/job/<jobid>/progress/
+    :method: GET
+
+    :param jobid: The id of the regrade job.
+    :type jobid: :class:`int`
+    """
+    job = _get_regrade_job(jobid)
+    pump(job)
+    return jsonify(get_progress(job))
+
+
+@bp.route('/regrade/job/<int:jobid>/<action>/')
+@admin_required
+def regrade_job_action(jobid, action):
+    """Pause, resume or cancel a regrade job.  The visitor will be
+    redirected to :func:`~railgun.website.admin.regrade_job`.
+
+    The submissions that have already been put into the runner queue will
+    still be graded if the job is paused or cancelled.
+
+    :route: /admin/regrade/job/<jobid>/<action>/
+    :method: GET
+
+    :param jobid: The id of the regrade job.
+    :type jobid: :class:`int`
+    :param action: One of "pause", "resume" and "cancel".
+    :type action: :class:`str`
+    """
+    job = _get_regrade_job(jobid)
+    transitions = {
+        'pause': (('Running',), 'Paused'),
+        'resume': (('Paused',), 'Running'),
+        'cancel': (('Running', 'Paused'), 'Cancelled'),
+    }
+    if action not in transitions:
+        raise NotFound()
+    from_states, to_state = transitions[action]
+    if job.state in from_states:
+        job.state = to_state
+        if to_state == 'Cancelled':
+            job.ftime = datetime.utcnow()
+        db.session.commit()
+        if to_state == 'Running':
+            pump(job)
+    return redirect(url_for('.regrade_job', jobid=job.id))
+
+
 @bp.route('/scores/')
 @admin_required
 def scores():
@@ -567,6 +713,167 @@ def hwscores(hwid):
     )
 
 
+@bp.route('/hwusage/<hwid>/')
+@admin_required
+def hwusage(hwid):
+    """The admin page to view the resource usage profile of a given
+    homework, which helps to tune ``RUNNER_CONCURRENTY`` and the timeouts.
+
+    The submissions are grouped by programming language, and the average
+    and maximum value of each resource are listed.  Submissions without
+    resource records (e.g., those executed by older runners) are ignored.
+
+    The view accepts a query string argument `csvfile`, and if `csvfile` is
+    set to 1, a csv data file will be responded to the visitor instead of
+    a html table page.
+
+    :route: /admin/hwusage/<hwid>/
+    :method: GET
+    :template: admin.csvdata.html
+    """
+    # Query about given homework
+    hw = g.homeworks.get_by_uuid(hwid)
+    if hw is None:
+        raise NotFound(lazy_gettext('Requested homework not found.'))
+
+    cpu_time = Handin.cpu_user + Handin.cpu_system
+    q = (db.session.query(Handin.lang,
+                          func.count(Handin.id).label('count'),
+                          func.avg(cpu_time).label('cpu_avg'),
+                          func.max(cpu_time).label('cpu_max'),
+                          func.avg(Handin.wall_time).label('wall_avg'),
+                          func.max(Handin.wall_time).label('wall_max'),
+                          func.avg(Handin.max_rss).label('rss_avg'),
+                          func.max(Handin.max_rss).label('rss_max'),
+                          func.avg(Handin.io_inblock +
+                                   Handin.io_oublock).label('io_avg'),
+                          func.avg(Handin.ctx_involuntary).label('ctx_avg')).
+         filter(Handin.hwid == hwid).
+         filter(Handin.wall_time.isnot(None)).
+         group_by(Handin.lang))
+
+    def fmt(value, digits=3):
+        return round(value, digits) if value is not None else '-'
+
+    csvdata = [
+        {
+            'lang': rec.lang,
+            'count': rec.count,
+            'cpu_avg': fmt(rec.cpu_avg),
+            'cpu_max': fmt(rec.cpu_max),
+            'wall_avg': fmt(rec.wall_avg),
+            'wall_max': fmt(rec.wall_max),
+            'rss_avg': fmt(rec.rss_avg, 0),
+            'rss_max': fmt(rec.rss_max, 0),
+            'io_avg': fmt(rec.io_avg, 1),
+            'ctx_avg': fmt(rec.ctx_avg, 1),
+        }
+        for rec in q
+    ]
+
+    # Show the report
+    raw_headers = ['lang', 'count', 'cpu_avg', 'cpu_max', 'wall_avg',
+                   'wall_max', 'rss_avg', 'rss_max', 'io_avg', 'ctx_avg']
+    display_headers = [
+        lazy_gettext('Language'),
+        lazy_gettext('Submissions'),
+        lazy_gettext('Avg CPU (s)'),
+        lazy_gettext('Max CPU (s)'),
+        lazy_gettext('Avg Wall (s)'),
+        lazy_gettext('Max Wall (s)'),
+        lazy_gettext('Avg RSS (KB)'),
+        lazy_gettext('Max RSS (KB)'),
+        lazy_gettext('Avg Block I/O'),
+        lazy_gettext('Avg Preemptions'),
+    ]
+    pagetitle = _('Resource usage of "%(hw)s"', hw=hw.info.name)
+    filename = '%s-usage' % hw.info.name
+    if isinstance(filename, unicode):
+        filename = filename.encode('utf-8')
+
+    return _make_csv_report(
+        csvdata,
+        display_headers,
+        raw_headers,
+        pagetitle,
+        filename
+    )
+
+
+@bp.route('/hwtimings/<hwid>/')
+@admin_required
+def hwtimings(hwid):
+    """The admin page to view where the time of running the submissions of
+    a given homework went, so that the slow stages stand out.
+
+    The stage timings of the submissions are grouped by stage, and the
+    average and maximum seconds, as well as the share of each stage in the
+    total time, are listed.  Stages are described in
+    :data:`~railgun.website.models.HandinTiming.TIMING_STAGES`.
+
+    The view accepts a query string argument `csvfile`, and if `csvfile` is
+    set to 1, a csv data file will be responded to the visitor instead of
+    a html table page.
+
+    :route: /admin/hwtimings/<hwid>/
+    :method: GET
+    :template: admin.csvdata.html
+    """
+    # Query about given homework
+    hw = g.homeworks.get_by_uuid(hwid)
+    if hw is None:
+        raise NotFound(lazy_gettext('Requested homework not found.'))
+
+    q = (db.session.query(HandinTiming.stage,
+                          func.count(HandinTiming.handin_id).label('count'),
+                          func.sum(HandinTiming.seconds).label('sum'),
+                          func.avg(HandinTiming.seconds).label('avg'),
+                          func.max(HandinTiming.seconds).label('max')).
+         join(Handin, Handin.id == HandinTiming.handin_id).
+         filter(Handin.hwid == hwid).
+         group_by(HandinTiming.stage))
+    records = dict((rec.stage, rec) for rec in q)
+    total = records['total'].sum if 'total' in records else None
+
+    def fmt(value, digits=3):
+        return round(value, digits) if value is not None else '-'
+
+    csvdata = []
+    for stage, rec in HandinTiming.sort(records.iteritems()):
+        share = None
+        if total and stage not in ('queue', 'total'):
+            share = rec.sum * 100.0 / total
+        csvdata.append({
+            'stage': stage,
+            'count': rec.count,
+            'avg': fmt(rec.avg),
+            'max': fmt(rec.max),
+            'share': fmt(share, 1),
+        })
+
+    # Show the report
+    raw_headers = ['stage', 'count', 'avg', 'max', 'share']
+    display_headers = [
+        lazy_gettext('Stage'),
+        lazy_gettext('Submissions'),
+        lazy_gettext('Avg (s)'),
+        lazy_gettext('Max (s)'),
+        lazy_gettext('Share of Total (%)'),
+    ]
+    pagetitle = _('Stage timings of "%(hw)s"', hw=hw.info.name)
+    filename = '%s-timings' % hw.info.name
+    if isinstance(filename, unicode):
+        filename = filename.encode('utf-8')
+
+    return _make_csv_report(
+        csvdata,
+        display_headers,
+        raw_headers,
+        pagetitle,
+        filename
+    )
+
+
 @bp.route('/get_longblob_patch_command/')
 @admin_required
 def get_longblob_patch_command():
@@ -6,12 +6,15 @@
 # This file is released under BSD 2-clause license.
 
 import json
+from datetime import datetime, timedelta
 from functools import wraps
 
-from flask import request, make_response
+from flask import request, make_response, send_file, abort
 
-from .context import app, db, csrf
-from .models import Handin, FinalScore
+from .context import app, db, csrf, blobs
+from .models import Handin, FinalScore, ApiMessage
+from .regrade import get_pumper
+from railgun.common.blobstore import BlobNotFound
 from railgun.common.hw import HwScore
 from railgun.common.crypto import DecryptMessage
 from railgun.common.lazy_i18n import lazy_gettext
@@ -53,50 +56,19 @@ def secret_api(method):
     return inner
 
 
-@csrf.exempt
-@app.route('/api/handin/report/<uuid>/', methods=['POST'])
-@secret_api
-def api_handin_report(uuid):
-    """Store the final score and detailed reports of given submission.
-
-    This view will compare `uuid` in POST object to the `uuid` argument.
-    If they are not equal, the operation will be rejected, since it is
-    likely to be an attack.
-
-    If the submission state is neither `Running` nor `Pending`, the operation
-    will be rejected, since it is likely to be a programmatic bug.
-
-    If the reported score is 0.0, but the state is `Accepted`, then it
-    will be modified to `Rejected`, since it is wired for a zero-score
-    submission to be `Accepted`.
-
-    If the reported brief result message is empty, it will be set to
-    a translated version of `"Your submission is accepted."` or
-    `"Your submission is rejected."`, depending on the reported state.
+def _handin_report(handin, obj):
+    """Apply the reported score `obj` to `handin`, without committing the
+    database session.  See :func:`api_handin_report` for details.
 
-    The :class:`~railgun.website.models.FinalScore` table records will
-    also be updated in this view.
-
-    :route: /api/handin/report/<uuid>/
-    :payload: A serialized :class:`~railgun.common.hw.HwScore` object.
-    :param uuid: The uuid of submission.
-    :type uuid: :class:`str`
     :return: ``OK`` if succeeded, error messages otherwise.
     """
-    obj = request.payload
-
-    # check uuid, so that we can prevent replay attack
-    if obj['uuid'] != uuid:
-        return 'uuid mismatch, do not attack'
-
     # construct HwScore object from payload
     try:
         score = HwScore.from_plain(obj)
     except Exception:
         return 'not valid score object'
 
-    # load the handin object, and report error if not exist
-    handin = Handin.query.filter(Handin.uuid == uuid).first()
+    # report error if the handin object does not exist
     if not handin:
         return 'requested handin not found'
 
@@ -138,6 +110,118 @@ def api_handin_report(uuid):
         elif final_score > hwscore.score:
             hwscore.score = final_score
 
+    return 'OK'
+
+
+def _handin_start(handin, obj):
+    """Change the state of `handin` to `Running`, without committing the
+    database session.  See :func:`api_handin_start` for details.
+
+    :return: ``OK`` if succeeded, error messages otherwise.
+    """
+    # report error if the handin object does not exist
+    if not handin:
+        return 'requested submission not found'
+
+    # we only update state from "Pending" to "Running"
+    if handin.state != 'Pending':
+        return 'submission is not pending'
+
+    handin.state = 'Running'
+    return 'OK'
+
+
+def _handin_proclog(handin, obj):
+    """Store the process outputs `obj` to `handin`, without committing the
+    database session.  See :func:`api_handin_proclog` for details.
+
+    :return: ``OK`` if succeeded, error messages otherwise.
+    """
+    # report error if the handin object does not exist
+    if not handin:
+        return 'requested submission not found'
+
+    # if handin.state != 'Accepted' and handin.state != 'Rejected',
+    # the process must have exited without report the score.
+    # mark such handin as "Rejected"
+    if handin.state != 'Accepted' and handin.state != 'Rejected':
+        handin.state = 'Rejected'
+        handin.result = lazy_gettext('Process exited before reporting score.')
+        handin.partials = []
+
+    handin.exitcode = obj['exitcode']
+    handin.stdout = obj['stdout']
+    handin.stderr = obj['stderr']
+    stats = obj.get('stats') or {}
+    handin.stdout_size = stats.get('stdout_size')
+    handin.stderr_size = stats.get('stderr_size')
+    handin.set_usage(stats.get('usage'))
+    handin.set_timings(stats.get('timings'))
+    return 'OK'
+
+
+#: The applied message ids will be forgotten after such period.  A runner
+#: will never resend a message after such a long time.
+API_MESSAGE_EXPIRES = timedelta(days=7)
+
+#: The handin actions that can be carried in :func:`api_handin_batch`.
+HANDIN_ACTIONS = {
+    'report': _handin_report,
+    'start': _handin_start,
+    'proclog': _handin_proclog,
+}
+
+
+def _pump_regrade():
+    # The graded submissions may release the next chunks of regrade jobs,
+    # which are put into the runner queue in background.
+    try:
+        get_pumper().wake()
+    except Exception:
+        app.logger.exception('Cannot start the regrade pumper.')
+
+
+@csrf.exempt
+@app.route('/api/handin/report/<uuid>/', methods=['POST'])
+@secret_api
+def api_handin_report(uuid):
+    """Store the final score and detailed reports of given submission.
+
+    This view will compare `uuid` in POST object to the `uuid` argument.
+    If they are not equal, the operation will be rejected, since it is
+    likely to be an attack.
+
+    If the submission state is neither `Running` nor `Pending`, the operation
+    will be rejected, since it is likely to be a programmatic bug.
+
+    If the reported score is 0.0, but the state is `Accepted`, then it
+    will be modified to `Rejected`, since it is wired for a zero-score
+    submission to be `Accepted`.
+
+    If the reported brief result message is empty, it will be set to
+    a translated version of `"Your submission is accepted."` or
+    `"Your submission is rejected."`, depending on the reported state.
+
+    The :class:`~railgun.website.models.FinalScore` table records will
+    also be updated in this view.
+
+    :route: /api/handin/report/<uuid>/
+    :payload: A serialized :class:`~railgun.common.hw.HwScore` object.
+    :param uuid: The uuid of submission.
+    :type uuid: :class:`str`
+    :return: ``OK`` if succeeded, error messages otherwise.
+    """
+    obj = request.payload
+
+    # check uuid, so that we can prevent replay attack
+    if obj['uuid'] != uuid:
+        return 'uuid mismatch, do not attack'
+
+    handin = Handin.query.filter(Handin.uuid == uuid).first()
+    ret = _handin_report(handin, obj)
+    if ret != 'OK':
+        return ret
+
     try:
         db.session.commit()
     except Exception:
@@ -171,16 +255,10 @@ def api_handin_start(uuid):
     if obj['uuid'] != uuid:
         return 'uuid mismatch, do not attack'
 
-    # load the handin object, and report error if not exist
     handin = Handin.query.filter(Handin.uuid == uuid).first()
-    if not handin:
-        return 'requested submission not found'
-
-    # we only update state from "Pending" to "Running"
-    if handin.state != 'Pending':
-        return 'submission is not pending'
-
-    handin.state = 'Running'
+    ret = _handin_start(handin, obj)
+    if ret != 'OK':
+        return ret
 
     try:
         db.session.commit()
@@ -216,8 +294,13 @@ def api_handin_proclog(uuid):
 
         {"uuid": uuid of submission,
          "exitcode": The exitcode of the process,
-         "stdout": The standard output of the process,
-         "stderr": The standard error output of the process}
+         "stdout": The standard output of the process (truncated),
+         "stderr": The standard error output of the process (truncated),
+         "stats": {"stdout_size": Total bytes of stdout,
+                   "stderr_size": Total bytes of stderr,
+                   "usage": Resource usage of the process, refer to
+                            railgun.common.osutil.make_usage,
+                   "timings": {stage: seconds spent in the stage}}}
 
     :param uuid: The uuid of submission.
     :type uuid: :class:`str`
@@ -229,31 +312,151 @@ def api_handin_proclog(uuid):
     if obj['uuid'] != uuid:
         return 'uuid mismatch, do not attack'
 
-    # load the handin object, and report error if not exist
     handin = Handin.query.filter(Handin.uuid == uuid).first()
-    if not handin:
-        return 'requested submission not found'
-
-    # if handin.state != 'Accepted' and handin.state != 'Rejected',
-    # the process must have exited without report the score.
-    # mark such handin as "Rejected"
-    if handin.state != 'Accepted' and handin.state != 'Rejected':
-        handin.state = 'Rejected'
-        handin.result = lazy_gettext('Process exited before reporting score.')
-        handin.partials = []
-
     try:
-        handin.exitcode = obj['exitcode']
-        handin.stdout = obj['stdout']
-        handin.stderr = obj['stderr']
+        ret = _handin_proclog(handin, obj)
+        if ret != 'OK':
+            return ret
         db.session.commit()
     except Exception:
         app.logger.exception('Cannot log proccess of submission(%s).' % uuid)
         return 'update database failed'
 
+    _pump_regrade()
     return 'OK'
 
 
+@csrf.exempt
+@app.route('/api/handin/batch/', methods=['POST'])
+@secret_api
+def api_handin_batch():
+    """Apply a list of handin messages (state transitions, reports and
+    process logs) of many submissions in a single database transaction.
+
+    The messages are applied in order, with the same rules as
+    :func:`api_handin_start`, :func:`api_handin_report` and
+    :func:`api_handin_proclog`.  Each message is applied in its own
+    savepoint, so a message rejected by these rules, or failed with an
+    error (``apply message failed``), does not affect the others.  Only if
+    the transaction cannot be committed, all the messages fail with
+    ``update database failed``, and should be sent again.
+
+    If a message carries the unique `msgid`, it will be applied only once,
+    since the runner may send the same message again if it has not received
+    the response.
+
+    :route: /api/handin/batch/
+    :payload:
+
+    .. code-block:: python
+
+        {"messages": [
+            {"action": "start", "report" or "proclog",
+             "uuid": uuid of submission,
+             "payload": the payload of the corresponding api,
+             "msgid": (optional) the unique id of this message},
+            ...
+        ]}
+
+    :return: A JSON list of the results of each message, ``OK`` if
+        succeeded, error messages otherwise.
+    """
+    messages = request.payload.get('messages') or []
+
+    # validate the messages, so that a malformed message is rejected alone
+    def validate(m):
+        if not isinstance(m, dict) or \
+                not isinstance(m.get('uuid'), basestring):
+            return 'invalid message'
+        if HANDIN_ACTIONS.get(m.get('action')) is None:
+            return 'unknown action'
+        if not isinstance(m.get('payload') or {}, dict):
+            return 'invalid message'
+        if (m.get('payload') or {}).get('uuid') != m['uuid']:
+            return 'uuid mismatch, do not attack'
+        return None
+    errors = [validate(m) for m in messages]
+    valid = [m for m, e in zip(messages, errors) if e is None]
+
+    # load all the handin objects in one query
+    uuids = list(set(m['uuid'] for m in valid))
+    handins = {}
+    if uuids:
+        handins = {h.uuid: h for h in
+                   Handin.query.filter(Handin.uuid.in_(uuids))}
+
+    # find out the messages that have already been applied
+    msgids = list(set(m['msgid'] for m in valid if m.get('msgid')))
+    applied = set()
+    if msgids:
+        applied = set(a.msgid for a in
+                      ApiMessage.query.filter(ApiMessage.msgid.in_(msgids)))
+
+    results = []
+    try:
+        for m, error in zip(messages, errors):
+            if error is not None:
+                results.append(error)
+                continue
+            msgid = m.get('msgid')
+            if msgid:
+                if msgid in applied:
+                    results.append('duplicated message')
+                    continue
+                applied.add(msgid)
+            # a message raising errors would be sent again and again, so
+            # it is rolled back alone, and reported as failed.
+            savepoint = db.session.begin_nested()
+            try:
+                if msgid:
+                    db.session.add(ApiMessage(msgid=msgid))
+                ret = HANDIN_ACTIONS[m['action']](
+                    handins.get(m['uuid']), m.get('payload') or {})
+                savepoint.commit()
+            except Exception:
+                app.logger.exception('Cannot apply %s message of '
+                                     'submission(%s).' %
+                                     (m['action'], m['uuid']))
+                savepoint.rollback()
+                ret = 'apply message failed'
+            results.append(ret)
+        if msgids:
+            expires = datetime.utcnow() - API_MESSAGE_EXPIRES
+            (ApiMessage.query.filter(ApiMessage.ctime < expires).
+             delete(synchronize_session=False))
+        db.session.commit()
+    except Exception:
+        app.logger.exception('Cannot apply batch of %d messages.' %
+                             len(messages))
+        db.session.rollback()
+        results = ['update database failed'] * len(messages)
+    else:
+        if any(r == 'OK' and m.get('action') == 'proclog'
+               for m, r in zip(messages, results)):
+            _pump_regrade()
+
+    return json.dumps(results), 200, {'Content-Type': 'application/json'}
+
+
+@csrf.exempt
+@app.route('/api/blob/', methods=['POST'])
+@secret_api
+def api_blob():
+    """Send the content of an uploaded file to the runner, which does not
+    share ``config.BLOB_STORE_DIR`` with the website.
+
+    :route: /api/blob/
+    :payload: {"digest": The SHA-256 digest of the uploaded file}
+    :return: The file content as `application/octet-stream`, or 404 error
+        if the file does not exist.
+    """
+    try:
+        fobj = blobs.open(request.payload['digest'])
+    except (BlobNotFound, ValueError):
+        abort(404)
+    return send_file(fobj, mimetype='application/octet-stream')
+
+
 @csrf.exempt
 @app.route('/api/myip/')
 def api_myip():
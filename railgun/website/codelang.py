@@ -21,6 +21,7 @@ and :class:`InputLanguage` are the actual implementations.
 """
 
 import os
+import time
 import base64
 import cPickle as pickle
 from cStringIO import StringIO
@@ -29,10 +30,11 @@ from flask import g, send_file, abort, make_response
 from flask.ext.babel import lazy_gettext
 from flask.ext.login import current_user
 
-from .context import app, db
+from .context import app, db, blobs
 from .forms import UploadHandinForm, AddressHandinForm, CsvHandinForm
 from .models import Handin
-from railgun.runner.tasks import run_python, run_netapi, run_input
+from railgun.common.blobstore import BlobNotFound
+from railgun.runner.tasks import run_python, run_netapi, run_input, schedule
 
 
 class CodeLanguage(object):
@@ -90,46 +92,112 @@ class CodeLanguage(object):
         """
         raise NotImplementedError()
 
-    def store_content(self, handid, content):
-        """Store the original data of given submission onto disk.
+    def store_content(self, handin, fobj, filename=None):
+        """Store the original data of given submission into the upload store,
+        and record its digest in the submission.
 
-        Data file is placed under ``config.UPLOAD_STORE_DIR``.
-        If ``config.STORE_UPLOAD`` is disabled, this method will do nothing.
-        `content` may be any type of object, which will be serialized before
-        writing to disk file.
+        Data files are stored in ``config.BLOB_STORE_DIR`` by their content
+        digests, so the identical submissions share the same file.
+        If ``config.STORE_UPLOAD`` is disabled, nothing will be stored,
+        since no submission would ever refer to the data.
 
-        :param handid: The submission uuid.
-        :type handid: :class:`str`
-        :param content: The original data object.
-        :type content: :class:`object`
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
+        :param fobj: The file object of original data.
+        :param filename: The original file name.
+        :type filename: :class:`unicode`
+
+        :return: A :class:`tuple` of (digest, size), or :data:`None` if
+            ``config.STORE_UPLOAD`` is disabled.
         """
         if not app.config['STORE_UPLOAD']:
-            return
-        if not os.path.isdir(app.config['UPLOAD_STORE_DIR']):
-            os.makedirs(app.config['UPLOAD_STORE_DIR'], 0700)
-        fpath = os.path.join(app.config['UPLOAD_STORE_DIR'], handid)
-        with open(fpath, 'wb') as f:
-            f.write(pickle.dumps(content))
+            return None
+        digest, size = blobs.put(fobj)
+        handin.upload_digest = digest
+        handin.upload_name = filename
+        handin.upload_size = size
+        db.session.commit()
+        return digest, size
 
-    def load_content(self, handid):
-        """Load the original data of given submission from disk file.
+    def migrate_legacy(self, handin):
+        """Move the pickled data file of a legacy submission at
+        ``config.UPLOAD_STORE_DIR/<handid>`` into the upload store.
 
-        :param handid: The submission uuid.
-        :type handid: :class:`str`
-        :return: The loaded object, or :data:`None` if data file not exist.
+        :return: :data:`True` if the data file has been migrated.
+        """
+        fpath = os.path.join(app.config['UPLOAD_STORE_DIR'], handin.uuid)
+        if not os.path.isfile(fpath):
+            return False
+        with open(fpath, 'rb') as f:
+            content = pickle.loads(f.read())
+        filename = None
+        if isinstance(content, dict):
+            filename = content['fname']
+            if 'digest' in content:
+                data = None
+                digest, size = content['digest'], content['size']
+            else:
+                data = base64.b64decode(content['fcnt'])
+        else:
+            data = content.encode('utf-8')
+        if data is not None:
+            digest, size = blobs.put(StringIO(data))
+        handin.upload_digest = digest
+        handin.upload_name = filename
+        handin.upload_size = size
+        db.session.commit()
+        os.remove(fpath)
+        return True
+
+    def has_content(self, handin):
+        """Whether the original data of given submission is stored?
+
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
         """
-        fpath = os.path.join(app.config['UPLOAD_STORE_DIR'], handid)
-        if os.path.isfile(fpath):
-            with open(fpath, 'rb') as f:
-                return pickle.loads(f.read())
+        if handin.upload_digest:
+            return True
+        fpath = os.path.join(app.config['UPLOAD_STORE_DIR'], handin.uuid)
+        return os.path.isfile(fpath)
+
+    def load_content(self, handin):
+        """Open the original data of given submission in the upload store.
+
+        The legacy data file of this submission will be migrated into the
+        upload store on first access.
+
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
+        :return: The file object, or :data:`None` if data is not stored.
+        """
+        if not handin.upload_digest and not self.migrate_legacy(handin):
+            return None
+        try:
+            return blobs.open(handin.upload_digest)
+        except BlobNotFound:
+            return None
 
-    def do_handle_upload(self, handid, hw, form):
+    def read_content(self, handin):
+        """Read the original data of given submission as a unicode string.
+
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
+        :return: The unicode string, or :data:`None` if data is not stored.
+        """
+        fobj = self.load_content(handin)
+        if fobj is not None:
+            try:
+                return fobj.read().decode('utf-8')
+            finally:
+                fobj.close()
+
+    def do_handle_upload(self, handin, hw, form):
         """Called by :meth:`handle_upload` to help handle the submission.
         Derived classes should implement this to store the submission data,
         and to put this submission into runner queue.
 
-        :param handid: The submission uuid.
-        :type handid: :class:`str`
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
         :param hw: The homework instance.
         :type hw: :class:`~railgun.common.hw.Homework`
         :param form: The upload form generated by :meth:`upload_form`
@@ -137,6 +205,27 @@ class CodeLanguage(object):
         """
         raise NotImplementedError()
 
+    def submit(self, task, handin, hw, priority, *args):
+        """Queue the runner task of a submission in the fair scheduler.
+
+        :param task: The runner task, one of
+            :data:`~railgun.runner.tasks.SCHEDULED_TASKS`.
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
+        :param hw: The homework instance.
+        :type hw: :class:`~railgun.common.hw.Homework`
+        :param priority: One of
+            :data:`~railgun.runner.scheduler.PRIORITY_CLASSES`.
+        :type priority: :class:`str`
+        :param args: The arguments of `task` after `handid` and `hwid`.
+            The last one must be the `options` dict of the task.
+        """
+        # The runner measures the time waiting in the queue by this.
+        args[-1]['queued_at'] = time.time()
+        ddl = hw.get_next_deadline()
+        schedule(task, (handin.uuid, hw.uuid) + args, priority,
+                 handin.user_id, ddl[0] if ddl else None)
+
     def handle_upload(self, handid, hw, form):
         """Handle the uploaded form data submitted to the given homework
         in this programming language.
@@ -153,7 +242,7 @@ class CodeLanguage(object):
 
         # post the job to run queue
         try:
-            self.do_handle_upload(handid, hw, form)
+            self.do_handle_upload(handin, hw, form)
         except Exception:
             # if we cannot post to run queue, modify the handin status to error
             handin.state = 'Rejected'
@@ -163,21 +252,21 @@ class CodeLanguage(object):
             # re-raise this exception
             raise
 
-    def do_rerun(self, handid, hw, stored_content):
+    def do_rerun(self, handin, hw, priority):
         """Called by :meth:`rerun` to reput the submission into runqueue.
         Derived classes should implement this.
 
-        :param handid: The submission uuid.
-        :type handid: :class:`str`
+        :param handin: The submission object, whose original data has been
+            stored.
+        :type handin: :class:`~railgun.website.models.Handin`
         :param hw: The homework instance.
         :type hw: :class:`~railgun.common.hw.Homework`
-        :param stored_content: The stored object of this submission.
-            Loading object from disk is finished in :meth:`do_handle_download`.
-        :type stored_content: :class:`object`
+        :param priority: The priority class in the fair scheduler.
+        :type priority: :class:`str`
         """
         raise NotImplementedError()
 
-    def rerun(self, handid, hw, fullscale=False):
+    def rerun(self, handid, hw, fullscale=False, priority='rerun'):
         """Reput the submission into runqueue.  This operation should be called
         only if `config.STORE_UPLOAD` is enabled.
 
@@ -187,14 +276,16 @@ class CodeLanguage(object):
         :type hw: :class:`~railgun.common.hw.Homework`
         :param fullscale: Whether to set the submission score scale to 1.0?
         :type fullscale: :class:`bool`
+        :param priority: The priority class in the fair scheduler, one of
+            :data:`~railgun.runner.scheduler.PRIORITY_CLASSES`.
+        :type priority: :class:`str`
 
         :return: :data:`True` if successfully put into runqueue,
             :data:`False` if original file is not stored, raises otherwise.
         """
-        stored_content = self.load_content(handid)
-        if not stored_content:
-            return False
         handin = db.session.query(Handin).filter(Handin.uuid == handid).first()
+        if not handin.upload_digest and not self.migrate_legacy(handin):
+            return False
 
         try:
             handin.state = 'Pending'
@@ -205,7 +296,7 @@ class CodeLanguage(object):
                 handin.scale = 1.0
             db.session.commit()
 
-            self.do_rerun(handid, hw, stored_content)
+            self.do_rerun(handin, hw, priority)
         except Exception:
             # if we cannot post to run queue, modify the handin status to error
             handin.state = 'Rejected'
@@ -216,15 +307,15 @@ class CodeLanguage(object):
             raise
         return True
 
-    def do_handle_download(self, stored_content):
+    def do_handle_download(self, handin, fobj):
         """Called by :meth:`handle_download` to help send the original
         submission data to the client. Derived classes should override
-        this to extract data from stored objects, to set http headers,
-        and finish other necessary process.
+        this to set http headers, and finish other necessary process.
 
-        :param stored_content: The stored object of this submission.
-            Loading object from disk is finished in :meth:`do_handle_download`.
-        :type stored_content: :class:`object`
+        :param handin: The submission object.
+        :type handin: :class:`~railgun.website.models.Handin`
+        :param fobj: The file object of the original data, opened by
+            :meth:`load_content`.
         """
         raise NotImplementedError()
 
@@ -235,10 +326,11 @@ class CodeLanguage(object):
         :param handid: The submission uuid.
         :type handid: :class:`str`
         """
-        payload = self.load_content(handid)
-        if not payload:
+        handin = Handin.query.filter(Handin.uuid == handid).first()
+        fobj = self.load_content(handin) if handin else None
+        if fobj is None:
             abort(404)
-        return self.do_handle_download(payload)
+        return self.do_handle_download(handin, fobj)
 
 
 class StandardLanguage(CodeLanguage):
@@ -246,8 +338,8 @@ class StandardLanguage(CodeLanguage):
     and Java) that accepts archive files as submissions.
 
     This handler class will store the uploaded file content as well as its
-    file name onto disk, in that Railgun relies on file extension to detect
-    the archive file format.
+    file name, in that Railgun relies on file extension to detect the
+    archive file format.
 
     :param lang: The programming language identity.
     :type lang: :class:`str`
@@ -261,11 +353,9 @@ class StandardLanguage(CodeLanguage):
     def upload_form(self, hw):
         return UploadHandinForm()
 
-    def do_handle_download(self, stored_content):
-        fcnt = base64.b64decode(stored_content['fcnt'])
-        fname = stored_content['fname']
-        return send_file(StringIO(fcnt), as_attachment=True,
-                         attachment_filename=fname)
+    def do_handle_download(self, handin, fobj):
+        return send_file(fobj, as_attachment=True,
+                         attachment_filename=handin.upload_name)
 
 
 class PythonLanguage(StandardLanguage):
@@ -277,17 +367,27 @@ class PythonLanguage(StandardLanguage):
     def __init__(self):
         super(PythonLanguage, self).__init__('python', lazy_gettext('Python'))
 
-    def do_rerun(self, handid, hw, stored_content):
-        fcnt, fname = stored_content['fcnt'], stored_content['fname']
-        run_python.delay(handid, hw.uuid, fcnt, {'filename': fname})
+    def do_rerun(self, handin, hw, priority):
+        self.submit(run_python, handin, hw, priority, None, {
+            'filename': handin.upload_name, 'digest': handin.upload_digest,
+            'size': handin.upload_size})
 
-    def do_handle_upload(self, handid, hw, form):
+    def do_handle_upload(self, handin, hw, form):
         filename = form.handin.data.filename
-        fcnt = base64.b64encode(form.handin.data.stream.read())
-        # We store the user uploaded file in local storage!
-        self.store_content(handid, {'fname': filename, 'fcnt': fcnt})
+        if not app.config['STORE_UPLOAD']:
+            # The uploaded file would never be read again, so it is put into
+            # the run queue directly instead of being left in the store.
+            fcnt = base64.b64encode(form.handin.data.stream.read())
+            self.submit(run_python, handin, hw, 'interactive', fcnt,
+                        {'filename': filename})
+            return
+        # We store the user uploaded file in the upload store, and only put
+        # its digest into the run queue.
+        digest, size = self.store_content(handin, form.handin.data.stream,
+                                          filename)
         # Push the submission to run queue
-        run_python.delay(handid, hw.uuid, fcnt, {'filename': filename})
+        self.submit(run_python, handin, hw, 'interactive', None, {
+            'filename': filename, 'digest': digest, 'size': size})
 
 
 class JavaLanguage(StandardLanguage):
@@ -309,17 +409,23 @@ class NetApiLanguage(CodeLanguage):
     def __init__(self):
         super(NetApiLanguage, self).__init__('netapi', 'NetAPI')
 
-    def do_rerun(self, handid, hw, stored_content):
-        run_netapi.delay(handid, hw.uuid, stored_content, {})
+    def do_rerun(self, handin, hw, priority):
+        self.submit(run_netapi, handin, hw, priority,
+                    self.read_content(handin), {})
 
-    def do_handle_upload(self, handid, hw, form):
+    def do_handle_upload(self, handin, hw, form):
         # We store the user uploaded file in local storage!
-        self.store_content(handid, form.address.data)
+        address = form.address.data
+        if app.config['STORE_UPLOAD']:
+            self.store_content(handin, StringIO(address.encode('utf-8')))
         # Push the submission to run queue
-        run_netapi.delay(handid, hw.uuid, form.address.data, {})
+        self.submit(run_netapi, handin, hw, 'interactive', address, {})
 
-    def do_handle_download(self, stored_content):
-        resp = make_response(stored_content)
+    def do_handle_download(self, handin, fobj):
+        try:
+            resp = make_response(fobj.read())
+        finally:
+            fobj.close()
         resp.headers['Content-Type'] = 'text/plain'
         return resp
 
@@ -335,17 +441,23 @@ class InputLanguage(CodeLanguage):
     def __init__(self):
         super(InputLanguage, self).__init__('input', 'CsvData')
 
-    def do_rerun(self, handid, hw, stored_content):
-        run_input.delay(handid, hw.uuid, stored_content, {})
+    def do_rerun(self, handin, hw, priority):
+        self.submit(run_input, handin, hw, priority,
+                    self.read_content(handin), {})
 
-    def do_handle_upload(self, handid, hw, form):
+    def do_handle_upload(self, handin, hw, form):
         # We store the user uploaded file in local storage!
-        self.store_content(handid, form.csvdata.data)
+        csvdata = form.csvdata.data
+        if app.config['STORE_UPLOAD']:
+            self.store_content(handin, StringIO(csvdata.encode('utf-8')))
         # Push the submission to run queue
-        run_input.delay(handid, hw.uuid, form.csvdata.data, {})
+        self.submit(run_input, handin, hw, 'interactive', csvdata, {})
 
-    def do_handle_download(self, stored_content):
-        resp = make_response(stored_content)
+    def do_handle_download(self, handin, fobj):
+        try:
+            resp = make_response(fobj.read())
+        finally:
+            fobj.close()
         resp.headers['Content-Type'] = 'text/csv'
         return resp
 
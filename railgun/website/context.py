@@ -13,6 +13,7 @@ from flask_wtf.csrf import CsrfProtect
 from flask.ext.sqlalchemy import SQLAlchemy
 from flask.ext.cache import Cache
 
+from railgun.common.blobstore import FileBlobStore
 from . import webconfig
 
 #: A :class:`~flask.Flask` object.  It implements a WSGI application and acts
@@ -43,6 +44,11 @@ db = SQLAlchemy(app)
 #: :data:`~railgun.website.context.app` to bring in cache facility.
 cache = Cache(app, config=app.config['WEBSITE_CACHE'])
 
+#: A :class:`~railgun.common.blobstore.FileBlobStore` object.  It stores
+#: the uploaded files under ``config.BLOB_STORE_DIR``.
+blobs = FileBlobStore(app.config['BLOB_STORE_DIR'],
+                      compression=app.config['UPLOAD_COMPRESSION'])
+
 # Create the debugging toolbar
 if app.config['DEBUG'] and app.config.get('DEBUG_TOOLBAR', True):
     from flask_debugtoolbar import DebugToolbarExtension
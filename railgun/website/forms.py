@@ -10,9 +10,11 @@ import json
 from flask_wtf import Form
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, PasswordField, SelectField, BooleanField
+from wtforms.fields.html5 import DateField
 from wtforms.widgets import TextArea
 from wtforms.validators import (DataRequired, Length, Email, InputRequired,
-                                EqualTo, Regexp, URL, ValidationError)
+                                EqualTo, Regexp, URL, ValidationError,
+                                Optional)
 from babel import UnknownLocaleError
 from pytz import timezone, UnknownTimeZoneError
 from flask.ext.babel import Locale, lazy_gettext as _
@@ -263,6 +265,38 @@ class AdminUserEditForm(ProfileForm):
     is_admin = BooleanField(_('Is administrator?'))
 
 
+class RegradeForm(BaseForm):
+    """The form for admins to regrade the submissions of a homework.
+    Used in :func:`~railgun.website.admin.regrade`, where the choices of
+    :attr:`lang` would be set.
+    """
+
+    #: Checkbox input representing whether to regrade accepted submissions.
+    accepted = BooleanField(_('Regrade accepted submissions'), default=True)
+
+    #: Checkbox input representing whether to regrade rejected submissions.
+    rejected = BooleanField(_('Regrade rejected submissions'), default=True)
+
+    #: Only regrade the submissions in the selected programming language.
+    lang = SelectField(_('Programming language'), default='')
+
+    #: Only regrade the submissions on or after this date.
+    since = DateField(_('Submitted since'), validators=[Optional()])
+
+    #: Only regrade the submissions on or before this date.
+    until = DateField(_('Submitted until'), validators=[Optional()])
+
+    #: Checkbox input representing whether to set the score scale to 1.0.
+    fullscale = BooleanField(_('With full score'))
+
+    def validate_rejected(form, field):
+        """At least one of :attr:`accepted` and :attr:`rejected` should be
+        checked."""
+        if not form.accepted.data and not field.data:
+            raise ValidationError(_('Please select the submissions to '
+                                    'regrade.'))
+
+
 class UploadHandinForm(BaseForm):
     """The form for users to upload archive files as submissions."""
 
@@ -15,6 +15,7 @@ import os
 from datetime import datetime
 
 from babel.dates import UTC
+from sqlalchemy import event
 from flask.ext.babel import gettext, get_locale
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -27,6 +28,9 @@ _ = lambda s: s
 #: The tuple of possible submission states.
 HANDIN_STATES = (_('Pending'), _('Running'), _('Rejected'), _('Accepted'))
 
+#: The tuple of possible regrade job states.
+REGRADE_STATES = (_('Running'), _('Paused'), _('Cancelled'), _('Finished'))
+
 
 if app.config['SQLALCHEMY_DATABASE_URI'].startswith('mysql'):
     # Special patch: SQLAlchemy will use BLOB as the default backend for
@@ -253,6 +257,52 @@ class Handin(db.Model):
     #: The program standard error output of this submission.
     stderr = db.Column(db.Text)
 
+    #: The total bytes of standard output.  :attr:`stdout` only keeps the
+    #: head and the tail of the output if it exceeds
+    #: ``config.RUNNER_OUTPUT_HEAD + config.RUNNER_OUTPUT_TAIL``.
+    stdout_size = db.Column(db.Integer)
+
+    #: The total bytes of standard error output.
+    stderr_size = db.Column(db.Integer)
+
+    #: User CPU time of the submission process in seconds.
+    cpu_user = db.Column(db.Float)
+
+    #: System CPU time of the submission process in seconds.
+    cpu_system = db.Column(db.Float)
+
+    #: Maximum resident set size of the submission process in kilobytes.
+    max_rss = db.Column(db.Integer)
+
+    #: Block input operations of the submission process.
+    io_inblock = db.Column(db.Integer)
+
+    #: Block output operations of the submission process.
+    io_oublock = db.Column(db.Integer)
+
+    #: Voluntary context switches of the submission process.
+    ctx_voluntary = db.Column(db.Integer)
+
+    #: Involuntary context switches of the submission process.
+    ctx_involuntary = db.Column(db.Integer)
+
+    #: Wall-clock time of the submission process in seconds.
+    wall_time = db.Column(db.Float)
+
+    #: The SHA-256 digest of the original submission data in the upload
+    #: store, or :data:`None` if not stored.
+    upload_digest = db.Column(db.String(64), index=True)
+
+    #: The original file name of the submission data, maximum 255 characters.
+    upload_name = db.Column(db.Unicode(255))
+
+    #: The size of the original submission data in bytes.
+    upload_size = db.Column(db.Integer)
+
+    #: The id of the :class:`RegradeJob` which has put this submission into
+    #: the runner queue, or :data:`None` if it is never regraded.
+    regrade_id = db.Column(db.Integer, index=True)
+
     #: List of scores from each scorer.
     #:
     #: Actual type is :class:`list` of `railgun.common.hw.HwPartialScore`,
@@ -279,6 +329,23 @@ class Handin(db.Model):
         """Set :attr:`ctime` to the value of `ctime`, but dettach timezone."""
         self.ctime = to_plain_date(ctime)
 
+    #: The resource usage columns, the same as the keys of
+    #: :func:`railgun.common.osutil.make_usage`.
+    USAGE_COLUMNS = ('cpu_user', 'cpu_system', 'max_rss', 'io_inblock',
+                     'io_oublock', 'ctx_voluntary', 'ctx_involuntary',
+                     'wall_time')
+
+    def set_usage(self, usage):
+        """Store the resource usage of the submission process.
+
+        :param usage: The usage dict from
+            :func:`railgun.common.osutil.make_usage`, or :data:`None`.
+        :type usage: :class:`dict`
+        """
+        usage = usage or {}
+        for k in Handin.USAGE_COLUMNS:
+            setattr(self, k, usage.get(k))
+
     def get_state(self):
         """The state is stored as plain text in the database.  Get the
         translated version of the state text.
@@ -312,6 +379,31 @@ class Handin(db.Model):
         """
         return unicode(self.stderr) if self.stderr else u''
 
+    def set_timings(self, timings):
+        """Replace the stage timings of the submission.
+
+        :param timings: The seconds spent in each stage, from the
+            ``timings`` of :attr:`railgun.runner.host.BaseHost.stats`, or
+            :data:`None`.
+        :type timings: :class:`dict`
+        """
+        HandinTiming.query.filter(HandinTiming.handin_id == self.id).delete()
+        items = sorted((timings or {}).iteritems())
+        for stage, seconds in items[:HandinTiming.MAX_STAGES]:
+            db.session.add(HandinTiming(handin_id=self.id, stage=stage[:32],
+                                        seconds=float(seconds)))
+
+    def get_timings(self):
+        """Get the stage timings of the submission.
+
+        :return: A :class:`list` of (`stage`, `seconds`), in the order of
+            :data:`HandinTiming.TIMING_STAGES`.
+        """
+        return HandinTiming.sort(
+            (t.stage, t.seconds) for t in
+            HandinTiming.query.filter(HandinTiming.handin_id == self.id)
+        )
+
     def get_compile_error(self):
         """Safe method to get empty string if :attr:`compile_error` is
         :data:`None`, or the translated :attr:`compile_error`.
@@ -319,6 +411,175 @@ class Handin(db.Model):
         return unicode(self.compile_error) if self.compile_error else u''
 
 
+class HandinTiming(db.Model):
+    """The seconds spent in one stage of running a submission, measured by
+    the runner.  See :meth:`railgun.runner.host.BaseHost.stage` for more
+    details.
+    """
+
+    __tablename__ = 'handin_timings'
+
+    # Table arguments. Inrecognized arguments will be ignored by certain
+    # database engine.
+    __table_args__ = {'mysql_engine': 'InnoDB'}
+
+    #: The known stages, in the order they take place.
+    #:
+    #: *   ``queue``: Waiting in the runner queue.
+    #: *   ``report_start``: Reporting the running state to the website.
+    #: *   ``setup``: Loading the homework and the submission handler.
+    #: *   ``fetch``: Fetching the archive file from the blob store.
+    #: *   ``prepare_hwcode``: Copying the homework code files.
+    #: *   ``extract``: Extracting the submission archive.
+    #: *   ``compile``: Validating the NetAPI address.
+    #: *   ``acquire_user``: Acquiring a system account.
+    #: *   ``secure_tempdir``: Changing the owner and the mode of files.
+    #: *   ``sandbox``: Running the sandbox, including the interpreter
+    #:     startup, the scorers and the score report.
+    #: *   ``cleanup``: Removing the temporary directory.
+    #: *   ``total``: The whole run, excluding ``queue``.
+    TIMING_STAGES = ('queue', 'report_start', 'setup', 'fetch',
+                     'prepare_hwcode', 'extract', 'compile', 'acquire_user',
+                     'secure_tempdir', 'sandbox', 'cleanup', 'total')
+
+    #: At most such stages are stored for each submission.
+    MAX_STAGES = 32
+
+    #: The id of the submission.
+    handin_id = db.Column(db.Integer,
+                          db.ForeignKey('handins.id', ondelete='CASCADE'),
+                          primary_key=True)
+
+    #: The name of the stage.
+    stage = db.Column(db.String(32), primary_key=True, index=True)
+
+    #: The seconds spent in the stage.
+    seconds = db.Column(db.Float)
+
+    def __repr__(self):
+        return '<HandinTiming(%s, %s)>' % (self.handin_id, self.stage)
+
+    @staticmethod
+    def sort(timings):
+        """Sort the (`stage`, `seconds`) pairs in the order of
+        :data:`TIMING_STAGES`.  Unknown stages are placed at the end.
+
+        :param timings: An iterable of (`stage`, `seconds`).
+        :return: A :class:`list` of (`stage`, `seconds`).
+        """
+        order = HandinTiming.TIMING_STAGES
+        return sorted(
+            timings,
+            key=lambda t: (order.index(t[0]) if t[0] in order else len(order),
+                           t[0])
+        )
+
+
+class ApiMessage(db.Model):
+    """An api message records the unique id of a message that has been
+    applied by :func:`~railgun.website.api.api_handin_batch`, so that
+    the duplicated messages resent by the runner can be discarded.
+    """
+
+    __tablename__ = 'api_messages'
+
+    # Table arguments. Inrecognized arguments will be ignored by certain
+    # database engine.
+    __table_args__ = {'mysql_engine': 'InnoDB'}
+
+    #: The unique id of the message, assigned by the runner.
+    msgid = db.Column(db.String(32), primary_key=True)
+
+    #: The time when the message was applied, so that the records can be
+    #: purged after a while.
+    ctime = db.Column(db.DateTime, default=lambda: datetime.utcnow(),
+                      index=True)
+
+    def __repr__(self):
+        return '<ApiMessage(%s)>' % self.msgid
+
+
+class RegradeJob(db.Model):
+    """A regrade job puts the matching submissions of a homework into the
+    runner queue again, chunk by chunk.  See :mod:`railgun.website.regrade`
+    for more details.
+    """
+
+    __tablename__ = 'regrade_jobs'
+
+    # Table arguments. Inrecognized arguments will be ignored by certain
+    # database engine.
+    __table_args__ = {'mysql_engine': 'InnoDB'}
+
+    #: The integral id of this job.
+    id = db.Column(db.Integer, db.Sequence('regrade_job_id_seq'),
+                   primary_key=True)
+
+    #: The uuid of the homework.
+    hwid = db.Column(db.String(32), index=True)
+
+    #: Only regrade the submissions in this programming language, or all
+    #: languages if :data:`None`.
+    lang = db.Column(db.String(32))
+
+    #: The comma-separated submission states to be regraded.
+    states = db.Column(db.String(64))
+
+    #: Only regrade the submissions created at or after this time (in UTC
+    #: timezone, tzinfo is not stored), or no limit if :data:`None`.
+    since = db.Column(db.DateTime)
+
+    #: Only regrade the submissions created before this time.
+    until = db.Column(db.DateTime)
+
+    #: Whether to set the score scale of regraded submissions to 1.0?
+    fullscale = db.Column(db.Boolean, default=False)
+
+    #: The state of this job.  One of :data:`REGRADE_STATES`.
+    state = db.Column(db.Enum(*REGRADE_STATES), default='Running', index=True)
+
+    #: The number of matching submissions when the job is created.
+    total = db.Column(db.Integer, default=0)
+
+    #: The number of submissions that have been put into the runner queue.
+    queued = db.Column(db.Integer, default=0)
+
+    #: The number of submissions that cannot be put into the runner queue
+    #: (e.g., the original data is not stored).
+    failed = db.Column(db.Integer, default=0)
+
+    #: The submissions are regraded in the order of ids.  This is the id
+    #: of the last processed submission, so the job can be resumed from it.
+    cursor = db.Column(db.Integer, default=0)
+
+    #: The maximum submission id when the job is created.  The later
+    #: submissions are not regraded.
+    max_id = db.Column(db.Integer, default=0)
+
+    #: The time until which a website process holds the right to put the
+    #: next chunk into the runner queue.
+    lease = db.Column(db.DateTime)
+
+    #: The creation time of this job.
+    ctime = db.Column(db.DateTime, default=lambda: datetime.utcnow())
+
+    #: The time when this job is finished or cancelled.
+    ftime = db.Column(db.DateTime)
+
+    #: Link with the admin who created this job.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    #: Refer to the associated user object.
+    user = db.relationship('User')
+
+    def __repr__(self):
+        return '<RegradeJob(%s)>' % self.id
+
+    def get_states(self):
+        """Get the submission states to be regraded as a :class:`list`."""
+        return [s for s in (self.states or '').split(',') if s]
+
+
 class Vote(db.Model):
     """An instance of :class:`Vote` is a vote initiated by an admini."""
 
@@ -430,10 +691,31 @@ def assign_values(obj, dict):
             setattr(obj, c.name, dict[c.name])
 
 
+def enable_sqlite_savepoints(engine):
+    """Make the savepoints work on a SQLite `engine`.
+
+    The sqlite3 module begins and commits transactions by itself, which
+    breaks the savepoints used by `api_handin_batch`.  So we disable it
+    and emit BEGIN ourselves, as suggested by the SQLAlchemy manual.
+
+    :param engine: The SQLite engine.
+    :type engine: :class:`~sqlalchemy.engine.Engine`
+    """
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        conn.execute('BEGIN')
+
+
 # If the system uses SQL database, we try to create "db" directory.
 if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite://'):
     dpath = os.path.join(app.config['RAILGUN_ROOT'], 'db')
     if not os.path.isdir(dpath):
         os.makedirs(dpath)
 
+    enable_sqlite_savepoints(db.engine)
+
 db.create_all()
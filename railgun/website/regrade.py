@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: railgun/website/regrade.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""This module implements the bulk regrade of homework submissions.
+
+A :class:`~railgun.website.models.RegradeJob` selects the submissions of a
+homework by their states, creation time and programming language, and puts
+them into the runner queue again in the ``regrade`` priority class (see
+:mod:`railgun.runner.scheduler`).
+
+Only ``config.REGRADE_CHUNK_SIZE`` submissions of a job are put into the
+runner queue at one time, and each of them is marked with the id of the job.
+The next chunk is released by :func:`pump` when most of the previous chunk
+has been graded.  :func:`pump` is called whenever the progress of a job is
+queried, and :func:`pump_all` is called by a background :class:`Pumper`
+thread of each website process, which is woken up whenever the runner
+reports the process log of a submission, so the job advances by itself
+while the runner never waits for the runner queue.
+
+The progress is stored in the database, so a job can be resumed after the
+website is restarted.  Each chunk is released under a lease, and the cursor
+is advanced after each submission, so an interrupted chunk will be resumed
+by another website process once the lease expires.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from .context import app, db
+from .models import Handin, RegradeJob
+from .codelang import languages
+from .hw import homeworks
+
+#: A website process holds the lease of a job for at most such seconds to
+#: put one chunk into the runner queue.
+LEASE_SECONDS = 120
+
+
+def _filter_handins(job, q):
+    # Apply the filters of `job` except the states.
+    q = q.filter(Handin.hwid == job.hwid, Handin.id <= job.max_id)
+    if job.lang:
+        q = q.filter(Handin.lang == job.lang)
+    if job.since:
+        q = q.filter(Handin.ctime >= job.since)
+    if job.until:
+        q = q.filter(Handin.ctime < job.until)
+    return q
+
+
+def matching_handins(job):
+    """Get the query of submissions selected by `job`.
+
+    :param job: The regrade job.
+    :type job: :class:`~railgun.website.models.RegradeJob`
+    :return: A query of :class:`~railgun.website.models.Handin`.
+    """
+    q = _filter_handins(job, db.session.query(Handin))
+    return q.filter(Handin.state.in_(job.get_states()))
+
+
+def count_inflight(job):
+    """Count the queued submissions of `job` which have not been graded.
+
+    :param job: The regrade job.
+    :type job: :class:`~railgun.website.models.RegradeJob`
+    :return: The number of submissions.
+    """
+    return db.session.query(Handin) \
+        .filter(Handin.regrade_id == job.id,
+                Handin.state.in_(['Pending', 'Running'])).count()
+
+
+def create_job(hw, states, lang=None, since=None, until=None,
+               fullscale=False, user=None):
+    """Create a new regrade job and release its first chunk.
+
+    The submissions which are pending or running will never be regraded.
+
+    :param hw: The homework instance.
+    :type hw: :class:`~railgun.common.hw.Homework`
+    :param states: The submission states to be regraded.
+    :type states: :class:`list` of :class:`str`
+    :param lang: Only regrade the submissions in this language.
+    :type lang: :class:`str`
+    :param since: Only regrade the submissions created at or after this
+        time (naive datetime in UTC).
+    :type since: :class:`~datetime.datetime`
+    :param until: Only regrade the submissions created before this time.
+    :type until: :class:`~datetime.datetime`
+    :param fullscale: Whether to set the score scale to 1.0?
+    :type fullscale: :class:`bool`
+    :param user: The admin who creates this job.
+    :type user: :class:`~railgun.website.models.User`
+    :return: The new :class:`~railgun.website.models.RegradeJob`.
+    """
+    states = [s for s in states if s not in ('Pending', 'Running')]
+    max_id = db.session.query(db.func.max(Handin.id)).scalar() or 0
+    job = RegradeJob(hwid=hw.uuid, lang=lang or None,
+                     states=','.join(states), since=since, until=until,
+                     fullscale=fullscale, state='Running', max_id=max_id,
+                     user_id=user.id if user else None)
+    job.total = matching_handins(job).count()
+    db.session.add(job)
+    db.session.commit()
+    pump(job)
+    return job
+
+
+def _acquire_lease(job):
+    now = datetime.utcnow()
+    count = db.session.query(RegradeJob) \
+        .filter(RegradeJob.id == job.id, RegradeJob.state == 'Running',
+                or_(RegradeJob.lease.is_(None), RegradeJob.lease < now)) \
+        .update({'lease': now + timedelta(seconds=LEASE_SECONDS)},
+                synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(job)
+    return count > 0
+
+
+def pump(job):
+    """Put the next chunk of `job` into the runner queue, if fewer than
+    ``config.REGRADE_CHUNK_SIZE`` queued submissions are still waiting
+    to be graded.  The job will be marked as `Finished` if all the
+    submissions have been graded.
+
+    :param job: The regrade job.
+    :type job: :class:`~railgun.website.models.RegradeJob`
+    :return: The number of submissions put into the runner queue.
+    """
+    chunk_size = app.config['REGRADE_CHUNK_SIZE']
+    if job.state != 'Running' or count_inflight(job) >= chunk_size:
+        return 0
+    if not _acquire_lease(job):
+        return 0
+
+    count = 0
+    try:
+        handins = matching_handins(job).filter(Handin.id > job.cursor) \
+            .order_by(Handin.id).limit(chunk_size) \
+            .with_entities(Handin.id, Handin.uuid, Handin.lang).all()
+        if not handins and not count_inflight(job):
+            job.state = 'Finished'
+            job.ftime = datetime.utcnow()
+        hw = homeworks.get_by_uuid(job.hwid)
+        for handid, uuid, lang in handins:
+            ok = False
+            try:
+                if hw is not None and lang in languages:
+                    ok = languages[lang].rerun(uuid, hw, job.fullscale,
+                                               priority='regrade')
+            except Exception:
+                app.logger.exception('Could not regrade submission %s.'
+                                     % uuid)
+            # Advance the cursor after each submission, so that an
+            # interrupted chunk can be resumed exactly.
+            job.cursor = handid
+            if ok:
+                db.session.query(Handin) \
+                    .filter(Handin.id == handid) \
+                    .update({'regrade_id': job.id},
+                            synchronize_session=False)
+                job.queued += 1
+                count += 1
+            else:
+                job.failed += 1
+            db.session.commit()
+    finally:
+        job.lease = None
+        db.session.commit()
+    return count
+
+
+def pump_all():
+    """Call :func:`pump` on all running regrade jobs."""
+    for job in RegradeJob.query.filter(RegradeJob.state == 'Running'):
+        pump(job)
+
+
+class Pumper(threading.Thread):
+    """The background thread that calls :func:`pump_all` in a website
+    process, so that the runner api requests need not wait for putting the
+    regrade jobs into the runner queue.
+    """
+
+    #: Check the running jobs for such seconds even if not waken up.
+    IDLE_INTERVAL = 30.0
+
+    def __init__(self):
+        super(Pumper, self).__init__(name='RegradePumper')
+        self.daemon = True
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """Notify the pumper that some submissions have been graded."""
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            with app.app_context():
+                try:
+                    pump_all()
+                except Exception:
+                    app.logger.exception(
+                        'Cannot put the regrade jobs into runner queue.')
+                finally:
+                    db.session.remove()
+            self._wakeup.wait(self.IDLE_INTERVAL)
+
+
+# The process-wide pumper, and the process id which creates it.
+_pumper = None
+_pumper_pid = None
+
+
+def get_pumper():
+    """Get the process-wide :class:`Pumper`, and start it if necessary.
+
+    A new pumper will be started after the website process is forked, since
+    the threads do not survive the fork.
+
+    :return: The :class:`Pumper` object.
+    """
+    global _pumper, _pumper_pid
+    if _pumper is None or _pumper_pid != os.getpid():
+        _pumper = Pumper()
+        _pumper_pid = os.getpid()
+        _pumper.start()
+    return _pumper
+
+
+def get_progress(job):
+    """Get the progress of a regrade job.
+
+    :param job: The regrade job.
+    :type job: :class:`~railgun.website.models.RegradeJob`
+    :return: A :class:`dict` of ``{"state": job state, "total": ...,
+        "queued": ..., "failed": ..., "graded": ..., "eta": estimated
+        seconds to finish or None}``.
+    """
+    inflight = count_inflight(job)
+    graded = job.queued - inflight
+    done = graded + job.failed
+    eta = None
+    if job.state == 'Running' and graded > 0:
+        elapsed = (datetime.utcnow() - job.ctime).total_seconds()
+        eta = max(job.total - done, 0) * elapsed / done
+    return {
+        'state': job.state,
+        'total': job.total,
+        'queued': job.queued,
+        'failed': job.failed,
+        'graded': graded,
+        'eta': eta,
+    }
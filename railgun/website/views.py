@@ -462,8 +462,8 @@ def handin_detail(uuid):
     If the submission is not owned by current user, nor is current user an
     administrator, then this view will send a 404 http error to request user.
 
-    If the submission file was stored in ``config.UPLOAD_STORE_DIR``, a link
-    will be displayed to let the user download original file.
+    If the submission file was stored in the upload store, a link will be
+    displayed to let the user download original file.
 
     :route: /handin/<uuid>/
     :method: GET
@@ -486,8 +486,7 @@ def handin_detail(uuid):
     hw = g.homeworks.get_by_uuid(handin.hwid)
 
     # check whether the original submission exists
-    submit_file = os.path.join(app.config['UPLOAD_STORE_DIR'], uuid)
-    original_submission_exist = os.path.isfile(submit_file)
+    original_submission_exist = languages[handin.lang].has_content(handin)
 
     # render the handin
     return render_template('handin_detail.html', handin=handin, hw=hw,
@@ -501,8 +500,8 @@ def handin_download(uuid):
     If the submission is not owned by current user, nor is current user an
     administrator, then this view will send a 404 http error to request user.
 
-    All the original submission files should be stored in
-    ``config.UPLOAD_STORE_DIR``, if ``config.STORE_UPLOAD`` is set to
+    All the original submission files should be stored in the upload store
+    (``config.BLOB_STORE_DIR``), if ``config.STORE_UPLOAD`` is set to
     :data:`True`.
 
     :route: /handin/<uuid>/download/
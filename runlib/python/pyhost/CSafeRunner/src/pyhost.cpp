@@ -11,8 +11,15 @@ namespace bp = boost::python;
 // Include other C++ headers from here.
 #include <stdlib.h>
 #include <unistd.h>
+#include <errno.h>
+#include <signal.h>
+#include <sys/prctl.h>
+#include <sys/wait.h>
 #include <string>
+#include <vector>
+#include <deque>
 #include <iostream>
+#include <sstream>
 #include <curl/curl.h>
 
 // Project header files
@@ -25,6 +32,12 @@ namespace
   // Flag to indicate whether SafeRunner.run is called twice
   bool PyHostExecuted = false;
 
+  // Whether this process is the zygote of warm sandbox pool, which is
+  // decided at startup and never changes.  Only the sandboxes forked by
+  // the zygote may reload the context, and only once (see ReloadContext).
+  bool PyHostZygote = false;
+  bool PyHostReloaded = false;
+
   // Secret PyHost context variables
   std::string PyHostCommKey;
   int PyHostUserId = 0;
@@ -36,6 +49,16 @@ namespace
   std::string PyHostHandId;
   std::string PyHostHwId;
 
+  // The file to pass the score to the runner, which reports it along with
+  // the process log, so that the score is never lost if the website is not
+  // available.  It is opened before the privilege is dropped.  If not given,
+  // the score is posted to the website directly.
+  FILE* PyHostScoreFile = NULL;
+
+  // The maximum number of scorers running at the same time in forked child
+  // processes.  Scorers are run one by one in this process if less than 2.
+  int PyHostScorerParallel = 1;
+
   // Common Utilities
   std::string LoadCommKey(std::string const& railgun_root)
   {
@@ -145,6 +168,163 @@ namespace
     partial->time = ExtractVariant(scorer.attr("time"));
   }
 
+  // Run a (scorer, weight) tuple in this process.
+  void RunScorer(bp::object const& scorer_weight, HwPartialScore *partial)
+  {
+    bp::object scorer = scorer_weight[0];
+    partial->weight = bp::extract<double>(scorer_weight[1]);
+
+    // Run the scorer!
+    scorer.attr("run")();
+
+    // Extract scorer results
+    ExtractScorerResults(scorer, partial);
+  }
+
+  // Whether a scorer may run in a forked child process?  Scorers which
+  // share interpreter state with others (e.g., the coverage scorer) should
+  // set `parallel` to False.
+  bool IsParallelScorer(bp::object const& scorer)
+  {
+    if (!PyObject_HasAttrString(scorer.ptr(), "parallel"))
+      return false;
+    return bp::extract<bool>(scorer.attr("parallel"));
+  }
+
+  // A scorer running in a forked child process, which writes the partial
+  // score in JSON to a pipe.
+  struct ScorerChild
+  {
+    bp::ssize_t index;
+    pid_t pid;
+    int fd;
+    int status;
+    std::string output;
+  };
+
+  // Exit codes of scorer child processes.
+  enum {
+    SCORER_CHILD_OK = 0,
+    SCORER_CHILD_ERROR = 1,
+    SCORER_CHILD_UNICODE_ERROR = 2
+  };
+
+  // Fork a child process to run the scorer.
+  ScorerChild ForkScorer(bp::object const& scorer, double weight,
+                         bp::ssize_t index)
+  {
+    int fds[2];
+    if (pipe(fds) != 0)
+      throw std::runtime_error("Could not create pipe for scorer.");
+
+    // Flush the buffered output, otherwise it will be written twice.
+    bp::import("sys").attr("stdout").attr("flush")();
+    bp::import("sys").attr("stderr").attr("flush")();
+    fflush(NULL);
+
+    pid_t parent = getpid();
+    pid_t pid = fork();
+    if (pid < 0) {
+      close(fds[0]);
+      close(fds[1]);
+      throw std::runtime_error("Could not fork process for scorer.");
+    }
+
+    if (pid == 0) {
+      // Do not leave the scorer running if the host is killed by timeout.
+      close(fds[0]);
+      prctl(PR_SET_PDEATHSIG, SIGKILL);
+      if (getppid() != parent)
+        _exit(SCORER_CHILD_ERROR);
+
+      int code = SCORER_CHILD_OK;
+      try {
+        HwPartialScore partial;
+        partial.weight = weight;
+        scorer.attr("run")();
+        ExtractScorerResults(scorer, &partial);
+
+        std::ostringstream oss;
+        partial.writeJson(&oss);
+        std::string json = oss.str();
+        const char* p = json.c_str();
+        size_t left = json.size();
+        while (left > 0) {
+          ssize_t size = write(fds[1], p, left);
+          if (size < 0) {
+            if (errno == EINTR)
+              continue;
+            code = SCORER_CHILD_ERROR;
+            break;
+          }
+          p += size;
+          left -= size;
+        }
+      } catch (UnicodeError) {
+        code = SCORER_CHILD_UNICODE_ERROR;
+      } catch (bp::error_already_set const&) {
+        PyErr_Print();
+        code = SCORER_CHILD_ERROR;
+      } catch (std::exception const& ex) {
+        fprintf(stderr, "%s\n", ex.what());
+        code = SCORER_CHILD_ERROR;
+      }
+
+      // Skip the Python finalizers and the atexit handlers of the host.
+      PyRun_SimpleString("import sys; sys.stdout.flush(); sys.stderr.flush()");
+      fflush(stdout);
+      fflush(stderr);
+      _exit(code);
+    }
+
+    close(fds[1]);
+    ScorerChild child;
+    child.index = index;
+    child.pid = pid;
+    child.fd = fds[0];
+    child.status = 0;
+    return child;
+  }
+
+  // Read the output of a scorer child process, and wait for it to exit.
+  void WaitScorerChild(ScorerChild *child)
+  {
+    char buf[4096];
+    ssize_t size;
+    while ((size = read(child->fd, buf, sizeof(buf))) != 0) {
+      if (size < 0) {
+        if (errno == EINTR)
+          continue;
+        break;
+      }
+      child->output.append(buf, size);
+    }
+    close(child->fd);
+    while (waitpid(child->pid, &child->status, 0) < 0 && errno == EINTR)
+      ;
+  }
+
+  // Put the partial scores reported by finished scorer child processes
+  // into `partials`.  The children should all have been waited.
+  void CollectScorerChildren(std::vector<ScorerChild> const& children,
+                             std::vector<HwPartialScore> *partials)
+  {
+    bool unicode_error = false;
+    for (auto it = children.begin(); it != children.end(); ++it) {
+      int code = WIFEXITED(it->status) ?
+        WEXITSTATUS(it->status) : SCORER_CHILD_ERROR;
+      if (code == SCORER_CHILD_UNICODE_ERROR) {
+        unicode_error = true;
+      } else if (code != SCORER_CHILD_OK || it->output.empty()) {
+        // Behave like an uncaught error of the scorer in this process.
+        throw std::runtime_error("Scorer exited with error.");
+      }
+      (*partials)[it->index].rawJson = it->output;
+    }
+    if (unicode_error)
+      throw UnicodeError();
+  }
+
   #define _(M) GetTextString((M))
 
   void RunScorers(bp::list const& scorers,
@@ -170,23 +350,48 @@ namespace
       if (!n) {
         score.result = _("No scorer defined, please contact TA.");
       }
-      for (bp::ssize_t i=0; i<n; ++i) {
-        bp::tuple scorer_weight = bp::extract<bp::tuple>(scorers[i]);
-        bp::object scorer = scorer_weight[0];
-        double weight = bp::extract<double>(scorer_weight[1]);
-
-        // Run the scorer!
-        scorer.attr("run")();
-
-        // Extract scorer results
-        HwPartialScore partial;
-        partial.weight = weight;
-        ExtractScorerResults(scorer, &partial);
-
-        // Add this partial score the total scorer
-        score.partials.push_back(partial);
+      std::vector<HwPartialScore> partials(n);
+      std::vector<bool> forked(n, false);
+
+      // Fork the scorers which may run in parallel first, so that each
+      // of them sees the same interpreter state as if it is run alone.
+      // The other scorers are then run in this process, while the last
+      // forked scorers are still running.
+      if (PyHostScorerParallel > 1) {
+        std::deque<ScorerChild> running;
+        std::vector<ScorerChild> finished;
+        for (bp::ssize_t i=0; i<n; ++i) {
+          bp::tuple scorer_weight = bp::extract<bp::tuple>(scorers[i]);
+          bp::object scorer = scorer_weight[0];
+          if (!IsParallelScorer(scorer))
+            continue;
+          if (running.size() >= (size_t)PyHostScorerParallel) {
+            WaitScorerChild(&running.front());
+            finished.push_back(running.front());
+            running.pop_front();
+          }
+          double weight = bp::extract<double>(scorer_weight[1]);
+          running.push_back(ForkScorer(scorer, weight, i));
+          forked[i] = true;
+        }
+        for (bp::ssize_t i=0; i<n; ++i) {
+          if (!forked[i])
+            RunScorer(scorers[i], &partials[i]);
+        }
+        for (auto it = running.begin(); it != running.end(); ++it) {
+          WaitScorerChild(&(*it));
+          finished.push_back(*it);
+        }
+        CollectScorerChildren(finished, &partials);
+      } else {
+        for (bp::ssize_t i=0; i<n; ++i) {
+          RunScorer(scorers[i], &partials[i]);
+        }
       }
 
+      // Add the partial scores in the original order of scorers
+      score.partials = partials;
+
       // We've now run all scorers, and checker also passes, accept this score
       score.accepted = (n > 0);
 
@@ -224,9 +429,23 @@ namespace
       score.result = _("Not valid UTF-8 sequence produced.");
     }
 
-    // Post the score object to remote API
-    ApiClient client(PyHostApiBaseUrl, PyHostCommKey);
-    client.report(score);
+    // Pass the score object to the runner via the score file, or post it
+    // to remote API if the runner does not ask for it.
+    if (PyHostScoreFile) {
+      std::ostringstream oss;
+      score.writeJson(&oss);
+      std::string json = oss.str();
+      bool written =
+        fwrite(json.c_str(), 1, json.size(), PyHostScoreFile) == json.size();
+      if (fclose(PyHostScoreFile) != 0)
+        written = false;
+      PyHostScoreFile = NULL;
+      if (!written)
+        throw std::runtime_error("Could not write the score file.");
+    } else {
+      ApiClient client(PyHostApiBaseUrl, PyHostCommKey);
+      client.report(score);
+    }
   }
 
   // Parse an environmental variable into int.
@@ -237,6 +456,77 @@ namespace
       return default_value;
     return atoi(value);
   }
+
+  // Get an environmental variable, or empty string if not exist.
+  std::string env2str(const char* name)
+  {
+    const char* value = getenv(name);
+    return value ? std::string(value) : std::string();
+  }
+
+  // Load the submission context from environmental variables, and
+  // downgrade user privilege.
+  void LoadContext()
+  {
+    // Save some environment variables
+    PyHostApiBaseUrl = env2str("RAILGUN_API_BASEURL");
+    PyHostHandId = env2str("RAILGUN_HANDID");
+    PyHostHwId = env2str("RAILGUN_HWID");
+
+    // Open the score file while we still have the privilege of runner
+    std::string score_file = env2str("RAILGUN_SCORE_FILE");
+    if (!score_file.empty()) {
+      PyHostScoreFile = fopen(score_file.c_str(), "wbe");
+      if (!PyHostScoreFile) {
+        fprintf(stderr, "Could not open score file %s.", score_file.c_str());
+        exit(-1);
+      }
+    }
+
+    // Get user id and group id that this process should run at.
+    PyHostUserId = env2int("RAILGUN_USER_ID");
+    PyHostGroupId = env2int("RAILGUN_GROUP_ID");
+
+    // Get the number of scorers which may run at the same time.
+    PyHostScorerParallel = env2int("RAILGUN_SCORER_PARALLEL", 1);
+
+    // Downgrade user privilege
+    if (PyHostGroupId != 0) {
+      if (setgid(PyHostGroupId) != 0) {
+        fprintf(stderr, "Could not set gid to %d.", PyHostGroupId);
+        exit(-1);
+      }
+    }
+    if (PyHostUserId != 0) {
+      if (setuid(PyHostUserId) != 0) {
+        fprintf(stderr, "Could not set uid to %d.", PyHostUserId);
+        exit(-1);
+      }
+    }
+  }
+
+  // Reload the submission context in a process forked by the zygote
+  // server of warm sandbox pool (see pyhost/zygote.py).
+  //
+  // The zygote server reloads the context before the submission code is
+  // executed, so the submission could never reload it again with forged
+  // environmental variables.  The SafeRunner processes which are not
+  // zygotes always refuse to reload.
+  void ReloadContext()
+  {
+    if (!PyHostZygote || PyHostReloaded) {
+      throw std::runtime_error(
+        "The context can only be reloaded once in a zygote sandbox!"
+      );
+    }
+    if (PyHostExecuted) {
+      throw std::runtime_error(
+        "You cannot reload the context after SafeRunner.run is called!"
+      );
+    }
+    PyHostReloaded = true;
+    LoadContext();
+  }
 }
 
 BOOST_PYTHON_FUNCTION_OVERLOADS(RunScorers_overloads, RunScorers, 1, 2);
@@ -244,6 +534,7 @@ BOOST_PYTHON_FUNCTION_OVERLOADS(RunScorers_overloads, RunScorers, 1, 2);
 BOOST_PYTHON_MODULE(SafeRunner)
 {
   bp::def("run", &RunScorers, RunScorers_overloads());
+  bp::def("reload_context", &ReloadContext);
 }
 
 // Initialize the PyHost context
@@ -252,32 +543,15 @@ void PyHostInit()
   // Initialize the CURL library
   curl_global_init(CURL_GLOBAL_ALL);
 
-  // Save some environment variables
-  PyHostApiBaseUrl = getenv("RAILGUN_API_BASEURL");
-  PyHostRailgunRoot = getenv("RAILGUN_ROOT");
-  PyHostHandId = getenv("RAILGUN_HANDID");
-  PyHostHwId = getenv("RAILGUN_HWID");
-
-  // Get user id and group id that this process should run at.
-  PyHostUserId = env2int("RAILGUN_USER_ID");
-  PyHostGroupId = env2int("RAILGUN_GROUP_ID");
-
   // Load comm key from keys/commKey.txt
+  PyHostRailgunRoot = getenv("RAILGUN_ROOT");
   PyHostCommKey = LoadCommKey(PyHostRailgunRoot);
 
-  // Downgrade user privilege
-  if (PyHostGroupId != 0) {
-    if (setgid(PyHostGroupId) != 0) {
-      fprintf(stderr, "Could not set gid to %d.", PyHostGroupId);
-      exit(-1);
-    }
-  }
-  if (PyHostUserId != 0) {
-    if (setuid(PyHostUserId) != 0) {
-      fprintf(stderr, "Could not set uid to %d.", PyHostUserId);
-      exit(-1);
-    }
-  }
+  // Whether this process is started as the zygote of warm sandbox pool
+  PyHostZygote = env2int("RAILGUN_ZYGOTE") != 0;
+
+  // Load the submission context and downgrade user privilege
+  LoadContext();
 
   // Try to be compatible with virtualenv
   char* virtual_env = getenv("VIRTUAL_ENV");
@@ -14,6 +14,11 @@ HwPartialScore::HwPartialScore()
 
 void HwPartialScore::writeJson(std::ostream* os) const
 {
+  if (!rawJson.empty()) {
+    *os << rawJson;
+    return;
+  }
+
   *os << "{\"name\": ";
   name.writeJson(os);
   *os << ", \"typeName\": \"";
@@ -24,6 +24,10 @@ struct HwPartialScore
   GetTextString brief;
   std::vector<GetTextString> detail;
 
+  // The JSON of this partial score serialized by a forked scorer process.
+  // If not empty, it is written out verbatim instead of the above fields.
+  std::string rawJson;
+
   HwPartialScore();
 
   // Serialize this object into Json output stream
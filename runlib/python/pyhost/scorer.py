@@ -53,6 +53,12 @@ class Scorer(object):
     :type name: :class:`~railgun.common.lazy_i18n.GetTextString`
     """
 
+    #: Whether this scorer may run in a forked child process, at the same
+    #: time with other scorers?  (See ``parallel`` of ``<runner>`` node in
+    #: ``code.xml``.)  Scorers which rely on the interpreter state shared
+    #: with other scorers should set this to :data:`False`.
+    parallel = True
+
     def __init__(self, name):
         #: Store the translated name of this scorer.
         #: This name will be displayed to the students in detailed submission
@@ -280,6 +286,10 @@ class CoverageScorer(Scorer):
     :type branch_weight: :class:`float`
     """
 
+    # The coverage tracer is installed into the interpreter, and the tested
+    # modules must not be imported before the tracer starts.
+    parallel = False
+
     def __init__(self, suite, filelist, stmt_weight=0.5, branch_weight=0.5):
         super(CoverageScorer, self).__init__(lazy_gettext('Coverage Scorer'))
 
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: runlib/python/pyhost/zygote.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""The zygote server of the warm sandbox pool.
+
+Launching a new `SafeRunner` for each submission means that the Python
+interpreter must be initialized, and the scorer libraries (`pep8`,
+`coverage`, `unittest`, ...) must be imported again and again.  The
+zygote is a `SafeRunner` process that imports these modules only once,
+and forks a child process for each submission.
+
+The zygote should be launched by
+:class:`railgun.runner.zygote.ZygoteProcess` as::
+
+    SafeRunner zygote.py socket-path hwcode-dir [module ...]
+
+where `module` are the extra homework modules to be preloaded from
+`hwcode-dir`.  The protocol on the unix socket is:
+
+1.  The client connects, and sends the write ends of stdout and stderr
+    pipes via ``SCM_RIGHTS``.
+2.  The client sends a JSON request line, which contains `cwd`, `env`,
+    `uid`, `gid`, `entry`, `timeout` and `limits`.
+3.  The zygote forks a supervisor, which forks the actual sandbox process.
+    The supervisor sends ``{"pid": pid}`` when the sandbox is forked, and
+    ``{"status": status, "timeout": bool, "usage": {...}}`` when the
+    sandbox exits.
+
+The sandbox process drops to the requested system account, changes into
+the submission working directory, and executes the entry script as
+``__main__``, just as if `SafeRunner` had been launched on it.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import runpy
+import signal
+import socket
+import traceback
+import _multiprocessing
+
+import SafeRunner
+from railgun.common.osutil import ResourceLimits, make_usage
+
+#: The runlib and scorer modules to be imported before forking.
+DEFAULT_PRELOAD_MODULES = (
+    'unittest', 'pep8', 'coverage', 'railgun.common.csvdata',
+    'pyhost.utility', 'pyhost.objschema', 'pyhost.scorer',
+)
+
+
+def preload_modules(hwcode_dir, modules):
+    """Import the runlib modules and the given homework modules.
+
+    The homework modules are imported from `hwcode_dir`.  Only the files
+    that the students cannot overwrite should be listed here, otherwise the
+    submission would see the original homework file instead of its own.
+
+    :param hwcode_dir: The homework code directory.
+    :type hwcode_dir: :class:`str`
+    :param modules: The names of homework modules.
+    :type modules: :class:`list` of :class:`str`
+    """
+    for m in DEFAULT_PRELOAD_MODULES:
+        __import__(m)
+    if modules:
+        sys.path.insert(0, hwcode_dir)
+        try:
+            for m in modules:
+                __import__(m)
+        finally:
+            sys.path.remove(hwcode_dir)
+
+
+def run_entry(entry):
+    """Execute `entry` as ``__main__`` and get the exit code in the same way
+    as the Python interpreter does.
+
+    :param entry: The path of entry script.
+    :type entry: :class:`str`
+    :return: The exit code.
+    """
+    try:
+        runpy.run_path(entry, run_name='__main__')
+        return 0
+    except SystemExit, ex:
+        code = ex.code
+        if code is None:
+            return 0
+        if isinstance(code, (int, long)):
+            return code
+        sys.stderr.write('%s\n' % code)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+
+
+def exec_sandbox(request, out_fd, err_fd):
+    """Become the sandbox process to run the submission.  Never returns.
+
+    :param request: The request object sent by the client.
+    :type request: :class:`dict`
+    :param out_fd: File descriptor for standard output.
+    :param err_fd: File descriptor for standard error output.
+    """
+    code = 255
+    try:
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        for fd in (null_fd, out_fd, err_fd):
+            os.close(fd)
+
+        # Setup the environment, and let SafeRunner reload its context from
+        # it.  The privileges are dropped in `reload_context`, which can be
+        # called only once, so the submission cannot reload it again.
+        os.chdir(request['cwd'])
+        ResourceLimits(**request.get('limits', {})).apply()
+        os.environ.clear()
+        os.environ.update(request['env'])
+        if request['uid'] != 0 and os.getuid() == 0:
+            os.setgroups([])
+        SafeRunner.reload_context()
+
+        entry = request['entry']
+        sys.argv = [entry]
+        sys.path[0] = os.path.dirname(entry)
+        code = run_entry(entry)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def supervise(conn, request, out_fd, err_fd):
+    """Fork the sandbox process, wait for it and report its exit status.
+    Never returns.
+
+    :param conn: The client connection.
+    :type conn: :class:`socket.socket`
+    :param request: The request object sent by the client.
+    :type request: :class:`dict`
+    :param out_fd: File descriptor for standard output.
+    :param err_fd: File descriptor for standard error output.
+    """
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        start_time = time.time()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            exec_sandbox(request, out_fd, err_fd)
+        os.close(out_fd)
+        os.close(err_fd)
+        conn.sendall('%s\n' % json.dumps({'pid': pid}))
+
+        # Kill the sandbox process when the timeout has been reached.
+        timed_out = [False]
+
+        def on_alarm(signum, frame):
+            timed_out[0] = True
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        if request.get('timeout'):
+            signal.signal(signal.SIGALRM, on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, request['timeout'])
+
+        while True:
+            try:
+                _, status, rusage = os.wait4(pid, 0)
+                break
+            except OSError, ex:
+                if ex.errno != errno.EINTR:
+                    raise
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+        usage = make_usage(rusage, time.time() - start_time)
+        conn.sendall('%s\n' % json.dumps({
+            'status': status,
+            'timeout': timed_out[0],
+            'usage': usage,
+        }))
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        os._exit(0)
+
+
+def reap_children(signum, frame):
+    """Reap all the exited supervisors."""
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0] > 0:
+            pass
+    except OSError:
+        pass
+
+
+def serve(sock_path, hwcode_dir, modules):
+    """Run the zygote server.
+
+    :param sock_path: The unix socket path to listen on.
+    :type sock_path: :class:`str`
+    :param hwcode_dir: The homework code directory.
+    :type hwcode_dir: :class:`str`
+    :param modules: The names of homework modules to preload.
+    :type modules: :class:`list` of :class:`str`
+    """
+    preload_modules(hwcode_dir, modules)
+
+    parent = os.getppid()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+    server.bind(sock_path)
+    os.chmod(sock_path, 0600)
+    server.listen(128)
+    # Wake up from time to time, so that we could exit after the runner
+    # process has gone away.
+    server.settimeout(5)
+
+    signal.signal(signal.SIGCHLD, reap_children)
+    signal.siginterrupt(signal.SIGCHLD, False)
+
+    while os.getppid() == parent:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+        except socket.error, ex:
+            if ex.errno == errno.EINTR:
+                continue
+            raise
+
+        try:
+            conn.settimeout(None)
+            out_fd = _multiprocessing.recvfd(conn.fileno())
+            err_fd = _multiprocessing.recvfd(conn.fileno())
+            request = json.loads(conn.makefile('rb').readline())
+            # Flush the buffered output, so that the children will not
+            # write them out again.
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                server.close()
+                supervise(conn, request, out_fd, err_fd)
+            os.close(out_fd)
+            os.close(err_fd)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            conn.close()
+
+    server.close()
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], sys.argv[2], sys.argv[3:])
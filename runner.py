@@ -12,7 +12,9 @@ import copy
 import config
 
 # there are two run queues: `default` for standard handins, and `online` for
-# netapi handins.
+# netapi handins.  `python runner.py supervise` runs workers for all the
+# queues in config.RUNNER_QUEUES, otherwise only one queue is served.
+# `python runner.py metrics` prints the metrics of the runners.
 queue = sys.argv[1] if len(sys.argv) > 1 else 'default'
 
 # construct the new running environment
@@ -21,15 +23,22 @@ env['PYTHONPATH'] = os.pathsep.join([
     os.path.realpath(os.path.dirname(__file__))
 ])
 
-# execute the runner according to arguments
-args = [
-    'celery',
-    '-A',
-    'railgun.runner.context',
-    'worker',
-    '-Q',
-    queue,
-    '--concurrency=%d' % config.RUNNER_CONCURRENTY,
-    '--logfile=logs/celery.log',
-]
-os.execvpe('celery', args, env)
+if queue == 'supervise':
+    from railgun.runner.supervisor import supervise
+    supervise(env, 'logs')
+elif queue == 'metrics':
+    from railgun.runner.metrics import registry
+    sys.stdout.write(registry.render())
+else:
+    # execute the runner according to arguments
+    args = [
+        'celery',
+        '-A',
+        'railgun.runner.context',
+        'worker',
+        '-Q',
+        queue,
+        '--concurrency=%d' % config.RUNNER_CONCURRENTY,
+        '--logfile=logs/celery.log',
+    ]
+    os.execvpe('celery', args, env)
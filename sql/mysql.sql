@@ -9,3 +9,7 @@ CREATE DATABASE railgun CHARACTER SET utf8 COLLATE utf8_bin;
 GRANT ALL PRIVILEGES ON railgun.* To 'railgun'@'localhost' IDENTIFIED BY '<the password>';
 
 FLUSH PRIVILEGES;
+
+-- The tables are created by the website on its first start.  To upgrade an
+-- existing database, run `python manage.py upgrade-db --apply`, or apply
+-- sql/upgrade-mysql.sql.
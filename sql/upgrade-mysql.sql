@@ -0,0 +1,29 @@
+-- The script to upgrade an existing MySQL database of Railgun
+-- The statements of the features already applied should be skipped (or
+-- run `python manage.py upgrade-db` to find out the missing columns).
+
+USE railgun;
+
+-- Total sizes of the captured submission outputs
+ALTER TABLE handins ADD COLUMN stdout_size INTEGER;
+ALTER TABLE handins ADD COLUMN stderr_size INTEGER;
+
+-- Resource usage of the submission processes
+ALTER TABLE handins ADD COLUMN cpu_user FLOAT;
+ALTER TABLE handins ADD COLUMN cpu_system FLOAT;
+ALTER TABLE handins ADD COLUMN max_rss INTEGER;
+ALTER TABLE handins ADD COLUMN io_inblock INTEGER;
+ALTER TABLE handins ADD COLUMN io_oublock INTEGER;
+ALTER TABLE handins ADD COLUMN ctx_voluntary INTEGER;
+ALTER TABLE handins ADD COLUMN ctx_involuntary INTEGER;
+ALTER TABLE handins ADD COLUMN wall_time FLOAT;
+
+-- The original submission data in the upload store
+ALTER TABLE handins ADD COLUMN upload_digest VARCHAR(64);
+ALTER TABLE handins ADD COLUMN upload_name VARCHAR(255);
+ALTER TABLE handins ADD COLUMN upload_size INTEGER;
+CREATE INDEX ix_handins_upload_digest ON handins (upload_digest);
+
+-- The regrade job which has put the submission into the runner queue
+ALTER TABLE handins ADD COLUMN regrade_id INTEGER;
+CREATE INDEX ix_handins_regrade_id ON handins (regrade_id);
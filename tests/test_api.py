@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_api.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import json
+import unittest
+import uuid
+
+from flask import request
+
+from website_db import app, db
+from railgun.website import api
+from railgun.website.models import Handin, User
+
+
+def call_secret_api(view, payload):
+    # Call the view decorated by `secret_api` with a decrypted `payload`.
+    view = view.__closure__[0].cell_contents
+    with app.test_request_context(method='POST'):
+        request.payload = payload
+        return view()
+
+
+class HandinBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.actions = dict(api.HANDIN_ACTIONS)
+        self.pump_regrade = api._pump_regrade
+        api._pump_regrade = lambda: None
+        user = User(name='alice', email='alice@example.com', password='x',
+                    is_admin=False)
+        db.session.add(user)
+        db.session.commit()
+        self.handids = []
+        for i in range(3):
+            handin = Handin(uuid=uuid.uuid4().get_hex(), hwid='hw',
+                            lang='python', user_id=user.id, state='Pending',
+                            score=0.0, scale=1.0)
+            db.session.add(handin)
+            self.handids.append(handin.uuid)
+        db.session.commit()
+
+    def tearDown(self):
+        api.HANDIN_ACTIONS.clear()
+        api.HANDIN_ACTIONS.update(self.actions)
+        api._pump_regrade = self.pump_regrade
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def batch(self, messages):
+        body, status, _ = call_secret_api(api.api_handin_batch,
+                                          {'messages': messages})
+        self.assertEqual(status, 200)
+        return json.loads(body)
+
+    def start(self, i, msgid=None):
+        ret = {'action': 'start', 'uuid': self.handids[i],
+               'payload': {'uuid': self.handids[i]}}
+        if msgid:
+            ret['msgid'] = msgid
+        return ret
+
+    def states(self):
+        db.session.expire_all()
+        return [Handin.query.filter(Handin.uuid == h).one().state
+                for h in self.handids]
+
+    def test_duplicated_messages(self):
+        message = self.start(0, msgid='m0')
+        self.assertEqual(self.batch([message, message]),
+                         ['OK', 'duplicated message'])
+        # the message is sent again if the response was lost
+        self.assertEqual(self.batch([message]), ['duplicated message'])
+        self.assertEqual(self.states(), ['Running', 'Pending', 'Pending'])
+
+    def test_failed_message_rolled_back(self):
+        def poison(handin, obj):
+            handin.state = 'Accepted'
+            raise RuntimeError('poison')
+        api.HANDIN_ACTIONS['report'] = poison
+        messages = [
+            self.start(0, msgid='m0'),
+            {'action': 'report', 'uuid': self.handids[1],
+             'payload': {'uuid': self.handids[1]}, 'msgid': 'm1'},
+            {'action': 'start', 'payload': {}},
+            self.start(2),
+        ]
+        self.assertEqual(self.batch(messages), [
+            'OK', 'apply message failed', 'invalid message', 'OK'])
+        self.assertEqual(self.states(), ['Running', 'Pending', 'Running'])
+        # the failed message is not recorded as applied
+        api.HANDIN_ACTIONS['report'] = self.actions['start']
+        self.assertEqual(self.batch(messages[1:2]), ['OK'])
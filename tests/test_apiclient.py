@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_apiclient.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.runner import apiclient
+from railgun.runner.apiclient import ApiClient
+from railgun.runner.outbox import Outbox
+
+MEMO = {'key': 'k', 'exitcode': 0, 'stdout': u'out', 'stderr': u'',
+        'stats': {}}
+
+
+class FakeSender(object):
+
+    def __init__(self):
+        self.wakes = 0
+
+    def wake(self):
+        self.wakes += 1
+
+
+class FakeResponse(object):
+
+    status_code = 200
+
+    def __init__(self, results):
+        self.results = results
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.results
+
+
+class ApiClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.get_comm_key = apiclient.get_comm_key
+        self.put_memo = apiclient.put_memo
+        apiclient.get_comm_key = lambda: 'x' * 32
+        self.memos = []
+        apiclient.put_memo = lambda memo, score: \
+            self.memos.append((memo, score))
+        self.client = ApiClient('http://localhost/api')
+        self.client.outbox = Outbox(os.path.join(self.tempdir, 'outbox.db'))
+        self.client.sender = FakeSender()
+
+    def tearDown(self):
+        apiclient.get_comm_key = self.get_comm_key
+        apiclient.put_memo = self.put_memo
+        shutil.rmtree(self.tempdir)
+
+    def claim(self):
+        return [c[2] for c in self.client.outbox.claim(10)]
+
+    def test_send_into_outbox(self):
+        self.client.start('a')
+        self.assertEqual(self.client.sender.wakes, 1)
+        messages = self.claim()
+        self.assertEqual([(m['action'], m['uuid'], m['payload'])
+                          for m in messages], [('start', 'a', {'uuid': 'a'})])
+
+    def test_batch_into_outbox(self):
+        with self.client.batch():
+            self.client.start('a')
+            self.client.start('a')
+            self.client._send('report', 'a', {'uuid': 'a'}, MEMO)
+            self.client._send('report', 'a', {'uuid': 'a', 'x': 1})
+            self.client.proclog('a', 1, u'', u'')
+            self.client.proclog('a', 0, u'out', u'')
+            # nothing is stored until the batch is flushed
+            self.assertEqual(self.client.outbox.count(), 0)
+        self.assertEqual(self.client.sender.wakes, 1)
+        messages = self.claim()
+        # the first report wins, while the last process log wins
+        self.assertEqual([m['action'] for m in messages],
+                         ['start', 'report', 'proclog'])
+        self.assertEqual(messages[1]['payload'], {'uuid': 'a'})
+        self.assertEqual(messages[1]['memo'], MEMO)
+        self.assertEqual(messages[2]['payload']['exitcode'], 0)
+
+    def test_post_batch_memo(self):
+        sent = []
+
+        def post(action, payload, stream=False):
+            sent.append(payload)
+            return FakeResponse(['OK', 'score already reported'])
+
+        self.client.post = post
+        messages = [
+            {'action': 'report', 'uuid': 'a', 'payload': {'uuid': 'a'},
+             'memo': MEMO},
+            {'action': 'report', 'uuid': 'b', 'payload': {'uuid': 'b'},
+             'memo': MEMO},
+        ]
+        self.client.post_batch(messages)
+        # the memos are kept by the runner, and only the accepted one is
+        # memoized
+        self.assertFalse(any('memo' in m for m in sent[0]['messages']))
+        self.assertEqual(self.memos, [(MEMO, {'uuid': 'a'})])
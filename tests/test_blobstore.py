@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_blobstore.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from railgun.common.blobstore import FileBlobStore, BlobNotFound
+
+
+class FileBlobStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = FileBlobStore(os.path.join(self.tempdir, 'blobs'),
+                                   compression='zlib')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_deduplicate(self):
+        data = 'hello, world!\n' * 10000
+        digest, size = self.store.put(StringIO(data))
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(size, len(data))
+        self.assertEqual(self.store.put(StringIO(data)), (digest, size))
+
+        fpath, compression = self.store.locate(digest)
+        self.assertEqual(compression, 'zlib')
+        self.assertLess(os.path.getsize(fpath), size)
+        self.assertEqual(os.listdir(os.path.dirname(fpath)),
+                         [os.path.basename(fpath)])
+
+    def test_read(self):
+        data = 'hello, world!\n' * 10000
+        digest, _ = self.store.put(StringIO(data))
+        with self.store.open(digest) as f:
+            self.assertEqual(f.read(5), 'hello')
+            self.assertEqual(f.read(), data[5:])
+
+        fpath = self.store.fetch(digest)
+        with open(fpath, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        # each fetch gets its own copy, which is not removed by the others
+        fpath2 = self.store.fetch(digest)
+        self.assertNotEqual(fpath, fpath2)
+        self.store.release(fpath2)
+        self.assertTrue(os.path.exists(fpath))
+        self.store.release(fpath)
+        self.assertFalse(os.path.exists(fpath))
+
+    def test_incompressible(self):
+        data = os.urandom(10000)
+        digest, _ = self.store.put(StringIO(data))
+        self.assertEqual(self.store.locate(digest)[1], None)
+        self.assertEqual(self.store.open(digest).read(), data)
+        # the stored file is used directly, and never removed by release
+        fpath = self.store.fetch(digest)
+        self.assertEqual(fpath, self.store.locate(digest)[0])
+        self.store.release(fpath)
+        self.assertTrue(os.path.exists(fpath))
+
+    def test_not_found(self):
+        with self.assertRaises(BlobNotFound):
+            self.store.open('0' * 64)
+        with self.assertRaises(ValueError):
+            self.store.open('../secret')
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_filerules.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import unittest
+
+from railgun.common.hw import FileRules
+
+
+class FileRulesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.code_rules = FileRules()
+        self.code_rules.append_action('accept', r'^(src/)?[^/]+\.py$')
+        self.code_rules.append_action('hide', r'^(tests?)/.*$')
+        self.hw_rules = FileRules()
+        self.hw_rules.append_action('deny', r'^.*\.exe$')
+        self.hw_rules.append_action('lock', r'^src/.*$')
+
+    def assertActions(self, rules):
+        for fname, action in (('a.py', FileRules.ACCEPT),
+                              ('src/a.py', FileRules.ACCEPT),
+                              ('src/a/b.py', FileRules.LOCK),
+                              ('test/a.exe', FileRules.HIDE),
+                              ('a.exe', FileRules.DENY),
+                              ('README', -1)):
+            # the second lookup is answered by the cache
+            for _ in xrange(2):
+                self.assertEqual(rules.get_action(fname, -1), action)
+
+    def test_concat(self):
+        rules = FileRules.concat(self.code_rules, self.hw_rules)
+        self.assertActions(rules)
+        self.assertTrue(rules._matcher)
+
+    def test_unsafe_pattern(self):
+        self.code_rules.prepend_action('lock', r'^(?P<x>[a-z])(?P=x)$')
+        rules = FileRules.concat(self.code_rules, self.hw_rules)
+        self.assertActions(rules)
+        self.assertEqual(rules.get_action('aa'), FileRules.LOCK)
+        self.assertIs(rules._matcher, False)
+
+    def test_cache_size(self):
+        rules = FileRules.concat(self.code_rules, self.hw_rules)
+        rules.CACHE_SIZE = 2
+        for fname in ('a.py', 'b.py', 'c.py'):
+            rules.get_action(fname)
+        self.assertEqual(list(rules._cache), ['b.py', 'c.py'])
+        # changing the rules drops the cached decisions
+        rules.prepend_action('deny', r'^c\.py$')
+        self.assertEqual(rules.get_action('c.py'), FileRules.DENY)
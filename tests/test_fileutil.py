@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_fileutil.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from railgun.common.fileutil import (Extractor, ZipExtractor, TarExtractor,
+                                     ArchiveLimitExceeded, FileManifest,
+                                     sniff_archive)
+from railgun.common.hw import FileRules
+
+FILES = [('top/a.py', 'print 1\n'), ('top/sub/b.txt', 'hello\n')]
+
+
+def make_zip(files=FILES):
+    buf = StringIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        for fname, data in files:
+            z.writestr(fname, data)
+    return buf.getvalue()
+
+
+def make_tar(mode):
+    buf = StringIO()
+    with tarfile.open(fileobj=buf, mode=mode) as t:
+        for fname, data in FILES:
+            info = tarfile.TarInfo(fname)
+            info.size = len(data)
+            t.addfile(info, StringIO(data))
+    return buf.getvalue()
+
+
+class ExtractorTestCase(unittest.TestCase):
+
+    def assertExtracts(self, data, filename, cls):
+        with Extractor.open(StringIO(data), filename) as ex:
+            self.assertIsInstance(ex, cls)
+            self.assertTrue(ex.onedir())
+            self.assertEqual(
+                sorted((fname, f.read()) for fname, f in ex.extract()),
+                FILES
+            )
+
+    def test_open_memory(self):
+        self.assertExtracts(make_zip(), 'a.zip', ZipExtractor)
+        self.assertExtracts(make_tar('w:gz'), 'a.tgz', TarExtractor)
+        # the format is sniffed from the content rather than the extension
+        self.assertExtracts(make_tar('w'), 'a.zip', TarExtractor)
+        self.assertExtracts(make_zip(), 'a.tar.bz2', ZipExtractor)
+
+    def test_sniff_archive(self):
+        self.assertEqual(sniff_archive(make_tar('w:bz2')), 'tar')
+        self.assertEqual(sniff_archive('Rar!\x1a\x07\x00'), 'rar')
+        self.assertIsNone(sniff_archive('hello'))
+        self.assertRaises(ValueError, Extractor.open, StringIO('hello'),
+                          'a.txt')
+
+    def assertLimit(self, limit, data, **kwargs):
+        with Extractor.open(StringIO(data), 'a.zip') as ex:
+            try:
+                ex.index().check(**kwargs)
+            except ArchiveLimitExceeded, e:
+                self.assertEqual(e.limit, limit)
+            else:
+                self.fail('%s limit not exceeded' % limit)
+
+    def test_index_limits(self):
+        data = make_zip()
+        with Extractor.open(StringIO(data), 'a.zip') as ex:
+            index = ex.index()
+            self.assertIs(ex.index(), index)
+            self.assertEqual(index.total_size, 14)
+            index.check(max_count=2, max_file_size=8, max_total_size=14,
+                        max_ratio=2)
+        self.assertLimit('count', data, max_count=1)
+        self.assertLimit('file_size', data, max_file_size=7)
+        self.assertLimit('total_size', data, max_total_size=13)
+        bomb = make_zip([('zero', '\0' * (2 << 20))])
+        self.assertLimit('ratio', bomb, max_ratio=100)
+
+
+class FileManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for fname, data in FILES + [('skip/c.txt', 'skip\n')]:
+            fpath = os.path.join(self.path, fname)
+            if not os.path.isdir(os.path.dirname(fpath)):
+                os.makedirs(os.path.dirname(fpath))
+            with open(fpath, 'wb') as f:
+                f.write(data)
+        rules = FileRules()
+        rules.append_action('accept', r'^.*\.py$')
+        self.manifest = FileManifest(self.path, rules, FileRules.LOCK,
+                                     prune=('skip',))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_entries(self):
+        self.assertEqual(
+            [(e.path, e.isdir, e.action) for e in self.manifest],
+            [('top/a.py', False, FileRules.ACCEPT),
+             ('top/sub/b.txt', False, FileRules.LOCK),
+             ('top/sub', True, FileRules.LOCK),
+             ('top', True, FileRules.LOCK)]
+        )
+        self.assertEqual(self.manifest.filter((FileRules.ACCEPT,)),
+                         ['top/a.py'])
+        a = self.manifest.files()[0]
+        self.assertEqual(a.size, 8)
+        self.assertEqual(a.digest, hashlib.sha256('print 1\n').hexdigest())
+
+    def test_validate(self):
+        self.manifest.RACY_SECONDS = -1
+        self.manifest.rebuild()
+        self.assertFalse(self.manifest.validate())
+        # a file replaced through rename changes the directory mtime
+        fpath = os.path.join(self.path, 'top/sub/b.txt')
+        with open(fpath + '.new', 'wb') as f:
+            f.write('world!!\n')
+        os.rename(fpath + '.new', fpath)
+        os.utime(os.path.dirname(fpath), (0, 1))
+        self.assertTrue(self.manifest.validate())
+        self.assertEqual(self.manifest.files()[1].size, 8)
+        self.assertFalse(self.manifest.validate())
+
+    def test_validate_files(self):
+        self.manifest.RACY_SECONDS = -1
+        self.manifest.check_files = True
+        self.manifest.rebuild()
+        self.assertFalse(self.manifest.validate())
+        # a file edited in place does not change the directory mtime
+        fpath = os.path.join(self.path, 'top/a.py')
+        dpath = os.path.dirname(fpath)
+        dstat = os.stat(dpath)
+        with open(fpath, 'wb') as f:
+            f.write('print 2\n')
+        os.utime(fpath, (0, 1))
+        os.utime(dpath, (dstat.st_atime, dstat.st_mtime))
+        self.assertTrue(self.manifest.validate())
+        self.assertEqual(self.manifest.files()[0].digest,
+                         hashlib.sha256('print 2\n').hexdigest())
+
+    def test_digest(self):
+        self.manifest.RACY_SECONDS = -1
+        self.manifest.check_files = True
+        digest = self.manifest.digest
+        # a touched file keeps the content digest
+        fpath = os.path.join(self.path, 'top/a.py')
+        os.utime(fpath, (0, 1))
+        self.assertTrue(self.manifest.validate())
+        self.assertEqual(self.manifest.digest, digest)
+        os.chmod(fpath, 0755)
+        self.assertTrue(self.manifest.validate())
+        self.assertNotEqual(self.manifest.digest, digest)
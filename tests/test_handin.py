@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_handin.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.common.hw import HwScore
+from railgun.runner import handin, resultcache
+from railgun.runner.handin import PythonHandin
+from railgun.runner.resultcache import ResultCache, put_memo
+
+# The uuid of `hw/reform_path`.
+HWID = 'b388ad5b25ee44bbac9be46c43851768'
+
+SCORE = {'accepted': True, 'result': 'ok', 'compile_error': None,
+         'partials': []}
+
+
+class MemoizeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tempdir, 'results'), 10)
+        self.patched = []
+        self.patch(handin, 'get_result_cache', lambda: self.cache)
+        self.patch(resultcache, 'get_result_cache', lambda: self.cache)
+        self.patch(handin, 'is_deterministic', lambda hwcode: True)
+        self.runs = 0
+
+    def tearDown(self):
+        for obj, name, value in reversed(self.patched):
+            setattr(obj, name, value)
+        shutil.rmtree(self.tempdir)
+
+    def patch(self, obj, name, value):
+        self.patched.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def execute(self, handid, exitcode=0):
+        handler = PythonHandin(handid, HWID, '', {'filename': 'a.zip'})
+
+        def run():
+            # the score is taken from the sandbox by `open_host`
+            self.runs += 1
+            handler.score = HwScore.from_plain(SCORE)
+            handler.stats = {'stdout_size': 3, 'timings': {'run': 1.0}}
+            return (exitcode, 'out', '')
+
+        return handler, handler.memoize(run, 'digest', '.zip')
+
+    def test_miss_then_hit(self):
+        first, ret = self.execute('a')
+        self.assertEqual(ret, (0, 'out', ''))
+        self.assertEqual(self.runs, 1)
+        # nothing is memoized until the website has accepted the score
+        self.assertEqual(self.cache.count(), 0)
+        self.assertEqual(first.memo['stats'], {'stdout_size': 3})
+        second, _ = self.execute('b')
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(second.memo['key'], first.memo['key'])
+
+        put_memo(first.memo, dict(SCORE, uuid='a'))
+        third, ret = self.execute('c')
+        self.assertEqual(ret, (0, 'out', ''))
+        self.assertEqual(self.runs, 2)
+        self.assertIsNone(third.memo)
+        self.assertTrue(third.score.accepted)
+        self.assertEqual(third.stats, {'stdout_size': 3})
+
+    def test_failed_run_not_memoized(self):
+        handler, _ = self.execute('a', exitcode=1)
+        self.assertIsNone(handler.memo)
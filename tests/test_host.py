@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_host.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.runner.host import pop_score
+
+
+class PopScoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tempdir, 'score.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, cnt):
+        with open(self.fpath, 'wb') as f:
+            f.write(cnt)
+
+    def test_pop_score(self):
+        self.assertIsNone(pop_score(self.fpath))
+        self.write('{"accepted": false, "result": "bad", '
+                   '"compile_error": null, "partials": []}')
+        score = pop_score(self.fpath)
+        self.assertFalse(score.accepted)
+        self.assertEqual(unicode(score.result), u'bad')
+        self.assertFalse(os.path.exists(self.fpath))
+
+    def test_broken_score(self):
+        self.write('{"accepted": tr')
+        self.assertIsNone(pop_score(self.fpath))
+        self.assertFalse(os.path.exists(self.fpath))
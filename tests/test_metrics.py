@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_metrics.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import time
+import shutil
+import subprocess
+import tempfile
+import unittest
+from contextlib import closing
+
+from railgun.runner.metrics import MetricsRegistry
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.registry = MetricsRegistry(self.tempdir)
+        self.counter = self.registry.counter(
+            'jobs_total', 'Jobs.', ('lang',))
+        self.histogram = self.registry.histogram(
+            'job_seconds', 'Job seconds.', buckets=(1, 5))
+        self.gauge = self.registry.gauge('jobs_running', 'Running jobs.')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_render(self):
+        self.counter.inc(lang='python')
+        self.histogram.observe(0.5)
+        self.histogram.observe(3)
+        self.gauge.inc()
+        self.registry.flush()
+        # increments of counters are added up over flushes
+        self.counter.inc(2, lang='python')
+        self.registry.flush()
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP jobs_total Jobs.',
+            '# TYPE jobs_total counter',
+            'jobs_total{lang="python"} 3',
+            '# HELP job_seconds Job seconds.',
+            '# TYPE job_seconds histogram',
+            'job_seconds_bucket{le="1"} 1',
+            'job_seconds_bucket{le="5"} 2',
+            'job_seconds_bucket{le="+Inf"} 2',
+            'job_seconds_sum 3.5',
+            'job_seconds_count 2',
+            '# HELP jobs_running Running jobs.',
+            '# TYPE jobs_running gauge',
+            'jobs_running 1',
+        ]) + '\n')
+
+    def test_labels_required(self):
+        self.assertRaises(ValueError, self.counter.inc)
+
+    def test_purge_dead_gauges(self):
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        self.gauge.set(1)
+        self.registry.flush()
+        with closing(self.registry._connect()) as conn:
+            conn.execute('UPDATE samples SET pid = ? WHERE pid <> 0',
+                         (proc.pid,))
+        # the gauges of exited processes are deleted by the next flush
+        self.counter.inc(lang='python')
+        self.registry.flush()
+        with closing(self.registry._connect()) as conn:
+            self.assertEqual(conn.execute(
+                'SELECT COUNT(*) FROM samples WHERE pid <> 0').fetchone()[0],
+                0)
+
+    def test_flush_on_timer(self):
+        registry = MetricsRegistry(self.tempdir, flush_interval=0.05)
+        gauge = registry.gauge('jobs_running', 'Running jobs.')
+        gauge.inc()
+        begin = time.time()
+        while 'jobs_running 1' not in registry.render():
+            self.assertLess(time.time() - begin, 5)
+            time.sleep(0.05)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_osutil.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import errno
+import unittest
+
+from railgun.common.osutil import (execute, capture, monotonic, BoundedBuffer,
+                                   ProcessTimeout, is_running)
+
+
+class ExecuteTestCase(unittest.TestCase):
+
+    def test_output(self):
+        ret = execute('echo hello; echo world >&2; exit 3', 5)
+        self.assertEqual(ret, (3, 'hello\n', 'world\n'))
+
+    def test_large_output(self):
+        ret = execute('head -c 1000000 /dev/zero', 5)
+        self.assertEqual(ret[0], 0)
+        self.assertEqual(len(ret[1]), 1000000)
+
+    def test_returns_on_exit(self):
+        begin = monotonic()
+        execute('true', 5)
+        self.assertLess(monotonic() - begin, 0.5)
+
+    def test_fractional_timeout(self):
+        begin = monotonic()
+        with self.assertRaises(ProcessTimeout):
+            execute('sleep 5', 0.2)
+        self.assertLess(monotonic() - begin, 1)
+
+
+class BoundedBufferTestCase(unittest.TestCase):
+
+    def test_not_truncated(self):
+        buf = BoundedBuffer(4, 4)
+        buf.write('abcd')
+        buf.write('efgh')
+        self.assertFalse(buf.truncated)
+        self.assertEqual(buf.getvalue(), 'abcdefgh')
+
+    def test_truncated(self):
+        buf = BoundedBuffer(4, 3)
+        for c in ('ab', 'cdef', 'ghijk', 'lm'):
+            buf.write(c)
+        self.assertTrue(buf.truncated)
+        self.assertEqual(buf.total, 13)
+        self.assertEqual(
+            buf.getvalue(), 'abcd' + BoundedBuffer.MARKER % {'omitted': 6} +
+            'klm')
+
+    def test_utf8_boundary(self):
+        buf = BoundedBuffer(4, 4)
+        buf.write(u'中文字符'.encode('utf-8'))
+        value = buf.getvalue().decode('utf-8')
+        self.assertTrue(value.startswith(u'中'))
+        self.assertTrue(value.endswith(u'符'))
+
+    def test_capture(self):
+        ret, out, err, usage = capture('head -c 100000 /dev/zero', 5, 10,
+                                       10)
+        self.assertEqual(ret, 0)
+        self.assertGreater(usage['wall_time'], 0)
+        self.assertIn('max_rss', usage)
+        self.assertEqual(out.total, 100000)
+        self.assertTrue(out.truncated)
+        self.assertEqual(err.total, 0)
+
+
+class IsRunningTestCase(unittest.TestCase):
+
+    def test_is_running(self):
+        self.assertTrue(is_running(os.getpid()))
+        self.assertFalse(is_running(9999999))
+
+    def test_other_user(self):
+        def kill(pid, sig):
+            raise OSError(errno.EPERM, 'Operation not permitted')
+        original, os.kill = os.kill, kill
+        try:
+            self.assertTrue(is_running(1))
+        finally:
+            os.kill = original
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_outbox.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.runner.outbox import Outbox
+
+
+class OutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.tempdir, 'outbox/outbox.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def put(self, action, handid):
+        self.outbox.put([{'action': action, 'uuid': handid,
+                          'payload': {'uuid': handid}}])
+
+    def test_claim_in_order(self):
+        self.put('start', 'a')
+        self.put('start', 'b')
+        self.put('proclog', 'a')
+        claimed = self.outbox.claim(10)
+        self.assertEqual([(c[2]['action'], c[2]['uuid']) for c in claimed],
+                         [('start', 'a'), ('start', 'b'), ('proclog', 'a')])
+        self.assertEqual(len(set(c[2]['msgid'] for c in claimed)), 3)
+        self.assertEqual(self.outbox.claim(10), [])
+
+        self.outbox.ack([c[0] for c in claimed])
+        self.assertEqual(self.outbox.count(), 0)
+
+    def test_submission_blocked_by_claimed(self):
+        self.put('start', 'a')
+        first = self.outbox.claim(10)
+        self.put('proclog', 'a')
+        self.put('start', 'b')
+        # `proclog` of "a" must wait until `start` of "a" has been sent
+        claimed = self.outbox.claim(10)
+        self.assertEqual([c[2]['uuid'] for c in claimed], ['b'])
+
+        self.outbox.retry([c[0] for c in first], 0)
+        claimed = self.outbox.claim(10)
+        self.assertEqual([(c[1], c[2]['action']) for c in claimed],
+                         [(1, 'start'), (0, 'proclog')])
+
+    def test_memo(self):
+        memo = {'key': 'k', 'exitcode': 0, 'stdout': u'out', 'stderr': u'',
+                'stats': {}}
+        self.outbox.put([{'action': 'report', 'uuid': 'a',
+                          'payload': {'uuid': 'a'}, 'memo': memo}])
+        self.put('proclog', 'a')
+        claimed = self.outbox.claim(10)
+        self.assertEqual(claimed[0][2]['memo'], memo)
+        self.assertNotIn('memo', claimed[1][2])
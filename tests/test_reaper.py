@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_reaper.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.runner.reaper import Reaper
+
+
+class ReaperTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.reaper = Reaper(self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_reap_once(self):
+        # this process, a process not running, and a running process
+        names = ['%d-a' % os.getpid(), '9999999-b', '1-c']
+        for name in names:
+            os.makedirs(os.path.join(self.tempdir, name, 'sub'))
+        self.assertEqual(self.reaper.reap_once(), 2)
+        self.assertEqual(os.listdir(self.tempdir), ['1-c'])
+
+    def test_take_stale(self):
+        workdir = tempfile.mkdtemp()
+        try:
+            names = ['%d-a' % os.getpid(), '9999999-b', '.scores']
+            for name in names:
+                os.makedirs(os.path.join(workdir, name))
+            for name in ['a.%d.json' % os.getpid(), 'b.9999999.json']:
+                open(os.path.join(workdir, '.scores', name), 'wb').close()
+            # the working directory of a dead process is moved into trash
+            self.assertEqual(self.reaper.take_stale(workdir), 1)
+            self.assertEqual(sorted(os.listdir(workdir)),
+                             ['.scores', '%d-a' % os.getpid()])
+            self.assertEqual(os.listdir(self.tempdir), ['%d-b' % os.getpid()])
+            self.assertEqual(os.listdir(os.path.join(workdir, '.scores')),
+                             ['a.%d.json' % os.getpid()])
+        finally:
+            shutil.rmtree(workdir)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_regrade.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import unittest
+import uuid
+
+from website_db import app, db
+from railgun.website import regrade
+from railgun.website.codelang import languages
+from railgun.website.hw import homeworks
+from railgun.website.models import Handin, User
+
+# The uuid of `hw/reform_path`.
+HWID = 'b388ad5b25ee44bbac9be46c43851768'
+
+
+class RegradeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.chunk_size = app.config['REGRADE_CHUNK_SIZE']
+        app.config['REGRADE_CHUNK_SIZE'] = 2
+        self.rerun = languages['python'].rerun
+        languages['python'].rerun = self.fake_rerun
+        self.user = User(name='alice', email='alice@example.com',
+                         password='x', is_admin=False)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        languages['python'].rerun = self.rerun
+        app.config['REGRADE_CHUNK_SIZE'] = self.chunk_size
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def fake_rerun(self, handid, hw, fullscale=False, priority='rerun'):
+        handin = Handin.query.filter(Handin.uuid == handid).one()
+        handin.state = 'Pending'
+        db.session.commit()
+        return True
+
+    def add_handin(self, state):
+        handin = Handin(uuid=uuid.uuid4().get_hex(), hwid=HWID,
+                        lang='python', user_id=self.user.id, state=state,
+                        score=0.0, scale=1.0)
+        db.session.add(handin)
+        db.session.commit()
+        return handin
+
+    def grade(self, job):
+        for handin in Handin.query.filter(Handin.regrade_id == job.id):
+            handin.state = 'Accepted'
+        db.session.commit()
+
+    def test_pump_chunks(self):
+        for state in ['Accepted', 'Rejected', 'Accepted', 'Accepted']:
+            self.add_handin(state)
+        job = regrade.create_job(homeworks.get_by_uuid(HWID), ['Accepted'])
+        self.assertEqual((job.total, job.queued), (3, 2))
+        # the next chunk waits for the current one
+        self.assertEqual(regrade.pump(job), 0)
+
+        self.grade(job)
+        self.assertEqual(regrade.pump(job), 1)
+        progress = regrade.get_progress(job)
+        self.assertEqual((progress['queued'], progress['graded']), (3, 2))
+
+        self.grade(job)
+        self.assertEqual(regrade.pump(job), 0)
+        self.assertEqual(job.state, 'Finished')
+        self.assertEqual(regrade.get_progress(job)['graded'], 3)
+
+    def test_excluded_not_counted(self):
+        excluded = self.add_handin('Rejected')
+        self.add_handin('Accepted')
+        job = regrade.create_job(homeworks.get_by_uuid(HWID), ['Accepted'])
+        # a submission the job has skipped is rerun by someone else
+        excluded.state = 'Pending'
+        db.session.commit()
+        self.assertEqual(regrade.count_inflight(job), 1)
+
+        self.grade(job)
+        self.assertEqual(regrade.get_progress(job)['graded'], 1)
+        regrade.pump(job)
+        self.assertEqual(job.state, 'Finished')
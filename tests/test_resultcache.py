@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_resultcache.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from railgun.runner.resultcache import ResultCache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tempdir, 'results'), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def put(self, key):
+        self.cache.put(key, {'accepted': True}, 0, 'out\xff', '',
+                       {'stdout_size': 4})
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.put('a')
+        self.assertEqual(self.cache.get('a'), {
+            'score': {'accepted': True}, 'exitcode': 0, 'stdout': 'out\xff',
+            'stderr': '', 'stats': {'stdout_size': 4}
+        })
+
+    def test_lru_eviction(self):
+        self.put('a')
+        self.put('b')
+        self.cache.get('a')
+        self.put('c')
+        self.assertEqual(self.cache.count(), 2)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
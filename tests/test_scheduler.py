@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_scheduler.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import uuid
+import unittest
+
+import redis
+
+from railgun.runner import runconfig
+from railgun.runner.scheduler import FairScheduler
+
+
+def connect_redis():
+    client = redis.StrictRedis.from_url(runconfig.RUNNER_SCHEDULER_REDIS)
+    try:
+        client.ping()
+    except redis.ConnectionError:
+        return None
+    return client
+
+
+_redis = connect_redis()
+
+
+@unittest.skipIf(_redis is None, 'Redis server is not available.')
+class FairSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        prefix = 'railgun:test:%s:' % uuid.uuid4().get_hex()
+        self.scheduler = FairScheduler(_redis, prefix)
+
+    def tearDown(self):
+        self.scheduler.clear()
+
+    def push(self, priority, user, name):
+        self.scheduler.push(priority, user, name, [])
+
+    def pop_all(self):
+        ret = []
+        job = self.scheduler.pop()
+        while job is not None:
+            ret.append(job['task'])
+            job = self.scheduler.pop()
+        return ret
+
+    def test_priority_and_round_robin(self):
+        for i in range(3):
+            self.push('regrade', 1, 'g%d' % i)
+        for i in range(3):
+            self.push('rerun', 2, 'a%d' % i)
+        self.push('rerun', 3, 'b0')
+        self.push('interactive', 4, 'c0')
+        self.assertEqual(self.scheduler.depth(),
+                         {'interactive': 1, 'rerun': 4, 'regrade': 3})
+        self.assertEqual(self.pop_all(),
+                         ['c0', 'a0', 'b0', 'a1', 'a2', 'g0', 'g1', 'g2'])
+        self.assertEqual(self.scheduler.depth(),
+                         {'interactive': 0, 'rerun': 0, 'regrade': 0})
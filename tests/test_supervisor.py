@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_supervisor.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import unittest
+
+from railgun.runner import runconfig, supervisor
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = (supervisor.count_offline_users,
+                       supervisor.count_online_users,
+                       runconfig.RUNNER_MAX_CONCURRENCY,
+                       runconfig.RUNNER_MIN_CONCURRENCY)
+        runconfig.RUNNER_MAX_CONCURRENCY = 8
+        runconfig.RUNNER_MIN_CONCURRENCY = 1
+
+    def tearDown(self):
+        (supervisor.count_offline_users,
+         supervisor.count_online_users,
+         runconfig.RUNNER_MAX_CONCURRENCY,
+         runconfig.RUNNER_MIN_CONCURRENCY) = self._saved
+
+    def test_plan_concurrency(self):
+        supervisor.count_offline_users = lambda: 6
+        supervisor.count_online_users = lambda: None
+        self.assertEqual(
+            supervisor.plan_concurrency(['default', 'online', 'bulk']),
+            {'default': (1, 3), 'bulk': (1, 3), 'online': (1, 8)}
+        )
+        supervisor.count_offline_users = lambda: 0
+        self.assertEqual(supervisor.plan_concurrency(['default']),
+                         {'default': (1, 1)})
+
+    def test_restart_crashed_worker(self):
+        supervisor.count_offline_users = lambda: None
+        sup = supervisor.Supervisor(['default'], dict(os.environ), '/tmp')
+        w = sup.workers[0]
+        w.args = ['sh', '-c', 'exit 3']
+        sup._start(w)
+        w.proc.wait()
+        sup._check(w)
+        self.assertIsNone(w.proc)
+        self.assertEqual(w.backoff, 2)
+        self.assertGreater(w.next_start, w.start_time)
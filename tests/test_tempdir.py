@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_tempdir.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import stat
+import shutil
+import zipfile
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from railgun.common.fileutil import Extractor, ArchiveLimitExceeded
+from railgun.common.tempdir import TempDir
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.srcdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.srcdir, 'a/b'))
+        with open(os.path.join(self.srcdir, 'a/b/c.txt'), 'wb') as f:
+            f.write('hello')
+        self.tempdir = TempDir()
+        self.tempdir.open(mode=0777)
+
+    def tearDown(self):
+        self.tempdir.close()
+        shutil.rmtree(self.srcdir)
+
+    def assertMode(self, subpath, mode):
+        st = os.lstat(self.tempdir.fullpath(subpath))
+        self.assertEqual(stat.S_IMODE(st.st_mode), mode)
+        self.assertEqual((st.st_uid, st.st_gid), self.tempdir.owner)
+
+    def test_create_with_owner(self):
+        self.tempdir.set_owner(os.getuid(), os.getgid())
+        self.tempdir.copyfiles(self.srcdir, ['a/b/c.txt'], mode=0750)
+        self.assertMode('a', 0750)
+        self.assertMode('a/b', 0750)
+        self.assertMode('a/b/c.txt', 0750)
+
+        # existing files are replaced instead of written into
+        fpath = self.tempdir.fullpath('a/b/c.txt')
+        os.link(fpath, self.tempdir.fullpath('linked.txt'))
+        with self.tempdir.create(fpath, 0700) as f:
+            f.write('world')
+        self.assertMode('a/b/c.txt', 0700)
+        with open(self.tempdir.fullpath('linked.txt'), 'rb') as f:
+            self.assertEqual(f.read(), 'hello')
+
+    def test_extract_limits(self):
+        buf = StringIO()
+        with zipfile.ZipFile(buf, 'w') as z:
+            z.writestr('a.txt', 'a' * 100)
+            z.writestr('b.txt', 'b' * 100)
+
+        def extract(**kwargs):
+            with Extractor.open(StringIO(buf.getvalue()), 'a.zip') as ex:
+                return self.tempdir.extract(ex, **kwargs)
+
+        self.tempdir.CHUNK_SIZE = 16
+        self.assertEqual(extract(max_file_size=100, max_total_size=200), 200)
+        with open(self.tempdir.fullpath('b.txt'), 'rb') as f:
+            self.assertEqual(f.read(), 'b' * 100)
+        for kwargs, limit in (({'max_file_size': 99}, 'file_size'),
+                              ({'max_total_size': 199}, 'total_size')):
+            try:
+                extract(**kwargs)
+            except ArchiveLimitExceeded, e:
+                self.assertEqual(e.limit, limit)
+            else:
+                self.fail('%s limit not exceeded' % limit)
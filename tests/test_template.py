@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_template.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from railgun.common.fileutil import FileManifest
+from railgun.common.tempdir import TempDir
+from railgun.runner import runconfig
+from railgun.runner.template import CodeTemplate
+
+
+class FakeHwCode(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+class CodeTemplateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.temporary_dir = runconfig.TEMPORARY_DIR
+        runconfig.TEMPORARY_DIR = os.path.join(self.root, 'tmp')
+        self.srcdir = os.path.join(self.root, 'code')
+        os.makedirs(os.path.join(self.srcdir, 'data'))
+        self.write('data/input.txt', 'hello')
+        self.write('run.sh', '#!/bin/sh')
+        os.chmod(os.path.join(self.srcdir, 'run.sh'), 0755)
+        self.hwcode = FakeHwCode(self.srcdir)
+        self.tempdir = TempDir()
+        self.tempdir.open()
+
+    def tearDown(self):
+        self.tempdir.close()
+        runconfig.TEMPORARY_DIR = self.temporary_dir
+        # the template files are read-only
+        for parent, dirs, files in os.walk(self.root):
+            os.chmod(parent, 0700)
+        shutil.rmtree(self.root)
+
+    def write(self, path, cnt):
+        with open(os.path.join(self.srcdir, path), 'wb') as f:
+            f.write(cnt)
+
+    def template(self):
+        manifest = FileManifest(self.srcdir, check_files=True)
+        return CodeTemplate(self.hwcode, manifest)
+
+    def mode(self, fpath):
+        return stat.S_IMODE(os.stat(fpath).st_mode)
+
+    def test_build(self):
+        template = self.template()
+        self.assertFalse(template.exists())
+        template.build()
+        self.assertTrue(template.exists())
+        self.assertEqual(
+            self.mode(os.path.join(template.path, 'data/input.txt')), 0444)
+        self.assertEqual(
+            self.mode(os.path.join(template.path, 'run.sh')), 0555)
+        # no temporary tree is left behind
+        self.assertEqual(os.listdir(os.path.dirname(template.path)),
+                         [template.digest])
+        # building again does nothing
+        template.build()
+
+        # a modified code package gets another template tree
+        self.write('data/input.txt', 'world')
+        template2 = self.template()
+        self.assertNotEqual(template2.digest, template.digest)
+        self.assertFalse(template2.exists())
+
+    def test_materialize(self):
+        template = self.template()
+        template.build()
+        linked = template.materialize(
+            self.tempdir, lambda f: f == 'run.sh', hardlink=True)
+        input_path = self.tempdir.fullpath('data/input.txt')
+        run_path = self.tempdir.fullpath('run.sh')
+        self.assertEqual(linked, set([input_path]))
+        self.assertTrue(os.path.samefile(
+            input_path, os.path.join(template.path, 'data/input.txt')))
+        # the files which may be overwritten are private copies
+        self.assertFalse(os.path.samefile(
+            run_path, os.path.join(template.path, 'run.sh')))
+        self.assertEqual(self.mode(run_path), 0700)
+        with open(run_path, 'rb') as f:
+            self.assertEqual(f.read(), '#!/bin/sh')
+
+    def test_materialize_without_hardlink(self):
+        template = self.template()
+        template.build()
+        linked = template.materialize(
+            self.tempdir, lambda f: False, hardlink=False, mode=0750)
+        self.assertEqual(linked, set())
+        input_path = self.tempdir.fullpath('data/input.txt')
+        self.assertEqual(self.mode(input_path), 0750)
+        with open(input_path, 'rb') as f:
+            self.assertEqual(f.read(), 'hello')
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/test_zygote.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from railgun.common.osutil import ProcessTimeout
+from railgun.runner import runconfig
+from railgun.runner.zygote import ZygoteProcess, ZygotePool
+
+# The tests run the zygote server by this interpreter instead of the
+# compiled `SafeRunner`, whose `reload_context` drops the privileges.
+SAFE_RUNNER_MODULE = 'def reload_context():\n    pass\n'
+
+
+class FakeHwCode(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeZygote(object):
+
+    def __init__(self):
+        self.hwcode = FakeHwCode('/hw')
+        self.started = self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.stopped = True
+
+    def is_alive(self):
+        return self.started and not self.stopped
+
+
+class ZygoteProcessTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.temporary_dir = runconfig.TEMPORARY_DIR
+        runconfig.TEMPORARY_DIR = os.path.join(self.root, 'tmp')
+
+        libdir = os.path.join(self.root, 'lib')
+        os.makedirs(libdir)
+        with open(os.path.join(libdir, 'SafeRunner.py'), 'wb') as f:
+            f.write(SAFE_RUNNER_MODULE)
+        safe_runner = os.path.join(self.root, 'SafeRunner')
+        with open(safe_runner, 'wb') as f:
+            f.write('#!/bin/sh\nexec "%s" "$@"\n' % sys.executable)
+        os.chmod(safe_runner, 0700)
+
+        self.workdir = os.path.join(self.root, 'work')
+        os.makedirs(self.workdir)
+        environ = {'PYTHONPATH': os.pathsep.join([
+            libdir, os.path.join(runconfig.RUNLIB_DIR, 'python'),
+            runconfig.RAILGUN_ROOT])}
+        self.zygote = ZygoteProcess(
+            safe_runner, FakeHwCode(self.workdir), environ)
+        self.zygote.start()
+
+    def tearDown(self):
+        self.zygote.stop()
+        runconfig.TEMPORARY_DIR = self.temporary_dir
+        shutil.rmtree(self.root)
+
+    def execute(self, source, timeout=10):
+        entry = os.path.join(self.workdir, 'entry.py')
+        with open(entry, 'wb') as f:
+            f.write(source)
+        return self.zygote.execute(self.workdir, {'RAILGUN': '1'},
+                                   os.getuid(), os.getgid(), entry, timeout)
+
+    def test_execute(self):
+        self.assertTrue(self.zygote.is_alive())
+        exitcode, stdout, stderr, usage = self.execute(
+            'import os, sys\n'
+            'print os.getcwd(), os.environ["RAILGUN"], __name__\n'
+            'sys.stderr.write("oops")\n'
+            'sys.exit(3)\n'
+        )
+        self.assertEqual(exitcode, 3)
+        self.assertEqual(stdout.getvalue(),
+                         '%s 1 __main__\n' % self.workdir)
+        self.assertEqual(stderr.getvalue(), 'oops')
+        self.assertIn('cpu_user', usage)
+
+        # the zygote serves the next submission as well
+        exitcode, stdout, _, _ = self.execute('print "again"\n')
+        self.assertEqual((exitcode, stdout.getvalue()), (0, 'again\n'))
+
+    def test_timeout(self):
+        with self.assertRaises(ProcessTimeout):
+            self.execute('while True:\n    pass\n', timeout=0.5)
+
+
+class ZygotePoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ZygotePool()
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_get(self):
+        first = self.pool.get('hw', 'v1', FakeZygote)
+        self.assertTrue(first.started)
+        self.assertIs(self.pool.get('hw', 'v1', FakeZygote), first)
+
+        # the zygote is retired when the code package changes
+        second = self.pool.get('hw', 'v2', FakeZygote)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.stopped)
+
+        # and restarted if it has exited
+        second.stopped = True
+        self.assertIsNot(self.pool.get('hw', 'v2', FakeZygote), second)
+
+        self.pool.shutdown()
+        self.assertFalse(any(z.is_alive() for z in (first, second)))
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# @file: tests/website_db.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# This file is released under BSD 2-clause license.
+
+"""The website tests run on a private in-memory database.  Importing the
+website sets up the configured database, so this module switches the
+engine and prepares it the same way.  The website tests should import
+`app` and `db` from this module first."""
+
+from railgun.website.context import app, db
+from railgun.website.models import enable_sqlite_savepoints
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+with app.app_context():
+    enable_sqlite_savepoints(db.engine)
+
+__all__ = ['app', 'db']